@@ -9,6 +9,8 @@ const PastItineraries = () => {
   const [loading, setLoading] = useState(true);
   const [error, setError] = useState(null);
   const [mapsLoaded, setMapsLoaded] = useState(false); // Custom state to track script availability
+  const [nextCursor, setNextCursor] = useState(null);
+  const [loadingMore, setLoadingMore] = useState(false);
   const navigate = useNavigate();
 
   const mapContainerStyle = { width: '100%', height: '200px' };
@@ -36,31 +38,42 @@ const PastItineraries = () => {
     checkMapsLoaded();
   }, []);
 
+  // The listing is cursor-paginated and omits itinerary_data unless requested; one page per call
+  const fetchPage = async (cursor) => {
+    const response = await api.get('/api/itinerary/user-itineraries/', {
+      params: { fields: 'id,user,preference,itinerary_data,created_at', cursor: cursor || undefined },
+    });
+    const fetched = response.data.results;
+    console.log("Fetched itineraries:", JSON.stringify(fetched, null, 2));
+    setNextCursor(response.data.next_cursor);
+    if (!mapsLoaded) {
+      return fetched; // Fallback without maps
+    }
+    return Promise.all(
+      fetched.map(async (itinerary) => {
+        const locations = await loadMapLocations(itinerary);
+        const mapCenter = await getMapCenter(itinerary, locations);
+        return { ...itinerary, locations, mapCenter };
+      })
+    );
+  };
+
+  const handleFetchError = (err) => {
+    console.error("Error fetching itineraries:", err);
+    if (err.response?.status === 401) {
+      setError("Please log in to view your past itineraries.");
+      navigate('/login');
+    } else {
+      setError(err.response?.data?.detail || err.message || "Failed to fetch itineraries.");
+    }
+  };
+
   useEffect(() => {
     const fetchItineraries = async () => {
       try {
-        const response = await api.get('/api/itinerary/user-itineraries/');
-        console.log("Fetched itineraries:", JSON.stringify(response.data, null, 2));
-        if (mapsLoaded) {
-          const itinerariesWithLocations = await Promise.all(
-            response.data.map(async (itinerary) => {
-              const locations = await loadMapLocations(itinerary);
-              const mapCenter = await getMapCenter(itinerary, locations);
-              return { ...itinerary, locations, mapCenter };
-            })
-          );
-          setItineraries(itinerariesWithLocations);
-        } else {
-          setItineraries(response.data); // Fallback without maps
-        }
+        setItineraries(await fetchPage(null));
       } catch (err) {
-        console.error("Error fetching itineraries:", err);
-        if (err.response?.status === 401) {
-          setError("Please log in to view your past itineraries.");
-          navigate('/login');
-        } else {
-          setError(err.response?.data?.detail || err.message || "Failed to fetch itineraries.");
-        }
+        handleFetchError(err);
       } finally {
         setLoading(false);
       }
@@ -68,6 +81,19 @@ const PastItineraries = () => {
 
     fetchItineraries();
   }, [mapsLoaded]); // Depend on mapsLoaded instead of isLoaded
+
+  const loadMore = async () => {
+    setLoadingMore(true);
+    try {
+      const page = await fetchPage(nextCursor);
+      setItineraries((current) => [...current, ...page]);
+    } catch (err) {
+      handleFetchError(err);
+    } finally {
+      setLoadingMore(false);
+    }
+  };
+
   const getMapCenter = async (itinerary, locations) => {
     const destination = itinerary.itinerary_data.tripName?.match(/to\s(.+?)(\s|$)/)?.[1] || "Unknown";
     const hotelCoords = itinerary.hotels?.[0];
@@ -247,6 +273,13 @@ const PastItineraries = () => {
           ))}
         </div>
       )}
+      {nextCursor && (
+        <div className="past-itineraries-button-container">
+          <button className="past-itineraries-button" onClick={loadMore} disabled={loadingMore}>
+            {loadingMore ? "Loading..." : "Load More"}
+          </button>
+        </div>
+      )}
       <div className="past-itineraries-button-container">
         <button className="past-itineraries-button" onClick={() => navigate('/chatbot')}>
           Create New Itinerary
@@ -1,15 +1,17 @@
 import json
-import google.generativeai as genai
-from django.conf import settings
+import logging
 from .prompt_service import create_prompt_from_preferences
+from travelplan.services.clients import get_gemini_model
+from travelplan.services.json_repair import extract_json_text
+
+logger = logging.getLogger(__name__)
 
 class GeminiService:
     """Service for interacting with the Gemini API"""
     
     def __init__(self):
         """Initialize the Gemini API client"""
-        genai.configure(api_key=settings.GEMINI_API_KEY)
-        self.model = genai.GenerativeModel('gemini-2.0-flash')
+        self.model = get_gemini_model()
     
     def generate_itinerary(self, user_preferences):
         # Create a prompt for Gemini
@@ -31,23 +33,10 @@ class GeminiService:
             return itinerary_data
             
         except Exception as e:
-            print(f"Error generating itinerary: {str(e)}")
+            logger.error(f"Error generating itinerary: {str(e)}")
             raise Exception(f"Failed to generate itinerary: {str(e)}")
     
     def _extract_json_from_response(self, response_text):
-        # Check if response is wrapped in markdown code block
-        if "```json" in response_text and "```" in response_text:
-            # Extract content between ```json and ``` markers
-            start_index = response_text.find("```json") + 7
-            end_index = response_text.rfind("```")
-            json_str = response_text[start_index:end_index].strip()
-        # Check if response is wrapped in just code block
-        elif "```" in response_text:
-            start_index = response_text.find("```") + 3
-            end_index = response_text.rfind("```")
-            json_str = response_text[start_index:end_index].strip()
-        else:
-            # Assume the entire response is JSON
-            json_str = response_text.strip()
-        
-        return json_str
\ No newline at end of file
+        # Scan for the first balanced JSON object (skipping markdown fences and
+        # prose) and repair trailing commas, comments, smart quotes or truncation
+        return extract_json_text(response_text)
@@ -14,3 +14,7 @@ from django.core.asgi import get_asgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'travel_planner.settings')
 
 application = get_asgi_application()
+
+from travelplan.services.clients import warm_up_on_boot  # noqa: E402  (needs the app registry)
+
+warm_up_on_boot()
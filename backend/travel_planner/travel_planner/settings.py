@@ -12,6 +12,7 @@ https://docs.djangoproject.com/en/5.0/ref/settings/
 
 from pathlib import Path
 from dotenv import load_dotenv
+import json
 import os
 load_dotenv()
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -46,7 +47,119 @@ INSTALLED_APPS = [
 
 GEMINI_API_KEY = os.getenv('GEMINI_API_KEY', '')
 GOOGLE_MAPS_API_KEY = os.getenv('GOOGLE_MAPS_API_KEY', '')
+
+# 'single_call' asks Gemini for structured JSON directly (falling back to
+# 'two_stage' on failure); 'two_stage' generates free text and then structures it.
+# The pinned google-generativeai has no JSON response mode, so single_call would rely
+# on the prompt and local JSON repair alone; switch once the SDK is upgraded
+GEMINI_GENERATION_STRATEGY = os.getenv('GEMINI_GENERATION_STRATEGY', 'two_stage')
+
+# Generated itinerary cache keyed by preference fingerprint
+GENERATION_CACHE_ENABLED = os.getenv('GENERATION_CACHE_ENABLED', 'true').lower() == 'true'
+GENERATION_CACHE_TTL = int(os.getenv('GENERATION_CACHE_TTL', 60 * 60 * 6))
+GENERATION_CACHE_MAX_ENTRIES = int(os.getenv('GENERATION_CACHE_MAX_ENTRIES', 1000))
+# Coalesce concurrent identical generations: leader lease, follower wait and poll interval, and how long
+# the leader's result stays on its lock for followers, in seconds
+GENERATION_SINGLE_FLIGHT_ENABLED = os.getenv('GENERATION_SINGLE_FLIGHT_ENABLED', 'true').lower() == 'true'
+GENERATION_LOCK_TTL = int(os.getenv('GENERATION_LOCK_TTL', 180))
+GENERATION_SINGLE_FLIGHT_WAIT = float(os.getenv('GENERATION_SINGLE_FLIGHT_WAIT', 120))
+GENERATION_SINGLE_FLIGHT_POLL = float(os.getenv('GENERATION_SINGLE_FLIGHT_POLL', 0.5))
+GENERATION_SINGLE_FLIGHT_RESULT_TTL = float(os.getenv('GENERATION_SINGLE_FLIGHT_RESULT_TTL', 10))
+
+# Geocode cache: positive/negative TTLs in seconds and in-process LRU size
+GEOCODE_CACHE_TTL = int(os.getenv('GEOCODE_CACHE_TTL', 60 * 60 * 24 * 30))
+GEOCODE_CACHE_NEGATIVE_TTL = int(os.getenv('GEOCODE_CACHE_NEGATIVE_TTL', 60 * 60))
+GEOCODE_CACHE_LOCAL_SIZE = int(os.getenv('GEOCODE_CACHE_LOCAL_SIZE', 512))
+
+# Resolved place cache: freshness in seconds and row cap before LRU eviction. Places that
+# could not be resolved are only trusted for PLACE_CACHE_NEGATIVE_MAX_AGE, like negative geocodes
+PLACE_CACHE_MAX_AGE = int(os.getenv('PLACE_CACHE_MAX_AGE', 60 * 60 * 24 * 30))
+PLACE_CACHE_NEGATIVE_MAX_AGE = int(os.getenv('PLACE_CACHE_NEGATIVE_MAX_AGE', GEOCODE_CACHE_NEGATIVE_TTL))
+PLACE_CACHE_MAX_ROWS = int(os.getenv('PLACE_CACHE_MAX_ROWS', 50000))
+# Age in seconds after which an itinerary's stored locations are re-resolved on read
+ITINERARY_LOCATION_MAX_AGE = int(os.getenv('ITINERARY_LOCATION_MAX_AGE', 60 * 60 * 24 * 90))
+# Maximum concurrent Maps lookups per request
+PLACE_RESOLUTION_CONCURRENCY = int(os.getenv('PLACE_RESOLUTION_CONCURRENCY', 8))
+# Process-wide threads for Maps lookups issued from async views
+MAPS_EXECUTOR_WORKERS = int(os.getenv('MAPS_EXECUTOR_WORKERS', 32))
+# Gemini resilience: per-attempt deadline (s), retries with jittered exponential backoff,
+# optional hedged duplicate after the given latency percentile, and circuit breaker
+GEMINI_ATTEMPT_TIMEOUT = float(os.getenv('GEMINI_ATTEMPT_TIMEOUT', 60))
+GEMINI_MAX_RETRIES = int(os.getenv('GEMINI_MAX_RETRIES', 2))
+GEMINI_RETRY_BASE_DELAY = float(os.getenv('GEMINI_RETRY_BASE_DELAY', 0.5))
+GEMINI_RETRY_MAX_DELAY = float(os.getenv('GEMINI_RETRY_MAX_DELAY', 8))
+GEMINI_HEDGE_ENABLED = os.getenv('GEMINI_HEDGE_ENABLED', 'false').lower() == 'true'
+GEMINI_HEDGE_PERCENTILE = float(os.getenv('GEMINI_HEDGE_PERCENTILE', 95))
+GEMINI_HEDGE_MIN_SAMPLES = int(os.getenv('GEMINI_HEDGE_MIN_SAMPLES', 20))
+GEMINI_BREAKER_FAILURE_THRESHOLD = int(os.getenv('GEMINI_BREAKER_FAILURE_THRESHOLD', 5))
+GEMINI_BREAKER_RESET_TIMEOUT = float(os.getenv('GEMINI_BREAKER_RESET_TIMEOUT', 30))
+GEMINI_EXECUTOR_WORKERS = int(os.getenv('GEMINI_EXECUTOR_WORKERS', 16))
+
+# Per-stage Server-Timing header on every response; METRICS_TOKEN lets a scraper read
+# the Prometheus metrics endpoint with "Authorization: Bearer <token>" instead of an admin login
+SERVER_TIMING_ENABLED = os.getenv('SERVER_TIMING_ENABLED', 'true').lower() == 'true'
+METRICS_TOKEN = os.getenv('METRICS_TOKEN', '')
+
+# Client-side token buckets (requests/second and burst) shared by all processes.
+# RATE_LIMIT_OVERRIDES is JSON keyed by provider:endpoint, e.g. {"maps:find_place": [5, 10]}
+RATE_LIMIT_ENABLED = os.getenv('RATE_LIMIT_ENABLED', 'true').lower() == 'true'
+GEMINI_RATE_LIMIT = float(os.getenv('GEMINI_RATE_LIMIT', 2))
+GEMINI_RATE_BURST = float(os.getenv('GEMINI_RATE_BURST', 5))
+MAPS_RATE_LIMIT = float(os.getenv('MAPS_RATE_LIMIT', 50))
+MAPS_RATE_BURST = float(os.getenv('MAPS_RATE_BURST', 50))
+RATE_LIMIT_OVERRIDES = json.loads(os.getenv('RATE_LIMIT_OVERRIDES', '{}'))
+# Largest fraction of an endpoint's rate one user may consume, and how long a call may wait for a token
+RATE_LIMIT_USER_SHARE = float(os.getenv('RATE_LIMIT_USER_SHARE', 0.5))
+RATE_LIMIT_MAX_WAIT = float(os.getenv('RATE_LIMIT_MAX_WAIT', 30))
+# A process takes up to this many seconds' worth of an endpoint's tokens per database write and hands
+# them out locally until they are that old (0 takes one token per write)
+RATE_LIMIT_PREFETCH_SECONDS = float(os.getenv('RATE_LIMIT_PREFETCH_SECONDS', 0.1))
+# Shared Maps HTTP session: keep-alive pool size and per-request timeout in seconds
+MAPS_HTTP_POOL_SIZE = int(os.getenv('MAPS_HTTP_POOL_SIZE', MAPS_EXECUTOR_WORKERS))
+MAPS_HTTP_TIMEOUT = float(os.getenv('MAPS_HTTP_TIMEOUT', 10))
+# Build the Gemini/Maps clients and open their connections when a server or worker boots
+CLIENT_WARMUP_ON_BOOT = os.getenv('CLIENT_WARMUP_ON_BOOT', 'false').lower() == 'true'
+
+# Record/replay of Gemini and Maps traffic (see travelplan.services.cassette). CASSETTE_MODE is
+# off, record or replay; replays wait the recorded latency times CASSETTE_TIME_SCALE (0 = instant)
+CASSETTE_MODE = os.getenv('CASSETTE_MODE', 'off').lower()
+CASSETTE_DIR = os.getenv('CASSETTE_DIR', str(BASE_DIR / 'cassettes'))
+CASSETTE_TIME_SCALE = float(os.getenv('CASSETTE_TIME_SCALE', 1.0))
+
+# Batch variant generation: variants per request and how many are generated at once
+ITINERARY_MAX_VARIANTS = int(os.getenv('ITINERARY_MAX_VARIANTS', 5))
+ITINERARY_VARIANT_CONCURRENCY = int(os.getenv('ITINERARY_VARIANT_CONCURRENCY', 3))
+
+# Storage of Itinerary.itinerary_data (see travelplan.services.compression): codec is zlib or zstd (zstd
+# needs the zstandard package and falls back to zlib without it). New rows use the newest dictionary from
+# manage.py train_compression_dictionary unless ITINERARY_DATA_DICTIONARY is false
+ITINERARY_DATA_CODEC = os.getenv('ITINERARY_DATA_CODEC', 'zlib').lower()
+ITINERARY_DATA_COMPRESSION_LEVEL = int(os.getenv('ITINERARY_DATA_COMPRESSION_LEVEL', 6))
+ITINERARY_DATA_DICTIONARY = os.getenv('ITINERARY_DATA_DICTIONARY', 'true').lower() == 'true'
+
+# Itinerary listing page size (page_size= is clamped to the maximum)
+ITINERARY_PAGE_SIZE = int(os.getenv('ITINERARY_PAGE_SIZE', 20))
+ITINERARY_MAX_PAGE_SIZE = int(os.getenv('ITINERARY_MAX_PAGE_SIZE', 100))
+
+# Background itinerary jobs: worker lease length, how often a running job renews it, retry limit and
+# idle poll interval
+ITINERARY_JOB_LEASE_SECONDS = int(os.getenv('ITINERARY_JOB_LEASE_SECONDS', 120))
+ITINERARY_JOB_HEARTBEAT_SECONDS = float(os.getenv('ITINERARY_JOB_HEARTBEAT_SECONDS', ITINERARY_JOB_LEASE_SECONDS / 4))
+ITINERARY_JOB_MAX_ATTEMPTS = int(os.getenv('ITINERARY_JOB_MAX_ATTEMPTS', 3))
+ITINERARY_WORKER_POLL_INTERVAL = float(os.getenv('ITINERARY_WORKER_POLL_INTERVAL', 1.0))
+
+# SQLite production profile (see travelplan.services.database), applied to every new connection: WAL
+# journal, synchronous=NORMAL, busy timeout (ms), memory-mapped I/O (bytes) and page cache (KiB)
+SQLITE_PRODUCTION = os.getenv('SQLITE_PRODUCTION', 'false').lower() == 'true'
+SQLITE_BUSY_TIMEOUT_MS = int(os.getenv('SQLITE_BUSY_TIMEOUT_MS', 5000))
+SQLITE_MMAP_SIZE = int(os.getenv('SQLITE_MMAP_SIZE', 256 * 1024 * 1024))
+SQLITE_CACHE_SIZE_KB = int(os.getenv('SQLITE_CACHE_SIZE_KB', 64 * 1024))
+# Short write transactions failing with "database is locked": attempts, first backoff and backoff cap (s)
+DB_LOCK_RETRY_ATTEMPTS = int(os.getenv('DB_LOCK_RETRY_ATTEMPTS', 5))
+DB_LOCK_RETRY_BACKOFF = float(os.getenv('DB_LOCK_RETRY_BACKOFF', 0.05))
+DB_LOCK_RETRY_MAX_BACKOFF = float(os.getenv('DB_LOCK_RETRY_MAX_BACKOFF', 1.0))
 MIDDLEWARE = [
+    'travelplan.middleware.ServerTimingMiddleware',  # Outermost, so its total covers the whole stack
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'corsheaders.middleware.CorsMiddleware',  # Enable CORS
@@ -153,20 +266,41 @@ SIMPLE_JWT = {
 }
 
 
+# Logging: JSON lines written by a background thread (see travelplan.log). LOG_LEVELS tunes
+# individual loggers, e.g. "travelplan.services.gemini_service=DEBUG,django.db.backends=WARNING".
+# Prompts and model output are logged as length/hash/preview; full bodies only on errors
+# or for LOG_PAYLOAD_SAMPLE_RATE of calls.
+LOG_LEVEL = os.getenv('LOG_LEVEL', 'INFO').upper()
+LOG_QUEUE_SIZE = int(os.getenv('LOG_QUEUE_SIZE', 10000))
+LOG_PAYLOAD_PREVIEW_CHARS = int(os.getenv('LOG_PAYLOAD_PREVIEW_CHARS', 200))
+LOG_PAYLOAD_SAMPLE_RATE = float(os.getenv('LOG_PAYLOAD_SAMPLE_RATE', 0.01))
+
 LOGGING = {
     'version': 1,
     'disable_existing_loggers': False,
+    'formatters': {
+        'json': {
+            '()': 'travelplan.log.JSONFormatter',
+        },
+    },
     'handlers': {
         'console': {
-            'level': 'DEBUG',
-            'class': 'logging.StreamHandler',
+            'class': 'travelplan.log.AsyncQueueHandler',
+            'formatter': 'json',
+            'queue_size': LOG_QUEUE_SIZE,
         },
     },
+    'root': {
+        'handlers': ['console'],
+        'level': LOG_LEVEL,
+    },
     'loggers': {
-        '': {
-            'handlers': ['console'],
-            'level': 'DEBUG',
-            'propagate': True,
-        },
+        name.strip(): {'level': level.strip().upper()}
+        for name, _, level in (
+            item.partition('=') for item in os.getenv('LOG_LEVELS', '').split(',') if '=' in item
+        )
     },
-}
\ No newline at end of file
+}
+
+# Route Django's own records through the JSON queue handler instead of its default console
+LOGGING['loggers'].setdefault('django', {}).update({'handlers': [], 'propagate': True})
\ No newline at end of file
@@ -1,6 +1,11 @@
 from django.apps import AppConfig
+from django.db.backends.signals import connection_created
 
 
 class TravelplanConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'travelplan'
+
+    def ready(self):
+        from .services.database import configure_connection
+        connection_created.connect(configure_connection, dispatch_uid='travelplan_configure_connection')
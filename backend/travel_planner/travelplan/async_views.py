@@ -0,0 +1,120 @@
+import json
+
+from asgiref.sync import sync_to_async
+from django.http import JsonResponse
+from django.utils.decorators import method_decorator
+from django.views import View
+from django.views.decorators.csrf import csrf_exempt
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework_simplejwt.authentication import JWTAuthentication
+
+from .serializers import UserPreferenceSerializer, ItinerarySerializer
+from .pagination import InvalidPageRequest, paginate_itineraries, parse_fields, parse_page_size
+from .services.itinerary_service import (
+    preference_to_prompt_dict, enforce_start_point, generate_itinerary_data_async,
+    generation_response_data, detail_response_data, user_itineraries, create_itinerary,
+)
+from .services.database import retry_on_lock
+from .services.location_service import load_itinerary_locations_async, resolve_and_save_locations_async
+from .services.rate_limit import rate_limit_user
+
+
+async def authenticate(request):
+    """Authenticate with the same JWT scheme as the DRF views; returns a user or None."""
+    try:
+        result = await sync_to_async(JWTAuthentication().authenticate)(request)
+    except AuthenticationFailed:
+        return None
+    return result[0] if result else None
+
+
+@method_decorator(csrf_exempt, name='dispatch')
+class AsyncAuthenticatedView(View):
+    """Base for async-native views served through the ASGI application.
+
+    Under ASGI, Django cancels the handler task when the client disconnects,
+    which propagates into the in-flight Gemini calls and pending Maps lookups.
+    """
+
+    async def dispatch(self, request, *args, **kwargs):
+        user = await authenticate(request)
+        if user is None:
+            return JsonResponse({'detail': 'Authentication credentials were not provided.'}, status=401)
+        request.user = user
+        return await super().dispatch(request, *args, **kwargs)
+
+
+class AsyncGenerateItineraryView(AsyncAuthenticatedView):
+    """Async counterpart of GenerateItineraryView"""
+
+    async def post(self, request):
+        try:
+            payload = json.loads(request.body or b'{}')
+        except ValueError:
+            return JsonResponse({'error': 'Invalid JSON body'}, status=400)
+
+        serializer = UserPreferenceSerializer(data=payload)
+        if not await sync_to_async(serializer.is_valid)():
+            return JsonResponse(serializer.errors, status=400)
+        preference = await sync_to_async(retry_on_lock(serializer.save))(user=request.user)
+
+        try:
+            with rate_limit_user(request.user.id):
+                preference_dict = preference_to_prompt_dict(preference)
+                use_cache = request.GET.get('cache', 'true').lower() != 'false'
+                itinerary_data, meta = await generate_itinerary_data_async(preference, preference_dict, use_cache)
+                enforce_start_point(itinerary_data, preference_dict['startPoint'])
+
+                itinerary = await sync_to_async(create_itinerary)(preference, itinerary_data)
+                hotel_locations, restaurant_locations = await resolve_and_save_locations_async(itinerary)
+                response_data = generation_response_data(
+                    itinerary, preference_dict['startPoint'], hotel_locations, restaurant_locations
+                )
+                response_data['meta'] = meta
+                return JsonResponse(response_data, status=201)
+        except Exception as e:
+            return JsonResponse({'error': str(e)}, status=500)
+
+
+class AsyncUserItinerariesView(AsyncAuthenticatedView):
+    """Async counterpart of UserItinerariesView"""
+
+    async def get(self, request):
+        itinerary_id = request.GET.get('id', None)
+        latest = request.GET.get('latest', 'false').lower() == 'true'
+        detail = request.GET.get('detail', 'false').lower() == 'true'
+
+        itineraries = user_itineraries(request.user.id)
+
+        if itinerary_id:
+            try:
+                itinerary = await itineraries.filter(id=itinerary_id).afirst()
+            except ValueError:
+                itinerary = None
+            if itinerary is None:
+                message = 'Itinerary not found' if await itineraries.aexists() else 'No itineraries found'
+                return JsonResponse({'error': message}, status=404)
+            if detail:
+                hotel_locations, restaurant_locations = await load_itinerary_locations_async(itinerary)
+                return JsonResponse(detail_response_data(itinerary, hotel_locations, restaurant_locations))
+            return JsonResponse(await sync_to_async(lambda: ItinerarySerializer(itinerary).data)())
+        elif latest and detail:
+            itinerary = await itineraries.afirst()
+            if itinerary is None:
+                return JsonResponse({'error': 'No itineraries found'}, status=404)
+            hotel_locations, restaurant_locations = await load_itinerary_locations_async(itinerary)
+            return JsonResponse(detail_response_data(itinerary, hotel_locations, restaurant_locations))
+        else:
+            cursor = request.GET.get('cursor')
+            try:
+                page = await sync_to_async(paginate_itineraries)(
+                    itineraries,
+                    cursor=cursor,
+                    page_size=parse_page_size(request.GET.get('page_size')),
+                    fields=parse_fields(request.GET.get('fields')),
+                )
+            except InvalidPageRequest as e:
+                return JsonResponse({'error': str(e)}, status=400)
+            if not page['results'] and not cursor:
+                return JsonResponse({'error': 'No itineraries found'}, status=404)
+            return JsonResponse(page)
@@ -0,0 +1,98 @@
+import json
+
+from django import forms
+from django.db import models
+from django.db.models.query_utils import DeferredAttribute
+
+from .services import compression
+
+
+class EncodedJSON:
+    """A compressed column value that has not been decoded yet"""
+    __slots__ = ('data',)
+
+    def __init__(self, data):
+        self.data = data
+
+    def decode(self):
+        return compression.decode(self.data)
+
+    def __repr__(self):
+        return f"<EncodedJSON: {len(self.data)} bytes>"
+
+
+def decoded(value):
+    """Decode a value read through .values()/.values_list(), which bypass the lazy descriptor"""
+    return value.decode() if isinstance(value, EncodedJSON) else value
+
+
+class CompressedJSONDescriptor(DeferredAttribute):
+    """Decodes the loaded bytes on first attribute access and keeps the result on the instance"""
+
+    def __get__(self, instance, cls=None):
+        if instance is None:
+            return self
+        value = super().__get__(instance, cls)
+        if isinstance(value, EncodedJSON):
+            value = instance.__dict__[self.field.attname] = value.decode()
+        return value
+
+    def __set__(self, instance, value):
+        # A data descriptor, so __get__ still runs once the raw value sits in the instance dict
+        instance.__dict__[self.field.attname] = value
+
+
+class CompressedJSONField(models.Field):
+    """JSON stored as a compressed blob (see travelplan.services.compression).
+
+    Rows are read as raw bytes and only decompressed when the attribute is
+    first accessed, so loading an instance without touching the field costs
+    no decoding; an instance saved without touching it writes its bytes back
+    unchanged.
+    """
+    description = 'Compressed JSON'
+    descriptor_class = CompressedJSONDescriptor
+    empty_strings_allowed = False
+
+    def get_internal_type(self):
+        return 'BinaryField'
+
+    def from_db_value(self, value, expression, connection):
+        if value is None:
+            return None
+        return EncodedJSON(bytes(value))
+
+    def to_python(self, value):
+        if isinstance(value, EncodedJSON):
+            return value.decode()
+        if isinstance(value, (bytes, memoryview)):
+            return compression.decode(value)
+        if isinstance(value, str):
+            # Serialized fixtures carry the JSON text produced by value_to_string()
+            return json.loads(value)
+        return value
+
+    def pre_save(self, model_instance, add):
+        # Skips the descriptor, which would decode a value only to encode it again
+        if self.attname in model_instance.__dict__:
+            return model_instance.__dict__[self.attname]
+        return super().pre_save(model_instance, add)
+
+    def get_prep_value(self, value):
+        if value is None:
+            return None
+        if isinstance(value, EncodedJSON):
+            return value.data
+        return compression.encode(value)
+
+    def get_db_prep_value(self, value, connection, prepared=False):
+        value = super().get_db_prep_value(value, connection, prepared)
+        if value is not None:
+            return connection.Database.Binary(value)
+        return value
+
+    def value_to_string(self, obj):
+        return json.dumps(self.value_from_object(obj))
+
+    def formfield(self, **kwargs):
+        return super().formfield(**{'form_class': forms.JSONField, **kwargs})
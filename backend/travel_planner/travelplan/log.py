@@ -0,0 +1,102 @@
+import copy
+import hashlib
+import json
+import logging
+import queue
+import random
+import sys
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener
+
+from .services import metrics
+
+# Attributes every LogRecord has; anything else was passed through ``extra``
+_RECORD_ATTRS = set(vars(logging.LogRecord('', 0, '', 0, '', (), None))) | {'message', 'asctime', 'taskName'}
+
+
+class JSONFormatter(logging.Formatter):
+    """One JSON object per line, with ``extra`` fields as top-level keys."""
+
+    def format(self, record):
+        data = {
+            'ts': datetime.fromtimestamp(record.created, timezone.utc).isoformat(),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+        }
+        for key, value in vars(record).items():
+            if key not in _RECORD_ATTRS and not key.startswith('_'):
+                data[key] = value
+        if record.exc_info:
+            data['exception'] = self.formatException(record.exc_info)
+        return json.dumps(data, default=str, ensure_ascii=False)
+
+
+class AsyncQueueHandler(QueueHandler):
+    """Hand records to a background thread that formats and writes them.
+
+    The calling thread only enqueues; when the bounded queue is full the
+    record is dropped (and counted) rather than blocking the request.
+    """
+
+    def __init__(self, queue_size=10000, stream=None):
+        super().__init__(queue.Queue(maxsize=queue_size))
+        self.target = logging.StreamHandler(stream or sys.stderr)
+        self.dropped = 0
+        self.listener = QueueListener(self.queue, self.target, respect_handler_level=False)
+        self.listener.start()
+        self._stopped = False
+
+    def setFormatter(self, fmt):
+        # Formatting happens on the listener thread, not the request thread
+        self.target.setFormatter(fmt)
+
+    def prepare(self, record):
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+            metrics.increment('log_records_dropped_total')
+
+    def close(self):
+        # Called by logging.shutdown() at exit: drain the queue before the process ends
+        if not self._stopped:
+            self._stopped = True
+            self.listener.stop()
+        super().close()
+
+
+def _settings():
+    from django.conf import settings
+    return settings
+
+
+def should_sample():
+    """Whether this request keeps full payloads (LOG_PAYLOAD_SAMPLE_RATE of the time)."""
+    return random.random() < _settings().LOG_PAYLOAD_SAMPLE_RATE
+
+
+def payload_fields(name, value, full=False):
+    """Log fields describing a large payload: its length, hash and a truncated preview.
+
+    The whole body is included only when ``full`` is set (e.g. on errors) or
+    for a sampled fraction of calls.
+    """
+    text = value if isinstance(value, str) else json.dumps(value, default=str, ensure_ascii=False)
+    preview_chars = _settings().LOG_PAYLOAD_PREVIEW_CHARS
+    fields = {
+        f'{name}_length': len(text),
+        f'{name}_sha256': hashlib.sha256(text.encode()).hexdigest()[:16],
+    }
+    if full or should_sample():
+        fields[name] = text
+    else:
+        fields[f'{name}_preview'] = text[:preview_chars] + ('…' if len(text) > preview_chars else '')
+    return fields
+
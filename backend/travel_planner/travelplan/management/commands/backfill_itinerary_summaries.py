@@ -0,0 +1,35 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from travelplan.models import Itinerary
+from travelplan.services.summary_service import save_summaries
+
+
+class Command(BaseCommand):
+    help = 'Create ItinerarySummary rows for itineraries saved before summaries existed.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500, help='Itineraries written per transaction')
+        parser.add_argument('--rebuild', action='store_true',
+                            help='Recompute every summary, not just the missing ones')
+
+    def handle(self, *args, **options):
+        itineraries = Itinerary.objects.select_related('preference').order_by('id')
+        if not options['rebuild']:
+            itineraries = itineraries.filter(summary__isnull=True)
+
+        batch_size = options['batch_size']
+        written = 0
+        last_id = 0
+        while True:
+            # Keyset batches: rows summarized by a previous batch drop out of the filter
+            batch = list(itineraries.filter(id__gt=last_id)[:batch_size])
+            if not batch:
+                break
+            with transaction.atomic():
+                save_summaries([(itinerary, itinerary.preference) for itinerary in batch])
+            written += len(batch)
+            last_id = batch[-1].id
+            self.stdout.write(f"Summarized {written} itineraries")
+
+        self.stdout.write(self.style.SUCCESS(f"Done: {written} summaries written"))
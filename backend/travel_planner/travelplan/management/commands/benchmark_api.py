@@ -0,0 +1,318 @@
+import json
+import math
+import statistics
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import ExitStack, contextmanager
+from datetime import date, timedelta
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, connections
+from django.db.backends.signals import connection_created
+from django.test import Client, override_settings
+from django.test.utils import setup_test_environment, teardown_test_environment
+from django.urls import reverse
+from rest_framework_simplejwt.tokens import AccessToken
+
+from travelplan.models import Itinerary
+from travelplan.services import metrics
+from travelplan.services.cassette import MODE_RECORD, MODE_REPLAY
+from travelplan.services.clients import get_gemini_model, get_maps_client, override_clients, reset_clients
+from travelplan.services.geocode_cache import clear_local_cache
+from travelplan.services.resilience import reset_callers
+from travelplan.services.stand_ins import LatencyProfile, StandInGeminiModel, StandInMapsClient
+
+ENDPOINTS = ['generate', 'list', 'latest', 'detail']
+
+# Trips cycled through by the generate phase
+TRIPS = [
+    ('Palakkad, Kerala', 'Ooty'),
+    ('Kochi, Kerala', 'Munnar'),
+    ('Bengaluru, Karnataka', 'Coorg'),
+    ('Chennai, Tamil Nadu', 'Pondicherry'),
+    ('Mumbai, Maharashtra', 'Lonavala'),
+]
+
+# Result fields compared against the baseline: (field, True when higher is worse)
+TIMING_FIELDS = [('latency_p50_ms', True), ('latency_p95_ms', True), ('latency_p99_ms', True),
+                 ('throughput_rps', False)]
+COUNT_FIELDS = ['queries_per_request', 'gemini_calls_per_request', 'maps_calls_per_request']
+
+
+def percentile(values, percent):
+    """Nearest-rank percentile of a non-empty list."""
+    ordered = sorted(values)
+    return ordered[max(0, math.ceil(percent / 100 * len(ordered)) - 1)]
+
+
+@contextmanager
+def throwaway_database(sqlite_path, stderr):
+    """Create a fresh test database (at ``sqlite_path`` for SQLite, so threads share it) and drop it afterwards."""
+    setup_test_environment()
+    if connection.vendor == 'sqlite':
+        connection.settings_dict['TEST']['NAME'] = sqlite_path
+    old_name = connection.settings_dict['NAME']
+    connection.creation.create_test_db(verbosity=0, autoclobber=True, keepdb=False)
+    stderr.write(f"Benchmarking against {connection.settings_dict['NAME']}")
+    try:
+        yield
+    finally:
+        connections.close_all()
+        connection.creation.destroy_test_db(old_name, verbosity=0)
+        teardown_test_environment()
+
+
+class QueryCounter:
+    """Counts SQL statements on every connection, including the executor threads' ones."""
+
+    def __init__(self):
+        self.count = 0
+        self._lock = threading.Lock()
+
+    def __call__(self, execute, sql, params, many, context):
+        with self._lock:
+            self.count += 1
+        return execute(sql, params, many, context)
+
+    def install(self, sender=None, connection=None, **kwargs):
+        if self not in connection.execute_wrappers:
+            connection.execute_wrappers.append(self)
+
+    def take(self):
+        with self._lock:
+            count, self.count = self.count, 0
+            return count
+
+
+class Command(BaseCommand):
+    help = ('Load-test the itinerary API offline: drives the endpoints at fixed concurrency against '
+            'Gemini/Maps stand-ins (or a recorded cassette) in a throwaway database and compares the results '
+            'with a baseline.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=40, help='Requests per endpoint')
+        parser.add_argument('--concurrency', type=int, default=8, help='Requests in flight at once')
+        parser.add_argument('--users', type=int, default=4, help='Users the requests are spread over')
+        parser.add_argument('--endpoint', action='append', choices=ENDPOINTS,
+                            help='Endpoint to benchmark (repeatable; defaults to all)')
+        parser.add_argument('--distinct-trips', type=int, default=0,
+                            help='Distinct trips generated (0: every request is a new trip, i.e. a cache miss)')
+        parser.add_argument('--gemini-latency', type=float, default=0.5, help='Stand-in Gemini latency (s)')
+        parser.add_argument('--gemini-jitter', type=float, default=0.1, help='Stand-in Gemini jitter (s)')
+        parser.add_argument('--gemini-error-rate', type=float, default=0.0, help='Stand-in Gemini error rate')
+        parser.add_argument('--maps-latency', type=float, default=0.05, help='Stand-in Maps latency (s)')
+        parser.add_argument('--maps-jitter', type=float, default=0.01, help='Stand-in Maps jitter (s)')
+        parser.add_argument('--maps-error-rate', type=float, default=0.0, help='Stand-in Maps error rate')
+        parser.add_argument('--seed', type=int, default=0, help='Seed for the stand-ins\' latency and errors')
+        parser.add_argument('--cassette', help='Cassette directory to replay (or record) instead of the stand-ins')
+        parser.add_argument('--cassette-mode', choices=[MODE_REPLAY, MODE_RECORD], default=MODE_REPLAY,
+                            help='Replay the cassette offline, or record live Gemini/Maps traffic into it')
+        parser.add_argument('--time-scale', type=float, default=1.0,
+                            help='Replay recorded latencies multiplied by this factor (0: instant)')
+        parser.add_argument('--rate-limit', action='store_true',
+                            help='Keep the configured upstream rate limits (disabled by default)')
+        parser.add_argument('--baseline', help='JSON file from --save-baseline to compare against')
+        parser.add_argument('--save-baseline', help='Write the results to this JSON file')
+        parser.add_argument('--tolerance', type=float, default=0.2,
+                            help='Allowed relative slowdown in latency/throughput before it counts as a regression')
+        parser.add_argument('--count-tolerance', type=float, default=0.05,
+                            help='Allowed relative increase in query and upstream call counts')
+        parser.add_argument('--json', action='store_true', help='Print the results as JSON')
+
+    def handle(self, *args, **options):
+        endpoints = options['endpoint'] or ENDPOINTS
+        config = {key: options[key] for key in (
+            'requests', 'concurrency', 'users', 'distinct_trips', 'gemini_latency', 'gemini_jitter',
+            'gemini_error_rate', 'maps_latency', 'maps_jitter', 'maps_error_rate', 'seed', 'rate_limit',
+            'cassette', 'cassette_mode', 'time_scale',
+        )}
+
+        with ExitStack() as stack:
+            tmp = stack.enter_context(tempfile.TemporaryDirectory())
+            stack.enter_context(throwaway_database(f"{tmp}/benchmark.sqlite3", self.stderr))
+            stack.enter_context(override_settings(**({} if options['rate_limit'] else {'RATE_LIMIT_ENABLED': False})))
+            gemini, maps = self._transports(options, stack)
+            reset_callers()
+            clear_local_cache()
+            metrics.reset()
+            counter = QueryCounter()
+            connection_created.connect(counter.install)
+            for conn in connections.all():
+                if conn.connection is not None:
+                    counter.install(connection=conn)
+            try:
+                results = self._run(endpoints, options, gemini, maps, counter)
+            finally:
+                connection_created.disconnect(counter.install)
+                reset_callers()
+                clear_local_cache()
+
+        if options['save_baseline']:
+            with open(options['save_baseline'], 'w') as f:
+                json.dump({'config': config, 'results': results}, f, indent=2)
+
+        regressions = []
+        if options['baseline']:
+            with open(options['baseline']) as f:
+                baseline = json.load(f)
+            if baseline.get('config') != config:
+                self.stderr.write('Warning: the baseline was recorded with different options; '
+                                  'the comparison may not be meaningful.')
+            regressions = self._compare(results, baseline['results'], options['tolerance'], options['count_tolerance'])
+
+        if options['json']:
+            self.stdout.write(json.dumps({'config': config, 'results': results, 'regressions': regressions}, indent=2))
+        else:
+            self._print_table(results)
+            for regression in regressions:
+                self.stdout.write(self.style.ERROR(f"REGRESSION {regression}"))
+        if regressions:
+            raise CommandError(f"{len(regressions)} regression(s) against {options['baseline']}")
+
+    def _transports(self, options, stack):
+        """Install the Gemini/Maps transports for the run: cassette replay/record, or stand-ins."""
+        if options['cassette']:
+            stack.enter_context(override_settings(
+                CASSETTE_MODE=options['cassette_mode'],
+                CASSETTE_DIR=options['cassette'],
+                CASSETTE_TIME_SCALE=options['time_scale'],
+            ))
+            # Rebuild the clients now and after the run so they pick up the cassette settings
+            reset_clients()
+            stack.callback(reset_clients)
+            return get_gemini_model(), get_maps_client()
+        gemini = StandInGeminiModel(LatencyProfile(
+            options['gemini_latency'], options['gemini_jitter'], options['gemini_error_rate'], seed=options['seed'],
+        ))
+        maps = StandInMapsClient(LatencyProfile(
+            options['maps_latency'], options['maps_jitter'], options['maps_error_rate'], seed=options['seed'] + 1,
+        ))
+        stack.enter_context(override_clients(gemini_model=gemini, maps_client=maps))
+        return gemini, maps
+
+    def _run(self, endpoints, options, gemini, maps, counter):
+        users = [User.objects.create_user(f'benchmark-{i}', password='benchmark') for i in range(options['users'])]
+        tokens = {user.id: str(AccessToken.for_user(user)) for user in users}
+        total = options['requests']
+
+        def generate(i):
+            user = users[i % len(users)]
+            trip = i % options['distinct_trips'] if options['distinct_trips'] else i
+            start_point, destination = TRIPS[trip % len(TRIPS)]
+            body = {
+                'departure': start_point,
+                'destination': destination,
+                'budget': '6000 Rupees',
+                'start_date': str(date(2026, 1, 1) + timedelta(days=trip)),
+                'end_date': str(date(2026, 1, 2) + timedelta(days=trip)),
+                'travel_style': 'Solo',
+                'activities': ['sightseeing'],
+                'transportation': 'public transport',
+            }
+            return user, 'post', reverse('generate_itinerary'), body, 201
+
+        itinerary_ids = {}
+
+        def read(params):
+            def request(i):
+                user = users[i % len(users)]
+                query = dict(params)
+                if 'id' in query:
+                    ids = itinerary_ids[user.id]
+                    query['id'] = ids[i % len(ids)]
+                return user, 'get', reverse('user_itineraries'), query, 200
+            return request
+
+        phases = {
+            'generate': generate,
+            'list': read({}),
+            'latest': read({'latest': 'true', 'detail': 'true'}),
+            'detail': read({'id': None, 'detail': 'true'}),
+        }
+
+        results = {}
+        # The read endpoints need itineraries, so generation always runs first
+        generate_result = self._phase(generate, total, options['concurrency'], tokens, gemini, maps, counter)
+        if 'generate' in endpoints:
+            results['generate'] = generate_result
+        for user in users:
+            itinerary_ids[user.id] = list(Itinerary.objects.filter(user=user).values_list('id', flat=True))
+        if not all(itinerary_ids.values()):
+            raise CommandError('Generation failed for every request of some user; nothing to read back')
+        for endpoint in endpoints:
+            if endpoint != 'generate':
+                results[endpoint] = self._phase(
+                    phases[endpoint], total, options['concurrency'], tokens, gemini, maps, counter,
+                )
+        return results
+
+    def _phase(self, make_request, total, concurrency, tokens, gemini, maps, counter):
+        gemini.reset_counts()
+        maps.reset_counts()
+        counter.take()
+
+        def send(i):
+            user, method, url, data, expected = make_request(i)
+            client = Client(HTTP_AUTHORIZATION=f'Bearer {tokens[user.id]}')
+            started = time.perf_counter()
+            if method == 'post':
+                response = client.post(url, data, content_type='application/json')
+            else:
+                response = client.get(url, data)
+            elapsed = time.perf_counter() - started
+            connections.close_all()
+            return elapsed, response.status_code == expected
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            outcomes = list(executor.map(send, range(total)))
+        wall = time.perf_counter() - started
+
+        latencies = [elapsed * 1000 for elapsed, _ in outcomes]
+        gemini_calls = gemini.call_counts()
+        maps_calls = maps.call_counts()
+        maps_errors = maps_calls.pop('errors', 0)
+        return {
+            'requests': total,
+            'errors': sum(1 for _, ok in outcomes if not ok),
+            'throughput_rps': total / wall,
+            'latency_mean_ms': statistics.mean(latencies),
+            'latency_p50_ms': percentile(latencies, 50),
+            'latency_p95_ms': percentile(latencies, 95),
+            'latency_p99_ms': percentile(latencies, 99),
+            'latency_max_ms': max(latencies),
+            'queries_per_request': counter.take() / total,
+            'gemini_calls_per_request': gemini_calls.get('generate_content', 0) / total,
+            'maps_calls_per_request': sum(maps_calls.values()) / total,
+            'upstream_errors': gemini_calls.get('errors', 0) + maps_errors,
+        }
+
+    def _compare(self, results, baseline, tolerance, count_tolerance):
+        regressions = []
+        for endpoint, current in results.items():
+            previous = baseline.get(endpoint)
+            if previous is None:
+                continue
+            for field, higher_is_worse in TIMING_FIELDS:
+                limit = previous[field] * (1 + tolerance if higher_is_worse else 1 - tolerance)
+                if (current[field] > limit) if higher_is_worse else (current[field] < limit):
+                    regressions.append(f"{endpoint} {field}: {current[field]:.2f} vs baseline {previous[field]:.2f}")
+            for field in COUNT_FIELDS:
+                if current[field] > previous[field] * (1 + count_tolerance) + 1e-9:
+                    regressions.append(f"{endpoint} {field}: {current[field]:.2f} vs baseline {previous[field]:.2f}")
+            if current['errors'] > previous['errors']:
+                regressions.append(f"{endpoint} errors: {current['errors']} vs baseline {previous['errors']}")
+        return regressions
+
+    def _print_table(self, results):
+        self.stdout.write(f"{'endpoint':<10} {'reqs':>5} {'err':>4} {'rps':>7} {'p50 ms':>8} {'p95 ms':>8} "
+                          f"{'p99 ms':>8} {'queries':>7} {'gemini':>6} {'maps':>6}")
+        for endpoint, r in results.items():
+            self.stdout.write(
+                f"{endpoint:<10} {r['requests']:>5} {r['errors']:>4} {r['throughput_rps']:>7.1f} "
+                f"{r['latency_p50_ms']:>8.1f} {r['latency_p95_ms']:>8.1f} {r['latency_p99_ms']:>8.1f} "
+                f"{r['queries_per_request']:>7.1f} {r['gemini_calls_per_request']:>6.2f} {r['maps_calls_per_request']:>6.2f}"
+            )
@@ -0,0 +1,142 @@
+import json
+import random
+import statistics
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, connections
+from django.test import override_settings
+
+from travelplan.models import UserPreference
+from travelplan.services import metrics
+from travelplan.services.database import retry_on_lock
+from travelplan.services.itinerary_service import create_itinerary, user_itineraries
+from travelplan.services.stand_ins import stand_in_itinerary
+
+from .benchmark_api import TRIPS, percentile, throwaway_database
+
+PROFILES = {'default': False, 'production': True}
+# Share of reads in each phase
+PHASES = {'read': 1.0, 'write': 0.0, 'mixed': 0.8}
+
+
+class Command(BaseCommand):
+    help = ('Measure database read/write throughput as the number of concurrent workers grows, with the '
+            'default SQLite settings and the production profile (SQLITE_PRODUCTION), in a throwaway database. '
+            'Workers are threads that open a connection per operation, like a threaded server.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', default='1,2,4,8', help='Comma-separated worker counts')
+        parser.add_argument('--operations', type=int, default=200, help='Operations per phase and worker count')
+        parser.add_argument('--profile', action='append', choices=list(PROFILES),
+                            help='Profile to run (repeatable; defaults to both)')
+        parser.add_argument('--phase', action='append', choices=list(PHASES),
+                            help='Phase to run (repeatable; defaults to all)')
+        parser.add_argument('--users', type=int, default=20, help='Users the operations are spread over')
+        parser.add_argument('--seed-itineraries', type=int, default=5, help='Itineraries per user before the run')
+        parser.add_argument('--json', action='store_true', help='Print the results as JSON')
+
+    def handle(self, *args, **options):
+        if connection.vendor != 'sqlite':
+            raise CommandError('The database benchmark compares SQLite profiles; the database is not SQLite')
+        try:
+            workers = [int(count) for count in options['workers'].split(',')]
+        except ValueError:
+            raise CommandError('--workers takes comma-separated integers')
+
+        results = {}
+        for profile in options['profile'] or list(PROFILES):
+            with tempfile.TemporaryDirectory() as tmp, \
+                    override_settings(SQLITE_PRODUCTION=PROFILES[profile]), \
+                    throwaway_database(f"{tmp}/{profile}.sqlite3", self.stderr):
+                user_ids = self._seed(options['users'], options['seed_itineraries'])
+                results[profile] = {
+                    phase: {count: self._phase(PHASES[phase], count, options['operations'], user_ids)
+                            for count in workers}
+                    for phase in options['phase'] or list(PHASES)
+                }
+
+        if options['json']:
+            self.stdout.write(json.dumps(results, indent=2))
+        else:
+            self._print_table(results)
+
+    def _seed(self, users, per_user):
+        user_ids = []
+        for i in range(users):
+            user = User.objects.create_user(f'benchmark-{i}', password='benchmark')
+            user_ids.append(user.id)
+            for j in range(per_user):
+                self._write(user.id, i * per_user + j)
+        connections.close_all()
+        return user_ids
+
+    @staticmethod
+    def _write(user_id, i):
+        start_point, destination = TRIPS[i % len(TRIPS)]
+        preference = retry_on_lock(UserPreference.objects.create)(
+            user_id=user_id, departure=start_point, destination=destination,
+        )
+        create_itinerary(preference, stand_in_itinerary(f"{start_point} {i}", destination, days=3))
+
+    @staticmethod
+    def _read(user_id):
+        list(user_itineraries(user_id).values('id', 'created_at')[:20])
+        latest = user_itineraries(user_id).first()
+        return latest.itinerary_data if latest else None
+
+    def _phase(self, read_share, workers, total, user_ids):
+        metrics.reset()
+        # Fixed per-operation choices, so every worker count runs the same mix
+        rng = random.Random(0)
+        plan = [(rng.random() < read_share, rng.choice(user_ids)) for _ in range(total)]
+
+        def run(i):
+            is_read, user_id = plan[i]
+            started = time.perf_counter()
+            try:
+                self._read(user_id) if is_read else self._write(user_id, i)
+                ok = True
+            except Exception as e:
+                self.stderr.write(f"{'read' if is_read else 'write'} failed: {e}")
+                ok = False
+            finally:
+                connections.close_all()
+            return is_read, time.perf_counter() - started, ok
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            outcomes = list(executor.map(run, range(total)))
+        wall = time.perf_counter() - started
+
+        counters = metrics.snapshot()['counters']
+        result = {
+            'throughput_ops': total / wall,
+            'errors': sum(1 for _, _, ok in outcomes if not ok),
+            'lock_retries': sum(c['value'] for c in counters if c['name'] == 'db_lock_retries_total'),
+        }
+        for kind, is_read in (('read', True), ('write', False)):
+            latencies = [elapsed * 1000 for read, elapsed, _ in outcomes if read == is_read]
+            result[f'{kind}_ops'] = len(latencies) / wall
+            result[f'{kind}_p50_ms'] = percentile(latencies, 50) if latencies else None
+            result[f'{kind}_p95_ms'] = percentile(latencies, 95) if latencies else None
+            result[f'{kind}_mean_ms'] = statistics.mean(latencies) if latencies else None
+        return result
+
+    def _print_table(self, results):
+        def ms(value):
+            return f"{value:>8.1f}" if value is not None else f"{'-':>8}"
+
+        self.stdout.write(f"{'profile':<11} {'phase':<6} {'workers':>7} {'ops/s':>7} {'reads/s':>7} {'writes/s':>8} "
+                          f"{'read p95':>8} {'write p95':>9} {'retries':>7} {'errors':>6}")
+        for profile, phases in results.items():
+            for phase, by_workers in phases.items():
+                for workers, r in by_workers.items():
+                    self.stdout.write(
+                        f"{profile:<11} {phase:<6} {workers:>7} {r['throughput_ops']:>7.1f} {r['read_ops']:>7.1f} "
+                        f"{r['write_ops']:>8.1f} {ms(r['read_p95_ms'])} {ms(r['write_p95_ms']):>9} "
+                        f"{r['lock_retries']:>7} {r['errors']:>6}"
+                    )
@@ -0,0 +1,89 @@
+import json
+import statistics
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from travelplan.services.gemini_service import GeminiService, STRATEGIES, STRATEGY_SINGLE_CALL
+
+SAMPLE_PREFERENCES = {
+    'startPoint': 'Palakkad, Kerala',
+    'destination': 'Ooty',
+    'budget': '6000 Rupees',
+    'start_date': '2025-06-01',
+    'end_date': '2025-06-02',
+    'travel_style': 'Solo',
+    'activities': ['sightseeing', 'trekking'],
+    'transportation': 'public transport',
+    'health_issues': [],
+}
+
+
+class Command(BaseCommand):
+    help = 'Compare latency and token use of the Gemini generation strategies (calls the live API).'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--runs', type=int, default=3, help='Generations per strategy')
+        parser.add_argument('--strategy', action='append', choices=STRATEGIES,
+                            help='Strategy to benchmark (repeatable; defaults to all)')
+        parser.add_argument('--preferences', help='JSON file with the preference dict to generate for')
+        parser.add_argument('--json', action='store_true', help='Print the results as JSON')
+
+    def handle(self, *args, **options):
+        preferences = SAMPLE_PREFERENCES
+        if options['preferences']:
+            with open(options['preferences']) as f:
+                preferences = json.load(f)
+
+        results = {}
+        for strategy in options['strategy'] or STRATEGIES:
+            runs = [self._run_once(strategy, preferences) for _ in range(options['runs'])]
+            ok = [run for run in runs if run['ok']]
+            if not ok:
+                raise CommandError(f"Every {strategy} run failed: {runs[-1]['error']}")
+            latencies = [run['seconds'] for run in ok]
+            results[strategy] = {
+                'runs': len(runs),
+                'failures': len(runs) - len(ok),
+                'latency_mean': statistics.mean(latencies),
+                'latency_p50': statistics.median(latencies),
+                'latency_max': max(latencies),
+                'calls_per_run': statistics.mean(run['calls'] for run in ok),
+                'prompt_tokens': statistics.mean(run['prompt_tokens'] for run in ok),
+                'response_tokens': statistics.mean(run['response_tokens'] for run in ok),
+            }
+
+        if options['json']:
+            self.stdout.write(json.dumps(results, indent=2))
+            return
+        self.stdout.write(f"{'strategy':<12} {'runs':>4} {'fail':>4} {'mean s':>8} {'p50 s':>8} {'max s':>8} "
+                          f"{'calls':>5} {'in tok':>8} {'out tok':>8}")
+        for strategy, r in results.items():
+            self.stdout.write(
+                f"{strategy:<12} {r['runs']:>4} {r['failures']:>4} {r['latency_mean']:>8.2f} {r['latency_p50']:>8.2f} "
+                f"{r['latency_max']:>8.2f} {r['calls_per_run']:>5.1f} {r['prompt_tokens']:>8.0f} {r['response_tokens']:>8.0f}"
+            )
+
+    def _run_once(self, strategy, preferences):
+        service = GeminiService(strategy=strategy)
+        started = time.perf_counter()
+        try:
+            # Call the strategy directly so single_call is measured without its fallback
+            if strategy == STRATEGY_SINGLE_CALL:
+                service.generate_single_call_itinerary(dict(preferences))
+            else:
+                service.generate_two_stage_itinerary(dict(preferences))
+        except Exception as e:
+            return {'ok': False, 'error': str(e)}
+        seconds = time.perf_counter() - started
+
+        # Token counting happens after timing so it does not skew latency
+        prompt_tokens = sum(service.model.count_tokens(x['prompt']).total_tokens for x in service.exchanges)
+        response_tokens = sum(service.model.count_tokens(x['text']).total_tokens for x in service.exchanges)
+        return {
+            'ok': True,
+            'seconds': seconds,
+            'calls': len(service.exchanges),
+            'prompt_tokens': prompt_tokens,
+            'response_tokens': response_tokens,
+        }
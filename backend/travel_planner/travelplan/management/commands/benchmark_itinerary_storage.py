@@ -0,0 +1,133 @@
+import json
+import os
+import sqlite3
+import statistics
+import tempfile
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from travelplan.fields import decoded
+from travelplan.models import Itinerary
+from travelplan.services import compression
+from travelplan.services.stand_ins import stand_in_itinerary
+
+from .benchmark_api import TRIPS
+
+
+class Command(BaseCommand):
+    help = ('Compare itinerary_data storage formats: bytes per row, encode/decode time, and the size and '
+            'read time of a SQLite table holding the rows in each format.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--samples', type=int, default=400,
+                            help='Itineraries to sample (the newest stored ones, else offline stand-ins)')
+        parser.add_argument('--rows', type=int, default=5000, help='Rows written to each benchmark table')
+        parser.add_argument('--dictionary-size', type=int, default=16 * 1024, help='Trained dictionary size')
+        parser.add_argument('--level', type=int, help='Compression level (ITINERARY_DATA_COMPRESSION_LEVEL)')
+        parser.add_argument('--json', action='store_true', help='Print the results as JSON')
+
+    def handle(self, *args, **options):
+        samples, source = self._samples(options['samples'])
+        if len(samples) < 4:
+            raise CommandError('At least four sample itineraries are needed')
+        # Dictionaries are trained on half the samples and measured on the other half
+        training, evaluation = samples[::2], samples[1::2]
+        self.stderr.write(f"{len(samples)} itineraries from {source}; {options['rows']} rows per table")
+
+        results = {}
+        with tempfile.TemporaryDirectory() as tmp:
+            for name, encode, decode in self._formats(training, options):
+                results[name] = self._measure(name, encode, decode, evaluation, options['rows'], tmp)
+
+        baseline = results['json']
+        for result in results.values():
+            result['size_ratio'] = result['bytes_per_row'] / baseline['bytes_per_row']
+            result['scan_decode_speedup'] = baseline['scan_decode_ms'] / result['scan_decode_ms']
+
+        if options['json']:
+            self.stdout.write(json.dumps({'source': source, 'samples': len(samples), 'results': results}, indent=2))
+        else:
+            self._print_table(results)
+
+    def _samples(self, count):
+        values = list(Itinerary.objects.order_by('-id').values_list('itinerary_data', flat=True)[:count])
+        if len(values) >= 4:
+            return [compression.dumps(decoded(value)) for value in values], 'the database'
+        samples = []
+        for i in range(count):
+            start_point, destination = TRIPS[i % len(TRIPS)]
+            data = stand_in_itinerary(f"{start_point} {i}", destination, days=2 + i % 4)
+            samples.append(compression.dumps(data))
+        return samples, 'offline stand-ins'
+
+    def _formats(self, training, options):
+        """(name, encode(raw) -> bytes, decode(bytes) -> value) per storage format."""
+        level = options['level']
+
+        def codec_format(codec, dictionary):
+            header = bytes(compression.HEADER.size)
+
+            def encode(raw):
+                return header + compression.compress(raw, codec, dictionary, level)
+
+            def decode(data):
+                return json.loads(compression.decompress(data[compression.HEADER.size:], codec, dictionary))
+            return encode, decode
+
+        formats = [('json', lambda raw: raw, json.loads)]
+        for codec in compression.available_codecs():
+            formats.append((codec, *codec_format(codec, None)))
+            dictionary = compression.train_dictionary(training, codec, options['dictionary_size'])
+            formats.append((f'{codec}+dict', *codec_format(codec, dictionary)))
+        return formats
+
+    def _measure(self, name, encode, decode, samples, rows, tmp):
+        encode_times, decode_times, encoded = [], [], []
+        for raw in samples:
+            started = time.perf_counter()
+            data = encode(raw)
+            encode_times.append(time.perf_counter() - started)
+            started = time.perf_counter()
+            decode(data)
+            decode_times.append(time.perf_counter() - started)
+            encoded.append(data)
+
+        path = os.path.join(tmp, f"{name}.sqlite3")
+        db = sqlite3.connect(path)
+        db.execute('CREATE TABLE itinerary (id INTEGER PRIMARY KEY, user_id INTEGER, itinerary_data BLOB)')
+        db.executemany('INSERT INTO itinerary (user_id, itinerary_data) VALUES (?, ?)',
+                       ((i % 50, encoded[i % len(encoded)]) for i in range(rows)))
+        db.commit()
+        page_size = db.execute('PRAGMA page_size').fetchone()[0]
+        page_count = db.execute('PRAGMA page_count').fetchone()[0]
+        db.close()
+
+        # A new connection, so the rows are read back through SQLite's page cache from scratch
+        db = sqlite3.connect(path)
+        started = time.perf_counter()
+        stored = [row[0] for row in db.execute('SELECT itinerary_data FROM itinerary')]
+        scan = time.perf_counter() - started
+        started = time.perf_counter()
+        for data in stored:
+            decode(data)
+        decode_all = time.perf_counter() - started
+        db.close()
+
+        return {
+            'bytes_per_row': statistics.mean(len(data) for data in encoded),
+            'table_mb': page_size * page_count / 1024 / 1024,
+            'encode_us': statistics.mean(encode_times) * 1e6,
+            'decode_us': statistics.mean(decode_times) * 1e6,
+            'scan_ms': scan * 1000,
+            'scan_decode_ms': (scan + decode_all) * 1000,
+        }
+
+    def _print_table(self, results):
+        self.stdout.write(f"{'format':<10} {'bytes/row':>9} {'ratio':>6} {'table MB':>8} {'enc us':>7} "
+                          f"{'dec us':>7} {'scan ms':>8} {'scan+dec ms':>11}")
+        for name, r in results.items():
+            self.stdout.write(
+                f"{name:<10} {r['bytes_per_row']:>9.0f} {r['size_ratio']:>6.2f} {r['table_mb']:>8.2f} "
+                f"{r['encode_us']:>7.1f} {r['decode_us']:>7.1f} {r['scan_ms']:>8.1f} {r['scan_decode_ms']:>11.1f}"
+            )
@@ -0,0 +1,52 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from travelplan.models import Itinerary, ItineraryPlace
+from travelplan.services.place_index import build_places
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the ItineraryPlace index from stored itineraries.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500, help='Itineraries indexed per transaction')
+        parser.add_argument('--missing', action='store_true',
+                            help='Only index itineraries without any index rows instead of rebuilding every one')
+
+    def handle(self, *args, **options):
+        itineraries = Itinerary.objects.select_related('preference').order_by('id')
+        if options['missing']:
+            itineraries = itineraries.filter(places__isnull=True)
+
+        batch_size = options['batch_size']
+        indexed = 0
+        skipped = 0
+        places = 0
+        last_id = 0
+        while True:
+            # Keyset batches, so the scan never revisits rows and each batch is one short transaction
+            batch = list(itineraries.filter(id__gt=last_id)[:batch_size])
+            if not batch:
+                break
+            rows = []
+            built = []
+            for itinerary in batch:
+                # One unreadable itinerary is reported and left as it was rather than stopping the backfill
+                try:
+                    rows.extend(build_places(itinerary, itinerary.preference))
+                except Exception as e:
+                    skipped += 1
+                    self.stderr.write(f"Skipped itinerary {itinerary.id}: {e!r}")
+                    continue
+                built.append(itinerary)
+            with transaction.atomic():
+                ItineraryPlace.objects.filter(itinerary__in=built).delete()
+                ItineraryPlace.objects.bulk_create(rows)
+            indexed += len(built)
+            places += len(rows)
+            last_id = batch[-1].id
+            self.stdout.write(f"Indexed {indexed} itineraries")
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Done: {places} places from {indexed} itineraries" + (f", {skipped} skipped" if skipped else '')
+        ))
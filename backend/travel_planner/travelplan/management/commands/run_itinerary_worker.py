@@ -0,0 +1,39 @@
+import os
+import socket
+import time
+import uuid
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from travelplan.services.clients import warm_up_on_boot
+from travelplan.services.job_queue import claim_next_job, run_job
+
+
+class Command(BaseCommand):
+    help = 'Process queued itinerary generation jobs. Run as many workers as needed.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--worker-id', help='Identifier recorded on claimed jobs (defaults to host:pid:random)')
+        parser.add_argument('--once', action='store_true', help='Process available jobs, then exit')
+        parser.add_argument('--poll-interval', type=float, default=settings.ITINERARY_WORKER_POLL_INTERVAL,
+                            help='Seconds to sleep when the queue is empty')
+
+    def handle(self, *args, **options):
+        worker_id = options['worker_id'] or f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:6]}"
+        warm_up_on_boot()
+        self.stdout.write(f"Itinerary worker {worker_id} started")
+        try:
+            while True:
+                close_old_connections()
+                job = claim_next_job(worker_id)
+                if job is None:
+                    if options['once']:
+                        break
+                    time.sleep(options['poll_interval'])
+                    continue
+                self.stdout.write(f"Running job {job.pk} (attempt {job.attempts})")
+                run_job(job, worker_id)
+        except KeyboardInterrupt:
+            self.stdout.write(f"Itinerary worker {worker_id} stopping")
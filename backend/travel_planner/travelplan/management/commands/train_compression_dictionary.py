@@ -0,0 +1,57 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from travelplan.fields import decoded
+from travelplan.models import CompressionDictionary, Itinerary
+from travelplan.services import compression
+
+
+class Command(BaseCommand):
+    help = ('Train a compression dictionary for itinerary_data on the newest stored itineraries; new rows '
+            'use it from then on. --recompress re-encodes the existing rows with it.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--samples', type=int, default=1000, help='Newest itineraries to train on')
+        parser.add_argument('--size', type=int, default=16 * 1024,
+                            help=f'Dictionary size in bytes (zlib uses at most {compression.ZLIB_MAX_DICTIONARY_SIZE})')
+        parser.add_argument('--recompress', action='store_true',
+                            help='Re-encode every stored itinerary with the new dictionary')
+        parser.add_argument('--batch-size', type=int, default=500, help='Itineraries re-encoded per transaction')
+
+    def handle(self, *args, **options):
+        codec = compression.configured_codec()
+        values = Itinerary.objects.order_by('-id').values_list('itinerary_data', flat=True)[:options['samples']]
+        samples = [compression.dumps(decoded(value)) for value in values]
+        if len(samples) < 2:
+            raise CommandError('At least two stored itineraries are needed to train a dictionary')
+        try:
+            data = compression.train_dictionary(samples, codec, options['size'])
+        except Exception as e:  # zstandard.ZstdError, e.g. too few samples for the requested size
+            raise CommandError(f"Training failed: {e}")
+
+        dictionary = CompressionDictionary.objects.create(codec=codec, data=data, sample_count=len(samples))
+        compression.clear_dictionary_cache()
+        self.stdout.write(self.style.SUCCESS(f"Saved {dictionary}"))
+        if not settings.ITINERARY_DATA_DICTIONARY:
+            self.stderr.write('Warning: ITINERARY_DATA_DICTIONARY is false, so new rows will not use it.')
+        if options['recompress']:
+            self._recompress(options['batch_size'])
+
+    def _recompress(self, batch_size):
+        itineraries = Itinerary.objects.order_by('id').only('id', 'itinerary_data')
+        written = 0
+        last_id = 0
+        while True:
+            batch = list(itineraries.filter(id__gt=last_id)[:batch_size])
+            if not batch:
+                break
+            for itinerary in batch:
+                # Assigning the decoded value makes the save encode it again instead of copying the bytes
+                itinerary.itinerary_data = itinerary.itinerary_data
+            with transaction.atomic():
+                Itinerary.objects.bulk_update(batch, ['itinerary_data'])
+            written += len(batch)
+            last_id = batch[-1].id
+            self.stdout.write(f"Re-encoded {written} itineraries")
+        self.stdout.write(self.style.SUCCESS(f"Done: {written} itineraries re-encoded"))
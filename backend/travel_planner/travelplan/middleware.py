@@ -0,0 +1,51 @@
+import time
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+
+from .services import metrics
+
+
+class ServerTimingMiddleware:
+    """Collect per-stage timings for each request into a Server-Timing header and HTTP metrics"""
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        started = time.perf_counter()
+        timings, token = metrics.begin_request()
+        try:
+            response = self.get_response(request)
+        finally:
+            metrics.end_request(token)
+        return self.finish(request, response, timings, started)
+
+    async def __acall__(self, request):
+        started = time.perf_counter()
+        timings, token = metrics.begin_request()
+        try:
+            response = await self.get_response(request)
+        finally:
+            metrics.end_request(token)
+        return self.finish(request, response, timings, started)
+
+    def finish(self, request, response, timings, started):
+        elapsed = time.perf_counter() - started
+        match = getattr(request, 'resolver_match', None)
+        route = match.url_name if match and match.url_name else 'unmatched'
+        metrics.observe('http_request_duration_seconds', elapsed, {'route': route, 'method': request.method})
+        metrics.increment('http_requests_total', {
+            'route': route, 'method': request.method, 'status': str(response.status_code),
+        })
+        if settings.SERVER_TIMING_ENABLED and not response.has_header('Server-Timing'):
+            # Streaming responses only report the stages finished before the first byte
+            response['Server-Timing'] = timings.server_timing(total=elapsed)
+        return response
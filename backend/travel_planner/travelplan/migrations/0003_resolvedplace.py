@@ -0,0 +1,31 @@
+# Generated by Django 5.0.6 on 2026-10-18 14:55
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('travelplan', '0002_geocodecacheentry'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ResolvedPlace',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name_key', models.CharField(max_length=255)),
+                ('context_key', models.CharField(max_length=255)),
+                ('place_id', models.CharField(blank=True, db_index=True, max_length=255)),
+                ('lat', models.FloatField(blank=True, null=True)),
+                ('lng', models.FloatField(blank=True, null=True)),
+                ('address', models.TextField(blank=True)),
+                ('resolved_at', models.DateTimeField()),
+                ('last_used_at', models.DateTimeField(db_index=True)),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='resolvedplace',
+            constraint=models.UniqueConstraint(fields=('name_key', 'context_key'), name='unique_resolved_place_key'),
+        ),
+    ]
@@ -0,0 +1,39 @@
+# Generated by Django 5.0.6 on 2026-10-18 15:01
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('travelplan', '0004_itineraryjob'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ItineraryLocation',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('hotel', 'Hotel'), ('restaurant', 'Restaurant')], max_length=20)),
+                ('position', models.PositiveIntegerField()),
+                ('name', models.CharField(max_length=255)),
+                ('context', models.CharField(max_length=255)),
+                ('source_place_id', models.CharField(blank=True, max_length=255)),
+                ('place_id', models.CharField(blank=True, max_length=255)),
+                ('lat', models.FloatField(blank=True, null=True)),
+                ('lng', models.FloatField(blank=True, null=True)),
+                ('address', models.TextField(blank=True)),
+                ('status', models.CharField(choices=[('resolved', 'Resolved'), ('not_found', 'Not found'), ('not_applicable', 'Not applicable'), ('failed', 'Failed')], max_length=20)),
+                ('resolved_at', models.DateTimeField()),
+                ('itinerary', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='locations', to='travelplan.itinerary')),
+            ],
+            options={
+                'ordering': ['itinerary_id', 'kind', 'position'],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='itinerarylocation',
+            constraint=models.UniqueConstraint(fields=('itinerary', 'kind', 'position'), name='unique_itinerary_location'),
+        ),
+    ]
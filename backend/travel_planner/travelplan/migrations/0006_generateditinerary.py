@@ -0,0 +1,25 @@
+# Generated by Django 5.0.6 on 2026-10-18 15:02
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('travelplan', '0005_itinerarylocation'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='GeneratedItinerary',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('fingerprint', models.CharField(max_length=64, unique=True)),
+                ('itinerary_data', models.JSONField()),
+                ('hits', models.PositiveIntegerField(default=0)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('expires_at', models.DateTimeField(db_index=True)),
+                ('last_used_at', models.DateTimeField(db_index=True)),
+            ],
+        ),
+    ]
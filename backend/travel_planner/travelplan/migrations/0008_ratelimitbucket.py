@@ -0,0 +1,23 @@
+# Generated by Django 5.0.6 on 2026-10-18 15:08
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('travelplan', '0007_generationlock'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RateLimitBucket',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('key', models.CharField(max_length=150, unique=True)),
+                ('tokens', models.FloatField()),
+                ('refilled_at', models.FloatField()),
+                ('version', models.PositiveBigIntegerField(default=0)),
+            ],
+        ),
+    ]
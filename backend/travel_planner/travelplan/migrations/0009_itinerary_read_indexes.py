@@ -0,0 +1,23 @@
+# Generated by Django 5.0.6 on 2026-10-18 15:24
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('travelplan', '0008_ratelimitbucket'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='itinerary',
+            index=models.Index(fields=['user', '-created_at', '-id'], name='itinerary_user_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='userpreference',
+            index=models.Index(fields=['user', 'created_at'], name='preference_user_created_idx'),
+        ),
+    ]
@@ -0,0 +1,39 @@
+# Generated by Django 5.0.6 on 2026-10-18 15:27
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('travelplan', '0009_itinerary_read_indexes'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ItinerarySummary',
+            fields=[
+                ('itinerary', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='summary', serialize=False, to='travelplan.itinerary')),
+                ('trip_name', models.CharField(blank=True, max_length=255)),
+                ('duration', models.CharField(blank=True, max_length=100)),
+                ('departure', models.CharField(blank=True, max_length=255)),
+                ('destination', models.CharField(blank=True, max_length=255)),
+                ('destination_key', models.CharField(blank=True, max_length=255)),
+                ('start_date', models.DateField(blank=True, null=True)),
+                ('end_date', models.DateField(blank=True, null=True)),
+                ('num_days', models.PositiveIntegerField(default=0)),
+                ('budget_text', models.CharField(blank=True, max_length=255)),
+                ('budget_min', models.DecimalField(blank=True, decimal_places=2, max_digits=12, null=True)),
+                ('budget_max', models.DecimalField(blank=True, decimal_places=2, max_digits=12, null=True)),
+                ('first_hotel', models.CharField(blank=True, max_length=255)),
+                ('created_at', models.DateTimeField()),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='itinerary_summaries', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['user', '-created_at', '-itinerary'], name='summary_user_created_idx'), models.Index(fields=['user', 'destination_key'], name='summary_user_destination_idx'), models.Index(fields=['user', 'start_date'], name='summary_user_start_idx'), models.Index(fields=['user', 'budget_min'], name='summary_user_budget_idx')],
+            },
+        ),
+    ]
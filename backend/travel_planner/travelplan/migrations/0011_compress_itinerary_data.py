@@ -0,0 +1,75 @@
+# Generated by Django 5.0.6 on 2026-10-18 16:02
+
+from django.db import migrations, models
+
+import travelplan.fields
+
+BATCH_SIZE = 500
+
+
+def _copy_in_batches(apps, schema_editor, source, target):
+    Itinerary = apps.get_model('travelplan', 'Itinerary')
+    itineraries = Itinerary.objects.using(schema_editor.connection.alias).order_by('id').only('id', source)
+    last_id = 0
+    while True:
+        batch = list(itineraries.filter(id__gt=last_id)[:BATCH_SIZE])
+        if not batch:
+            break
+        for itinerary in batch:
+            setattr(itinerary, target, getattr(itinerary, source))
+        Itinerary.objects.using(schema_editor.connection.alias).bulk_update(batch, [target])
+        last_id = batch[-1].id
+
+
+def compress_itinerary_data(apps, schema_editor):
+    _copy_in_batches(apps, schema_editor, 'itinerary_data', 'itinerary_data_compressed')
+
+
+def decompress_itinerary_data(apps, schema_editor):
+    _copy_in_batches(apps, schema_editor, 'itinerary_data_compressed', 'itinerary_data')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('travelplan', '0010_itinerarysummary'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CompressionDictionary',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('codec', models.CharField(max_length=10)),
+                ('data', models.BinaryField()),
+                ('sample_count', models.PositiveIntegerField(default=0)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+        # Nullable while both columns exist, so the reverse can re-add it before refilling it
+        migrations.AlterField(
+            model_name='itinerary',
+            name='itinerary_data',
+            field=models.JSONField(null=True),
+        ),
+        migrations.AddField(
+            model_name='itinerary',
+            name='itinerary_data_compressed',
+            field=travelplan.fields.CompressedJSONField(null=True),
+        ),
+        migrations.RunPython(compress_itinerary_data, decompress_itinerary_data),
+        migrations.RemoveField(
+            model_name='itinerary',
+            name='itinerary_data',
+        ),
+        migrations.RenameField(
+            model_name='itinerary',
+            old_name='itinerary_data_compressed',
+            new_name='itinerary_data',
+        ),
+        migrations.AlterField(
+            model_name='itinerary',
+            name='itinerary_data',
+            field=travelplan.fields.CompressedJSONField(),
+        ),
+    ]
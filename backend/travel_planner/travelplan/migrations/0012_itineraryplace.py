@@ -0,0 +1,39 @@
+# Generated by Django 5.0.6 on 2026-10-18 16:05
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('travelplan', '0011_compress_itinerary_data'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ItineraryPlace',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('hotel', 'Hotel'), ('restaurant', 'Restaurant')], max_length=20)),
+                ('position', models.PositiveIntegerField()),
+                ('name', models.CharField(max_length=255)),
+                ('name_key', models.CharField(max_length=255)),
+                ('place_id', models.CharField(blank=True, max_length=255)),
+                ('destination_key', models.CharField(blank=True, max_length=255)),
+                ('day', models.PositiveSmallIntegerField(blank=True, null=True)),
+                ('time_slot', models.CharField(blank=True, max_length=100)),
+                ('itinerary', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='places', to='travelplan.itinerary')),
+                ('user', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='itinerary_places', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['user', 'name_key'], name='place_user_name_idx'), models.Index(fields=['name_key'], name='place_name_idx'), models.Index(fields=['place_id'], name='place_place_id_idx'), models.Index(fields=['destination_key', 'kind', 'name_key', 'itinerary'], name='place_destination_idx')],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='itineraryplace',
+            constraint=models.UniqueConstraint(fields=('itinerary', 'kind', 'position'), name='unique_itinerary_place'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.0.6 on 2026-10-18 15:54
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('travelplan', '0012_itineraryplace'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='generationlock',
+            name='itinerary_data',
+            field=models.JSONField(blank=True, null=True),
+        ),
+    ]
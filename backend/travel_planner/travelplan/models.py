@@ -1,8 +1,12 @@
 from django.db import models
 from django.contrib.auth.models import User
+import hashlib
 import json
+import re
 from datetime import date
 
+from .fields import CompressedJSONField
+
 class UserPreference(models.Model):
     """Store user preferences for travel planning"""
     user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='preferences')
@@ -17,6 +21,11 @@ class UserPreference(models.Model):
     health_issues = models.TextField(blank=True, null=True)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['user', 'created_at'], name='preference_user_created_idx'),
+        ]
     
     def __str__(self):
         return f"{self.user.username}'s preferences for {self.destination or 'unknown'}"
@@ -51,12 +60,28 @@ class UserPreference(models.Model):
             'health_issues': self.get_health_issues_list(),
         }
 
+    def fingerprint(self):
+        """Stable hash of to_dict(), ignoring case, whitespace and list order"""
+        def normalize(value):
+            if isinstance(value, list):
+                return sorted({normalize(item) for item in value if str(item).strip()})
+            return re.sub(r'\s+', ' ', str(value)).strip().lower()
+
+        normalized = {key: normalize(value) for key, value in self.to_dict().items()}
+        return hashlib.sha256(json.dumps(normalized, sort_keys=True).encode()).hexdigest()
+
 class Itinerary(models.Model):
     """Store generated itineraries"""
     user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='itineraries')
     preference = models.ForeignKey(UserPreference, on_delete=models.CASCADE, related_name='itineraries')
-    itinerary_data = models.JSONField()
+    itinerary_data = CompressedJSONField()
     created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            # Serves the newest-first reads and keyset pages of user_itineraries()
+            models.Index(fields=['user', '-created_at', '-id'], name='itinerary_user_created_idx'),
+        ]
     
     def __str__(self):
         return f"Itinerary for {self.user.username} - {self.created_at}"
@@ -65,3 +90,264 @@ class Itinerary(models.Model):
         """Return itinerary data as JSON string"""
         return json.dumps(self.itinerary_data)
 
+
+class ItineraryLocation(models.Model):
+    """Resolved hotel or restaurant location materialized for an itinerary"""
+    KIND_HOTEL = 'hotel'
+    KIND_RESTAURANT = 'restaurant'
+    KIND_CHOICES = [(KIND_HOTEL, 'Hotel'), (KIND_RESTAURANT, 'Restaurant')]
+
+    STATUS_RESOLVED = 'resolved'
+    STATUS_NOT_FOUND = 'not_found'
+    STATUS_NOT_APPLICABLE = 'not_applicable'
+    STATUS_FAILED = 'failed'
+    STATUS_CHOICES = [
+        (STATUS_RESOLVED, 'Resolved'),
+        (STATUS_NOT_FOUND, 'Not found'),
+        (STATUS_NOT_APPLICABLE, 'Not applicable'),
+        (STATUS_FAILED, 'Failed'),
+    ]
+
+    itinerary = models.ForeignKey(Itinerary, on_delete=models.CASCADE, related_name='locations')
+    kind = models.CharField(max_length=20, choices=KIND_CHOICES)
+    position = models.PositiveIntegerField()
+    name = models.CharField(max_length=255)
+    context = models.CharField(max_length=255)
+    source_place_id = models.CharField(max_length=255, blank=True)
+    place_id = models.CharField(max_length=255, blank=True)
+    lat = models.FloatField(null=True, blank=True)
+    lng = models.FloatField(null=True, blank=True)
+    address = models.TextField(blank=True)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES)
+    resolved_at = models.DateTimeField()
+
+    class Meta:
+        ordering = ['itinerary_id', 'kind', 'position']
+        constraints = [
+            models.UniqueConstraint(fields=['itinerary', 'kind', 'position'], name='unique_itinerary_location'),
+        ]
+
+    def __str__(self):
+        return f"{self.kind} {self.position} of itinerary {self.itinerary_id}: {self.name}"
+
+    def to_entry(self):
+        """Return the entry in the shape produced by extract_hotels_and_restaurants"""
+        return {'name': self.name, 'context': self.context, 'placeId': self.source_place_id or 'ID not available'}
+
+    def to_location(self):
+        """Return the location in the same shape as fetch_place_id"""
+        return {'placeId': self.place_id, 'lat': self.lat, 'lng': self.lng, 'address': self.address}
+
+    def apply_location(self, location, resolved_at):
+        """Copy a fetch_place_id result onto this row and derive its status"""
+        self.place_id = str(location.get('placeId') or '')[:255]
+        self.lat = location.get('lat')
+        self.lng = location.get('lng')
+        self.address = location.get('address') or ''
+        self.resolved_at = resolved_at
+        if self.place_id.startswith('Error'):
+            self.status = self.STATUS_FAILED
+        elif self.address == 'Not applicable':
+            self.status = self.STATUS_NOT_APPLICABLE
+        elif self.lat is None:
+            self.status = self.STATUS_NOT_FOUND
+        else:
+            self.status = self.STATUS_RESOLVED
+
+class ItinerarySummary(models.Model):
+    """Trip-card fields of an itinerary, copied out of itinerary_data when it is saved"""
+    itinerary = models.OneToOneField(Itinerary, on_delete=models.CASCADE, primary_key=True, related_name='summary')
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='itinerary_summaries')
+    trip_name = models.CharField(max_length=255, blank=True)
+    duration = models.CharField(max_length=100, blank=True)
+    departure = models.CharField(max_length=255, blank=True)
+    destination = models.CharField(max_length=255, blank=True)
+    destination_key = models.CharField(max_length=255, blank=True)  # Lowercased, whitespace-collapsed
+    start_date = models.DateField(null=True, blank=True)
+    end_date = models.DateField(null=True, blank=True)
+    num_days = models.PositiveIntegerField(default=0)
+    budget_text = models.CharField(max_length=255, blank=True)
+    budget_min = models.DecimalField(max_digits=12, decimal_places=2, null=True, blank=True)
+    budget_max = models.DecimalField(max_digits=12, decimal_places=2, null=True, blank=True)
+    first_hotel = models.CharField(max_length=255, blank=True)
+    created_at = models.DateTimeField()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['user', '-created_at', '-itinerary'], name='summary_user_created_idx'),
+            models.Index(fields=['user', 'destination_key'], name='summary_user_destination_idx'),
+            models.Index(fields=['user', 'start_date'], name='summary_user_start_idx'),
+            models.Index(fields=['user', 'budget_min'], name='summary_user_budget_idx'),
+        ]
+
+    def __str__(self):
+        return f"Summary of itinerary {self.itinerary_id}: {self.trip_name or self.destination}"
+
+class ItineraryPlace(models.Model):
+    """Hotel or restaurant mentioned by an itinerary, indexed for lookups across itineraries"""
+    # Both are the leading column of an index below, so they need no index of their own
+    itinerary = models.ForeignKey(Itinerary, on_delete=models.CASCADE, related_name='places', db_index=False)
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='itinerary_places', db_index=False)
+    kind = models.CharField(max_length=20, choices=ItineraryLocation.KIND_CHOICES)
+    position = models.PositiveIntegerField()  # Order among the itinerary's places of this kind
+    name = models.CharField(max_length=255)
+    name_key = models.CharField(max_length=255)  # normalize_location(name)
+    place_id = models.CharField(max_length=255, blank=True)  # Place ID given in the itinerary, if any
+    destination_key = models.CharField(max_length=255, blank=True)  # Preference destination, normalized
+    day = models.PositiveSmallIntegerField(null=True, blank=True)
+    time_slot = models.CharField(max_length=100, blank=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['itinerary', 'kind', 'position'], name='unique_itinerary_place'),
+        ]
+        indexes = [
+            # Name lookups, newest first in rowid order; kind is filtered on the matching rows
+            models.Index(fields=['user', 'name_key'], name='place_user_name_idx'),
+            models.Index(fields=['name_key'], name='place_name_idx'),
+            models.Index(fields=['place_id'], name='place_place_id_idx'),
+            # Covers the most-recommended aggregation: grouped by name, counting itineraries
+            models.Index(fields=['destination_key', 'kind', 'name_key', 'itinerary'], name='place_destination_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.kind} {self.name} in itinerary {self.itinerary_id}"
+
+class CompressionDictionary(models.Model):
+    """Preset dictionary for compressed itinerary_data; rows reference it by id, so it is never changed"""
+    codec = models.CharField(max_length=10)
+    data = models.BinaryField()
+    sample_count = models.PositiveIntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"{self.codec} dictionary {self.id} ({len(self.data)} bytes from {self.sample_count} samples)"
+
+class GeneratedItinerary(models.Model):
+    """Recently generated itinerary cached by preference fingerprint"""
+    fingerprint = models.CharField(max_length=64, unique=True)
+    itinerary_data = models.JSONField()
+    hits = models.PositiveIntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+    expires_at = models.DateTimeField(db_index=True)
+    last_used_at = models.DateTimeField(db_index=True)
+
+    def __str__(self):
+        return f"Generated itinerary {self.fingerprint[:12]} ({self.hits} hits)"
+
+class GenerationLock(models.Model):
+    """Lease held by the process currently generating an itinerary for a fingerprint"""
+    fingerprint = models.CharField(max_length=64, unique=True)
+    owner = models.CharField(max_length=64)
+    itinerary_data = models.JSONField(null=True, blank=True)  # The leader's result, read by followers
+    created_at = models.DateTimeField(auto_now_add=True)
+    expires_at = models.DateTimeField()
+
+    def __str__(self):
+        return f"Generation lock {self.fingerprint[:12]} held by {self.owner}"
+
+class RateLimitBucket(models.Model):
+    """Token bucket shared by every process calling an upstream provider endpoint"""
+    key = models.CharField(max_length=150, unique=True)
+    tokens = models.FloatField()
+    refilled_at = models.FloatField()  # Unix timestamp of the last refill
+    version = models.PositiveBigIntegerField(default=0)
+
+    def __str__(self):
+        return f"{self.key}: {self.tokens:.2f} tokens"
+
+class GeocodeCacheEntry(models.Model):
+    """Cached geocoding result for a normalized context location"""
+    query = models.CharField(max_length=255, unique=True)
+    lat = models.FloatField(null=True, blank=True)
+    lng = models.FloatField(null=True, blank=True)
+    found = models.BooleanField(default=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    expires_at = models.DateTimeField(db_index=True)
+
+    def __str__(self):
+        return f"Geocode for {self.query} ({'found' if self.found else 'not found'})"
+
+    def coordinates(self):
+        """Return (lat, lng) or None for a negative entry"""
+        if not self.found:
+            return None
+        return (self.lat, self.lng)
+
+class ResolvedPlace(models.Model):
+    """Cached Google Maps resolution of a place name within a context location"""
+    name_key = models.CharField(max_length=255)
+    context_key = models.CharField(max_length=255)
+    place_id = models.CharField(max_length=255, blank=True, db_index=True)
+    lat = models.FloatField(null=True, blank=True)
+    lng = models.FloatField(null=True, blank=True)
+    address = models.TextField(blank=True)
+    resolved_at = models.DateTimeField()
+    last_used_at = models.DateTimeField(db_index=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['name_key', 'context_key'], name='unique_resolved_place_key'),
+        ]
+
+    def __str__(self):
+        return f"{self.name_key} @ {self.context_key} -> {self.place_id or 'unresolved'}"
+
+    def to_location(self):
+        """Return the place in the same shape as fetch_place_id"""
+        return {
+            'placeId': self.place_id or 'ID not available',
+            'lat': self.lat,
+            'lng': self.lng,
+            'address': self.address,
+        }
+
+class ItineraryJob(models.Model):
+    """Queued itinerary generation processed by run_itinerary_worker"""
+    STATUS_QUEUED = 'queued'
+    STATUS_RUNNING = 'running'
+    STATUS_SUCCEEDED = 'succeeded'
+    STATUS_FAILED = 'failed'
+    STATUS_CHOICES = [
+        (STATUS_QUEUED, 'Queued'),
+        (STATUS_RUNNING, 'Running'),
+        (STATUS_SUCCEEDED, 'Succeeded'),
+        (STATUS_FAILED, 'Failed'),
+    ]
+
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='itinerary_jobs')
+    preference = models.ForeignKey(UserPreference, on_delete=models.CASCADE, related_name='jobs')
+    itinerary = models.ForeignKey(Itinerary, on_delete=models.SET_NULL, null=True, blank=True, related_name='jobs')
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default=STATUS_QUEUED)
+    stage = models.CharField(max_length=50, default=STATUS_QUEUED)
+    progress = models.PositiveSmallIntegerField(default=0)
+    error = models.TextField(blank=True)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    worker_id = models.CharField(max_length=100, blank=True)
+    lease_expires_at = models.DateTimeField(null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'created_at'], name='itinerary_job_queue_idx'),
+        ]
+
+    def __str__(self):
+        return f"Job {self.id} for {self.user_id} ({self.status})"
+
+    def to_dict(self):
+        """Status payload returned by the job status endpoint"""
+        return {
+            'id': self.id,
+            'status': self.status,
+            'stage': self.stage,
+            'progress': self.progress,
+            'itinerary_id': self.itinerary_id,
+            'error': self.error or None,
+            'attempts': self.attempts,
+            'created_at': self.created_at.isoformat(),
+            'updated_at': self.updated_at.isoformat(),
+        }
@@ -0,0 +1,238 @@
+import base64
+from datetime import date, datetime
+from decimal import Decimal, InvalidOperation
+
+from django.conf import settings
+from django.db.models import Q
+
+from .fields import decoded
+from .services.summary_service import normalize_destination
+
+# Public field name -> queryset lookup used by the itinerary listing
+ITINERARY_LIST_FIELDS = {
+    'id': 'id',
+    'user': 'user_id',
+    'preference': 'preference_id',
+    'created_at': 'created_at',
+    'itinerary_data': 'itinerary_data',
+    'departure': 'preference__departure',
+    'destination': 'preference__destination',
+    'budget': 'preference__budget',
+    'start_date': 'preference__start_date',
+    'end_date': 'preference__end_date',
+    'travel_style': 'preference__travel_style',
+}
+# Summary fields returned when no fields= projection is requested; leaves out itinerary_data
+DEFAULT_ITINERARY_LIST_FIELDS = [
+    'id', 'preference', 'created_at', 'departure', 'destination', 'start_date', 'end_date', 'travel_style',
+]
+
+
+# Sort keys of the summary listing -> (model field, parser for cursor values); ties break on itinerary_id
+SUMMARY_ORDERINGS = {
+    'created_at': ('created_at', datetime.fromisoformat),
+    'start_date': ('start_date', date.fromisoformat),
+    'budget': ('budget_min', Decimal),
+}
+# Columns returned by the summary listing; 'id' is the itinerary's id
+SUMMARY_LIST_FIELDS = {
+    'id': 'itinerary_id',
+    'trip_name': 'trip_name',
+    'duration': 'duration',
+    'departure': 'departure',
+    'destination': 'destination',
+    'start_date': 'start_date',
+    'end_date': 'end_date',
+    'num_days': 'num_days',
+    'budget': 'budget_text',
+    'budget_min': 'budget_min',
+    'budget_max': 'budget_max',
+    'first_hotel': 'first_hotel',
+    'created_at': 'created_at',
+}
+
+# Columns returned for place index matches; 'itinerary' is the matching itinerary's id
+PLACE_LIST_FIELDS = {
+    'itinerary': 'itinerary_id',
+    'kind': 'kind',
+    'name': 'name',
+    'place_id': 'place_id',
+    'day': 'day',
+    'time_slot': 'time_slot',
+}
+
+
+class InvalidPageRequest(ValueError):
+    """Raised for a malformed cursor, page size or field projection."""
+
+
+def encode_cursor(created_at, pk):
+    """Encode the (created_at, id) position of the last row on a page."""
+    raw = f"{created_at.isoformat()}|{pk}"
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    """Decode a cursor produced by encode_cursor."""
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        created_at, pk = base64.urlsafe_b64decode(padded.encode()).decode().rsplit('|', 1)
+        return datetime.fromisoformat(created_at), int(pk)
+    except (ValueError, UnicodeDecodeError):
+        raise InvalidPageRequest('Invalid cursor')
+
+
+def parse_fields(fields_param):
+    """Parse a comma-separated fields= projection (or 'all')."""
+    if not fields_param:
+        return list(DEFAULT_ITINERARY_LIST_FIELDS)
+    if fields_param == 'all':
+        return list(ITINERARY_LIST_FIELDS)
+    fields = [field.strip() for field in fields_param.split(',') if field.strip()]
+    unknown = [field for field in fields if field not in ITINERARY_LIST_FIELDS]
+    if unknown:
+        raise InvalidPageRequest(f"Unknown fields: {', '.join(unknown)}")
+    return fields
+
+
+def parse_page_size(page_size_param):
+    """Parse page_size=, clamped to ITINERARY_MAX_PAGE_SIZE."""
+    if not page_size_param:
+        return settings.ITINERARY_PAGE_SIZE
+    try:
+        page_size = int(page_size_param)
+    except ValueError:
+        raise InvalidPageRequest('Invalid page_size')
+    if page_size < 1:
+        raise InvalidPageRequest('Invalid page_size')
+    return min(page_size, settings.ITINERARY_MAX_PAGE_SIZE)
+
+
+def paginate_itineraries(queryset, cursor=None, page_size=None, fields=None):
+    """Return one keyset page of itineraries, newest first.
+
+    Rows are ordered and paged on (created_at, id) and fetched with
+    .values() restricted to the projected columns, so the itinerary_data
+    blob is only read when it is explicitly requested.
+    """
+    fields = fields or list(DEFAULT_ITINERARY_LIST_FIELDS)
+    page_size = page_size or settings.ITINERARY_PAGE_SIZE
+
+    queryset = queryset.order_by('-created_at', '-id')
+    if cursor:
+        created_at, pk = decode_cursor(cursor)
+        queryset = queryset.filter(Q(created_at__lt=created_at) | Q(created_at=created_at, id__lt=pk))
+
+    lookups = {ITINERARY_LIST_FIELDS[field] for field in fields} | {'id', 'created_at'}
+    rows = list(queryset.values(*lookups)[:page_size + 1])
+    has_more = len(rows) > page_size
+    rows = rows[:page_size]
+
+    results = [{field: decoded(row[ITINERARY_LIST_FIELDS[field]]) for field in fields} for row in rows]
+    next_cursor = encode_cursor(rows[-1]['created_at'], rows[-1]['id']) if has_more else None
+    return {'results': results, 'next_cursor': next_cursor}
+
+
+def parse_summary_filters(params):
+    """Parse the destination / start date / budget filters of the summary listing into lookups."""
+    lookups = {}
+    if params.get('destination'):
+        lookups['destination_key'] = normalize_destination(params['destination'])
+    parsers = [
+        ('start_from', 'start_date__gte', date.fromisoformat),
+        ('start_to', 'start_date__lte', date.fromisoformat),
+        # Trips whose budget range overlaps [budget_min, budget_max]
+        ('budget_min', 'budget_max__gte', Decimal),
+        ('budget_max', 'budget_min__lte', Decimal),
+    ]
+    for param, lookup, parse in parsers:
+        if params.get(param):
+            try:
+                lookups[lookup] = parse(params[param])
+            except (ValueError, InvalidOperation):
+                raise InvalidPageRequest(f"Invalid {param}")
+    return lookups
+
+
+def paginate_summaries(queryset, ordering=None, cursor=None, page_size=None):
+    """Return one keyset page of ItinerarySummary rows.
+
+    ``ordering`` is a SUMMARY_ORDERINGS key, '-' prefixed for descending
+    (default '-created_at'). Rows without a value for the sort key (e.g. an
+    unparsed budget) are left out of that ordering.
+    """
+    ordering = ordering or '-created_at'
+    descending = ordering.startswith('-')
+    if ordering.lstrip('-') not in SUMMARY_ORDERINGS:
+        raise InvalidPageRequest(f"Unknown ordering: {ordering}")
+    field, parse_value = SUMMARY_ORDERINGS[ordering.lstrip('-')]
+    page_size = page_size or settings.ITINERARY_PAGE_SIZE
+    sign = '-' if descending else ''
+
+    queryset = queryset.filter(**{f'{field}__isnull': False}).order_by(f'{sign}{field}', f'{sign}itinerary_id')
+    if cursor:
+        try:
+            padded = cursor + '=' * (-len(cursor) % 4)
+            value, pk = base64.urlsafe_b64decode(padded.encode()).decode().rsplit('|', 1)
+            value, pk = parse_value(value), int(pk)
+        except (ValueError, UnicodeDecodeError, InvalidOperation):
+            raise InvalidPageRequest('Invalid cursor')
+        after = 'lt' if descending else 'gt'
+        queryset = queryset.filter(Q(**{f'{field}__{after}': value}) | Q(**{field: value, f'itinerary_id__{after}': pk}))
+
+    rows = list(queryset.values(*set(SUMMARY_LIST_FIELDS.values()) | {field})[:page_size + 1])
+    has_more = len(rows) > page_size
+    rows = rows[:page_size]
+
+    results = [{name: row[column] for name, column in SUMMARY_LIST_FIELDS.items()} for row in rows]
+    next_cursor = None
+    if has_more:
+        last = rows[-1][field]
+        raw = f"{last.isoformat() if hasattr(last, 'isoformat') else last}|{rows[-1]['itinerary_id']}"
+        next_cursor = base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+    return {'results': results, 'next_cursor': next_cursor}
+
+
+# Index rows fetched per query while collecting a page of distinct itineraries
+PLACE_ROWS_PER_ITINERARY = 4
+
+
+def paginate_places(queryset, cursor=None, page_size=None):
+    """Return one keyset page of itineraries from ItineraryPlace matches ordered by -id.
+
+    Each itinerary is listed once, by its newest matching row, however often
+    it mentions the place. An itinerary's rows are written together, so its
+    matches are adjacent in id order and the cursor (the id the next page
+    starts below) never splits them.
+    """
+    page_size = page_size or settings.ITINERARY_PAGE_SIZE
+    if cursor:
+        try:
+            padded = cursor + '=' * (-len(cursor) % 4)
+            before = int(base64.urlsafe_b64decode(padded.encode()).decode())
+        except (ValueError, UnicodeDecodeError):
+            raise InvalidPageRequest('Invalid cursor')
+        queryset = queryset.filter(id__lt=before)
+
+    chunk = (page_size + 1) * PLACE_ROWS_PER_ITINERARY
+    rows = []
+    seen = set()
+    remaining = queryset
+    while len(rows) <= page_size:
+        batch = list(remaining.values('id', *PLACE_LIST_FIELDS.values())[:chunk])
+        for row in batch:
+            if row['itinerary_id'] not in seen:
+                seen.add(row['itinerary_id'])
+                rows.append(row)
+        if len(batch) < chunk:
+            break
+        remaining = queryset.filter(id__lt=batch[-1]['id'])
+    has_more = len(rows) > page_size
+
+    results = [{name: row[column] for name, column in PLACE_LIST_FIELDS.items()} for row in rows[:page_size]]
+    next_cursor = None
+    if has_more:
+        # The next page starts at (and includes) the first row of the next itinerary
+        raw = str(rows[page_size]['id'] + 1)
+        next_cursor = base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+    return {'results': results, 'next_cursor': next_cursor}
@@ -1,3 +1,4 @@
+from django.conf import settings
 from rest_framework import serializers
 from .models import UserPreference, Itinerary
 
@@ -24,7 +25,36 @@ class UserPreferenceSerializer(serializers.ModelSerializer):
 
 class ItinerarySerializer(serializers.ModelSerializer):
     """Serializer for travel itineraries"""
+    itinerary_data = serializers.JSONField()
+
     class Meta:
         model = Itinerary
         fields = ['id', 'user', 'preference', 'itinerary_data', 'created_at']
         read_only_fields = ['id', 'user', 'created_at']
+
+class ItineraryVariantsSerializer(serializers.Serializer):
+    """Base preferences plus per-variant overrides for batch generation"""
+    base = serializers.DictField()
+    variants = serializers.ListField(child=serializers.DictField(), min_length=1)
+
+    def validate_variants(self, value):
+        if len(value) > settings.ITINERARY_MAX_VARIANTS:
+            raise serializers.ValidationError(f"At most {settings.ITINERARY_MAX_VARIANTS} variants are allowed")
+        return value
+
+    def validate(self, attrs):
+        """Merge each override into the base and validate it as a UserPreference"""
+        variants = []
+        errors = {}
+        for index, override in enumerate(attrs['variants']):
+            override = dict(override)
+            label = str(override.pop('label', '') or f"variant-{index + 1}")
+            preference = UserPreferenceSerializer(data={**attrs['base'], **override})
+            if preference.is_valid():
+                variants.append((label, preference.validated_data))
+            else:
+                errors[label] = preference.errors
+        if errors:
+            raise serializers.ValidationError({'variants': errors})
+        attrs['variants'] = variants
+        return attrs
@@ -0,0 +1,295 @@
+import asyncio
+import dataclasses
+import gzip
+import hashlib
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+from collections import defaultdict
+
+from django.conf import settings
+from googlemaps.exceptions import ApiError
+
+from .stand_ins import CountingTransport
+
+logger = logging.getLogger(__name__)
+
+MODE_OFF = 'off'
+MODE_RECORD = 'record'
+MODE_REPLAY = 'replay'
+MODES = [MODE_OFF, MODE_RECORD, MODE_REPLAY]
+
+# Responses kept per request; replays cycle through them
+MAX_INTERACTIONS = 10
+
+# googlemaps.Client methods the app calls
+MAPS_ENDPOINTS = ('geocode', 'find_place', 'place', 'places_nearby')
+
+
+class CassetteMiss(LookupError):
+    """Raised in replay mode for a request that was never recorded."""
+
+
+def _jsonable(value):
+    if dataclasses.is_dataclass(value):
+        value = dataclasses.asdict(value)
+    return json.loads(json.dumps(value, sort_keys=True, default=str))
+
+
+def normalize_gemini_request(model_name, prompt, kwargs):
+    """Request identity for a Gemini call: model, whitespace-collapsed prompt and generation config.
+
+    ``stream`` is left out so streamed and plain calls for one prompt share a recording.
+    """
+    return {
+        'model': model_name,
+        'prompt': ' '.join(str(prompt).split()),
+        'generation_config': _jsonable(kwargs.get('generation_config')),
+    }
+
+
+def normalize_maps_request(endpoint, args, kwargs):
+    """Request identity for a Maps call: endpoint plus its arguments, strings whitespace-collapsed."""
+    def clean(value):
+        if isinstance(value, str):
+            return ' '.join(value.split())
+        if isinstance(value, (list, tuple)):
+            return [clean(item) for item in value]
+        if isinstance(value, dict):
+            return {key: clean(item) for key, item in value.items()}
+        return value
+    return {'endpoint': endpoint, 'args': _jsonable(clean(list(args))), 'kwargs': _jsonable(clean(kwargs))}
+
+
+class CassetteStore:
+    """Content-addressed request/response store: one gzipped JSON file per normalized request."""
+
+    def __init__(self, directory):
+        self.directory = directory
+        self._lock = threading.Lock()
+        self._replay_positions = defaultdict(int)
+
+    @staticmethod
+    def key(provider, request):
+        canonical = json.dumps({'provider': provider, 'request': request}, sort_keys=True, separators=(',', ':'))
+        return hashlib.sha256(canonical.encode()).hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.directory, key[:2], f"{key}.json.gz")
+
+    def _read(self, key):
+        try:
+            with gzip.open(self._path(key), 'rt', encoding='utf-8') as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+
+    def record(self, provider, request, interaction):
+        """Append an interaction ({'response' or 'error', 'seconds'}) to the request's recording."""
+        key = self.key(provider, request)
+        path = self._path(key)
+        with self._lock:
+            entry = self._read(key) or {'provider': provider, 'request': request, 'interactions': []}
+            entry['interactions'] = (entry['interactions'] + [interaction])[-MAX_INTERACTIONS:]
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            # Write to a temp file and rename so concurrent readers never see a partial file
+            fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+            with os.fdopen(fd, 'wb') as raw, gzip.GzipFile(fileobj=raw, mode='wb', mtime=0) as f:
+                f.write(json.dumps(entry, ensure_ascii=False, separators=(',', ':')).encode())
+            os.replace(tmp_path, path)
+
+    def replay(self, provider, request):
+        """Return the next recorded interaction for the request, cycling when there are several."""
+        key = self.key(provider, request)
+        entry = self._read(key)
+        if not entry or not entry['interactions']:
+            logger.warning("Cassette miss", extra={'provider': provider, 'key': key, 'request': request})
+            raise CassetteMiss(f"No {provider} recording for request {key[:12]}")
+        with self._lock:
+            position = self._replay_positions[key]
+            self._replay_positions[key] = position + 1
+        interactions = entry['interactions']
+        return interactions[position % len(interactions)]
+
+
+_stores = {}
+_stores_lock = threading.Lock()
+
+
+def get_store(directory=None):
+    """Shared CassetteStore for a directory (CASSETTE_DIR by default)."""
+    directory = directory or settings.CASSETTE_DIR
+    with _stores_lock:
+        store = _stores.get(directory)
+        if store is None:
+            store = _stores[directory] = CassetteStore(directory)
+        return store
+
+
+def _replay_delay(seconds, time_scale):
+    return max(0.0, seconds * (settings.CASSETTE_TIME_SCALE if time_scale is None else time_scale))
+
+
+class CassetteResponse:
+    """Minimal stand-in for a Gemini response: ``text`` and chunk iteration."""
+
+    def __init__(self, text, chunks=None, chunk_delay=0.0):
+        self.text = text
+        self._chunks = chunks or [text]
+        self._chunk_delay = chunk_delay
+
+    def __iter__(self):
+        for index, chunk in enumerate(self._chunks):
+            if index:
+                time.sleep(self._chunk_delay)
+            yield CassetteResponse(chunk)
+
+
+class _RecordedStream:
+    """Passes a streamed Gemini response through, recording it once fully consumed."""
+
+    def __init__(self, response, on_complete):
+        self._response = response
+        self._on_complete = on_complete
+
+    def __iter__(self):
+        chunks = []
+        for chunk in self._response:
+            chunks.append(chunk.text)
+            yield chunk
+        self._on_complete(chunks)
+
+    def __getattr__(self, name):
+        return getattr(self._response, name)
+
+
+class CassetteGeminiModel(CountingTransport):
+    """GenerativeModel transport that records calls to ``model`` or replays them from ``store``.
+
+    In replay mode ``model`` may be None: nothing reaches the network. Replays
+    wait the recorded latency times ``time_scale`` (CASSETTE_TIME_SCALE by default).
+    """
+
+    def __init__(self, model, model_name, store, mode, time_scale=None):
+        super().__init__()
+        self.model = model
+        self.model_name = model_name
+        self.store = store
+        self.mode = mode
+        self.time_scale = time_scale
+
+    def _request(self, prompt, kwargs):
+        return normalize_gemini_request(self.model_name, prompt, kwargs)
+
+    def _replay(self, request):
+        interaction = self.store.replay('gemini', request)
+        return interaction, _replay_delay(interaction['seconds'], self.time_scale)
+
+    def generate_content(self, prompt, **kwargs):
+        self._record('generate_content')
+        request = self._request(prompt, kwargs)
+        if self.mode == MODE_REPLAY:
+            interaction, delay = self._replay(request)
+            if kwargs.get('stream'):
+                chunks = interaction.get('chunks') or [interaction['response']]
+                # First chunk after its share of the latency, the rest spread evenly
+                time.sleep(delay / len(chunks))
+                return CassetteResponse(interaction['response'], chunks, delay / len(chunks))
+            time.sleep(delay)
+            return CassetteResponse(interaction['response'])
+
+        started = time.perf_counter()
+        response = self.model.generate_content(prompt, **kwargs)
+        if kwargs.get('stream'):
+            def complete(chunks):
+                self.store.record('gemini', request, {
+                    'response': ''.join(chunks), 'chunks': chunks, 'seconds': time.perf_counter() - started,
+                })
+            return _RecordedStream(response, complete)
+        self.store.record('gemini', request, {'response': response.text, 'seconds': time.perf_counter() - started})
+        return response
+
+    async def generate_content_async(self, prompt, **kwargs):
+        self._record('generate_content')
+        request = self._request(prompt, kwargs)
+        if self.mode == MODE_REPLAY:
+            interaction, delay = self._replay(request)
+            await asyncio.sleep(delay)
+            return CassetteResponse(interaction['response'])
+
+        started = time.perf_counter()
+        response = await self.model.generate_content_async(prompt, **kwargs)
+        self.store.record('gemini', request, {'response': response.text, 'seconds': time.perf_counter() - started})
+        return response
+
+    def __getattr__(self, name):
+        # Anything else (count_tokens, ...) goes straight to the real model
+        if self.model is None:
+            raise AttributeError(f"{name} is not available while replaying")
+        return getattr(self.model, name)
+
+
+class CassetteMapsClient(CountingTransport):
+    """googlemaps.Client transport that records calls to ``client`` or replays them from ``store``.
+
+    ApiError answers (e.g. an invalid place ID) are recorded and re-raised on
+    replay; network errors are not recorded.
+    """
+
+    def __init__(self, client, store, mode, time_scale=None):
+        super().__init__()
+        self.client = client
+        self.store = store
+        self.mode = mode
+        self.time_scale = time_scale
+
+    def _call(self, endpoint, args, kwargs):
+        self._record(endpoint)
+        request = normalize_maps_request(endpoint, args, kwargs)
+        if self.mode == MODE_REPLAY:
+            interaction = self.store.replay('maps', request)
+            time.sleep(_replay_delay(interaction['seconds'], self.time_scale))
+            if 'error' in interaction:
+                raise ApiError(interaction['error']['status'], interaction['error']['message'])
+            return interaction['response']
+
+        started = time.perf_counter()
+        try:
+            response = getattr(self.client, endpoint)(*args, **kwargs)
+        except ApiError as e:
+            self.store.record('maps', request, {
+                'error': {'status': e.status, 'message': e.message}, 'seconds': time.perf_counter() - started,
+            })
+            raise
+        self.store.record('maps', request, {'response': _jsonable(response), 'seconds': time.perf_counter() - started})
+        return response
+
+    def __getattr__(self, name):
+        if name in MAPS_ENDPOINTS:
+            return lambda *args, **kwargs: self._call(name, args, kwargs)
+        if self.client is None:
+            raise AttributeError(f"{name} is not available while replaying")
+        return getattr(self.client, name)
+
+
+def gemini_transport(model_name, build):
+    """Wrap the model built by ``build()`` according to CASSETTE_MODE (replay never builds it)."""
+    mode = settings.CASSETTE_MODE
+    if mode == MODE_REPLAY:
+        return CassetteGeminiModel(None, model_name, get_store(), mode)
+    if mode == MODE_RECORD:
+        return CassetteGeminiModel(build(), model_name, get_store(), mode)
+    return build()
+
+
+def maps_transport(build):
+    """Wrap the client built by ``build()`` according to CASSETTE_MODE (replay never builds it)."""
+    mode = settings.CASSETTE_MODE
+    if mode == MODE_REPLAY:
+        return CassetteMapsClient(None, get_store(), mode)
+    if mode == MODE_RECORD:
+        return CassetteMapsClient(build(), get_store(), mode)
+    return build()
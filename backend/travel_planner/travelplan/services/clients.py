@@ -0,0 +1,130 @@
+import logging
+import threading
+from contextlib import contextmanager
+
+import google.generativeai as genai
+import googlemaps
+import requests
+from django.conf import settings
+from requests.adapters import HTTPAdapter
+
+from . import cassette
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_GEMINI_MODEL = 'gemini-2.0-flash'
+
+# Process-wide clients, created on first use
+_lock = threading.Lock()
+_gemini_configured = False
+_gemini_models = {}
+_maps_client = None
+
+
+def get_gemini_model(model_name=DEFAULT_GEMINI_MODEL):
+    """Return the shared GenerativeModel, configuring the SDK once per process.
+
+    With CASSETTE_MODE set the model is wrapped to record or replay its traffic.
+    """
+    global _gemini_configured
+    model = _gemini_models.get(model_name)
+    if model is not None:
+        return model
+    with _lock:
+        if not _gemini_configured:
+            genai.configure(api_key=settings.GEMINI_API_KEY)
+            _gemini_configured = True
+        model = _gemini_models.get(model_name)
+        if model is None:
+            model = _gemini_models[model_name] = cassette.gemini_transport(
+                model_name, lambda: genai.GenerativeModel(model_name)
+            )
+        return model
+
+
+def build_http_session(pool_size):
+    """Keep-alive requests session whose connection pool fits pool_size concurrent callers."""
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    return session
+
+
+def get_maps_client():
+    """Return the shared googlemaps.Client, built with a pooled keep-alive session.
+
+    With CASSETTE_MODE set the client is wrapped to record or replay its traffic.
+    """
+    global _maps_client
+    client = _maps_client
+    if client is not None:
+        return client
+    with _lock:
+        if _maps_client is None:
+            _maps_client = cassette.maps_transport(lambda: googlemaps.Client(
+                key=settings.GOOGLE_MAPS_API_KEY,
+                requests_session=build_http_session(settings.MAPS_HTTP_POOL_SIZE),
+                timeout=settings.MAPS_HTTP_TIMEOUT,
+            ))
+        return _maps_client
+
+
+def reset_clients():
+    """Drop the cached clients so the next call rebuilds them (e.g. after a settings change)."""
+    global _gemini_configured, _maps_client
+    with _lock:
+        _gemini_configured = False
+        _gemini_models.clear()
+        session = getattr(_maps_client, 'session', None)
+        if session is not None:
+            session.close()
+        _maps_client = None
+
+
+@contextmanager
+def override_clients(gemini_model=None, maps_client=None):
+    """Serve the given stand-ins from get_gemini_model / get_maps_client (benchmarks, replays).
+
+    The previously cached clients are restored on exit.
+    """
+    global _gemini_configured, _maps_client
+    with _lock:
+        saved = _gemini_configured, dict(_gemini_models), _maps_client
+        if gemini_model is not None:
+            _gemini_configured = True
+            _gemini_models.clear()
+            _gemini_models[DEFAULT_GEMINI_MODEL] = gemini_model
+        if maps_client is not None:
+            _maps_client = maps_client
+    try:
+        yield
+    finally:
+        with _lock:
+            _gemini_configured, models, _maps_client = saved
+            _gemini_models.clear()
+            _gemini_models.update(models)
+
+
+def warm_up_clients():
+    """Build the clients and open their connections ahead of the first request.
+
+    Failures are logged and ignored: a cold client is still usable.
+    """
+    try:
+        client = get_maps_client()
+        client.session.head(client.base_url, timeout=settings.MAPS_HTTP_TIMEOUT)
+    except Exception as e:
+        logger.warning(f"Maps client warm-up failed: {e}")
+    try:
+        get_gemini_model()
+        if settings.GEMINI_API_KEY:
+            genai.get_model(f"models/{DEFAULT_GEMINI_MODEL}")
+    except Exception as e:
+        logger.warning(f"Gemini client warm-up failed: {e}")
+
+
+def warm_up_on_boot():
+    """Warm the clients at server/worker boot when CLIENT_WARMUP_ON_BOOT is set."""
+    if settings.CLIENT_WARMUP_ON_BOOT:
+        warm_up_clients()
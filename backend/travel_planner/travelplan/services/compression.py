@@ -0,0 +1,186 @@
+import json
+import logging
+import re
+import struct
+import threading
+import time
+import zlib
+from collections import Counter
+
+from django.apps import apps
+from django.conf import settings
+
+try:
+    import zstandard
+except ImportError:  # Optional: itinerary data is zlib-compressed without it
+    zstandard = None
+
+logger = logging.getLogger(__name__)
+
+CODEC_ZLIB = 'zlib'
+CODEC_ZSTD = 'zstd'
+_CODEC_IDS = {CODEC_ZLIB: 1, CODEC_ZSTD: 2}
+_CODEC_NAMES = {codec_id: codec for codec, codec_id in _CODEC_IDS.items()}
+
+# Every encoded value starts with (codec id, dictionary id); dictionary id 0 means no dictionary
+HEADER = struct.Struct('>BI')
+
+# zlib only looks back 32 KiB, so a larger preset dictionary is wasted
+ZLIB_MAX_DICTIONARY_SIZE = 32 * 1024
+# How long a process keeps using the newest dictionary before checking for a newer one
+ACTIVE_DICTIONARY_TTL = 300
+
+# JSON keys and string values, the units a zlib dictionary is assembled from
+_JSON_TOKEN_PATTERN = re.compile(r'"(?:[^"\\]|\\.)*"(?::)?')
+
+_zstd_fallback_logged = False
+
+
+class CompressionError(ValueError):
+    """Raised for a value that cannot be decoded (unknown codec, missing dictionary, corrupt data)."""
+
+
+def available_codecs():
+    return [CODEC_ZLIB] + ([CODEC_ZSTD] if zstandard is not None else [])
+
+
+def configured_codec():
+    """ITINERARY_DATA_CODEC, falling back to zlib when zstandard is not installed."""
+    codec = settings.ITINERARY_DATA_CODEC
+    if codec not in _CODEC_IDS:
+        raise CompressionError(f"Unknown ITINERARY_DATA_CODEC {codec!r}")
+    if codec == CODEC_ZSTD and zstandard is None:
+        global _zstd_fallback_logged
+        if not _zstd_fallback_logged:
+            logger.warning("zstandard is not installed; compressing itinerary data with zlib")
+            _zstd_fallback_logged = True
+        return CODEC_ZLIB
+    return codec
+
+
+def compress(raw, codec, dictionary=None, level=None):
+    """Compress bytes with a codec and an optional preset dictionary (headerless)."""
+    level = settings.ITINERARY_DATA_COMPRESSION_LEVEL if level is None else level
+    if codec == CODEC_ZSTD:
+        dict_data = zstandard.ZstdCompressionDict(dictionary) if dictionary else None
+        return zstandard.ZstdCompressor(level=level, dict_data=dict_data).compress(raw)
+    compressor = zlib.compressobj(level, zdict=dictionary) if dictionary else zlib.compressobj(level)
+    return compressor.compress(raw) + compressor.flush()
+
+
+def decompress(data, codec, dictionary=None):
+    """Inverse of compress()."""
+    if codec == CODEC_ZSTD:
+        if zstandard is None:
+            raise CompressionError('Value is zstd-compressed but zstandard is not installed')
+        dict_data = zstandard.ZstdCompressionDict(dictionary) if dictionary else None
+        return zstandard.ZstdDecompressor(dict_data=dict_data).decompress(data)
+    decompressor = zlib.decompressobj(zdict=dictionary) if dictionary else zlib.decompressobj()
+    return decompressor.decompress(data) + decompressor.flush()
+
+
+_dictionaries = {}  # Dictionary id -> bytes; rows are immutable, so never invalidated
+_active = {}  # Codec -> (checked at, dictionary id, bytes)
+_cache_lock = threading.Lock()
+
+
+def _dictionary_model():
+    # Looked up lazily: models.py imports this module through the field
+    return apps.get_model('travelplan', 'CompressionDictionary')
+
+
+def get_dictionary(dictionary_id):
+    """Bytes of a stored CompressionDictionary, cached for the life of the process."""
+    with _cache_lock:
+        if dictionary_id in _dictionaries:
+            return _dictionaries[dictionary_id]
+    data = _dictionary_model().objects.filter(pk=dictionary_id).values_list('data', flat=True).first()
+    if data is None:
+        raise CompressionError(f"Compression dictionary {dictionary_id} does not exist")
+    with _cache_lock:
+        _dictionaries[dictionary_id] = bytes(data)
+    return _dictionaries[dictionary_id]
+
+
+def active_dictionary(codec):
+    """(id, bytes) of the newest dictionary trained for a codec, or (0, None)."""
+    if not settings.ITINERARY_DATA_DICTIONARY:
+        return 0, None
+    now = time.monotonic()
+    with _cache_lock:
+        cached = _active.get(codec)
+    if cached and now - cached[0] < ACTIVE_DICTIONARY_TTL:
+        return cached[1], cached[2]
+    row = _dictionary_model().objects.filter(codec=codec).order_by('-id').values_list('id', 'data').first()
+    dictionary_id, data = (row[0], bytes(row[1])) if row else (0, None)
+    with _cache_lock:
+        _active[codec] = (now, dictionary_id, data)
+        if dictionary_id:
+            _dictionaries[dictionary_id] = data
+    return dictionary_id, data
+
+
+def clear_dictionary_cache():
+    with _cache_lock:
+        _dictionaries.clear()
+        _active.clear()
+
+
+def dumps(value):
+    return json.dumps(value, ensure_ascii=False, separators=(',', ':')).encode()
+
+
+def encode(value):
+    """JSON-serialize and compress a value with the configured codec and active dictionary."""
+    codec = configured_codec()
+    dictionary_id, dictionary = active_dictionary(codec)
+    return HEADER.pack(_CODEC_IDS[codec], dictionary_id) + compress(dumps(value), codec, dictionary)
+
+
+def decode(data):
+    """Inverse of encode(). Plain JSON (rows written before compression) is accepted as is."""
+    data = bytes(data)
+    if data[:1] in (b'{', b'['):
+        return json.loads(data)
+    if len(data) < HEADER.size:
+        raise CompressionError('Value is too short to be compressed JSON')
+    codec_id, dictionary_id = HEADER.unpack_from(data)
+    codec = _CODEC_NAMES.get(codec_id)
+    if codec is None:
+        raise CompressionError(f"Unknown codec id {codec_id}")
+    dictionary = get_dictionary(dictionary_id) if dictionary_id else None
+    try:
+        raw = decompress(data[HEADER.size:], codec, dictionary)
+    except CompressionError:
+        raise
+    except Exception as e:  # zlib.error or zstandard.ZstdError
+        raise CompressionError(f"Corrupt {codec} value: {e}") from e
+    return json.loads(raw)
+
+
+def train_dictionary(samples, codec, size):
+    """Build a preset dictionary from serialized sample values.
+
+    zstd uses its own trainer. For zlib the dictionary is the JSON keys and
+    strings that recur across samples, the most valuable last since zlib
+    reaches the end of the dictionary with the shortest back-references.
+    """
+    if codec == CODEC_ZSTD:
+        if zstandard is None:
+            raise CompressionError('zstandard is not installed')
+        return zstandard.train_dictionary(size, samples).as_bytes()
+
+    size = min(size, ZLIB_MAX_DICTIONARY_SIZE)
+    document_counts = Counter()
+    for sample in samples:
+        document_counts.update(set(_JSON_TOKEN_PATTERN.findall(sample.decode('utf-8', 'replace'))))
+    # Tokens seen in a single sample would not help the next one
+    tokens = [(count * len(token), token) for token, count in document_counts.items() if count > 1]
+    chosen, used = [], 0
+    for _, token in sorted(tokens, reverse=True):
+        encoded = token.encode()
+        if used + len(encoded) > size:
+            continue
+        chosen.append(encoded)
+        used += len(encoded)
+    return b''.join(reversed(chosen))
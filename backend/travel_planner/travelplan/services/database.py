@@ -0,0 +1,76 @@
+import functools
+import logging
+import random
+import time
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, OperationalError, transaction
+
+from . import metrics
+
+logger = logging.getLogger(__name__)
+
+# SQLite's messages for SQLITE_BUSY / SQLITE_LOCKED
+_LOCK_MESSAGES = ('database is locked', 'database table is locked', 'database schema is locked')
+
+
+def production_pragmas():
+    """PRAGMA statements of the SQLite production profile, from settings."""
+    return [
+        # Readers no longer block the writer (nor it them); persistent in the database file
+        'PRAGMA journal_mode=WAL',
+        # Durable at checkpoints rather than every commit, which is safe with WAL
+        'PRAGMA synchronous=NORMAL',
+        f'PRAGMA busy_timeout={int(settings.SQLITE_BUSY_TIMEOUT_MS)}',
+        f'PRAGMA mmap_size={int(settings.SQLITE_MMAP_SIZE)}',
+        # A negative cache_size is in KiB rather than pages
+        f'PRAGMA cache_size=-{int(settings.SQLITE_CACHE_SIZE_KB)}',
+    ]
+
+
+def configure_connection(sender, connection, **kwargs):
+    """connection_created receiver applying the production profile to new SQLite connections."""
+    if connection.vendor != 'sqlite' or not settings.SQLITE_PRODUCTION:
+        return
+    with connection.cursor() as cursor:
+        for pragma in production_pragmas():
+            cursor.execute(pragma)
+
+
+def is_lock_error(error):
+    return isinstance(error, OperationalError) and any(message in str(error) for message in _LOCK_MESSAGES)
+
+
+def retry_on_lock(func=None, *, using=DEFAULT_DB_ALIAS):
+    """Retry a short write transaction that fails with "database is locked".
+
+    Up to DB_LOCK_RETRY_ATTEMPTS attempts, sleeping an exponential backoff
+    with jitter (DB_LOCK_RETRY_BACKOFF doubling up to DB_LOCK_RETRY_MAX_BACKOFF)
+    between them. Inside an outer atomic block the error is re-raised at once:
+    the whole outer transaction has to be retried, not a statement of it.
+    The wrapped function must be safe to run again from the start.
+    """
+    if func is None:
+        return functools.partial(retry_on_lock, using=using)
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        attempts = max(1, settings.DB_LOCK_RETRY_ATTEMPTS)
+        for attempt in range(1, attempts + 1):
+            try:
+                return func(*args, **kwargs)
+            except OperationalError as e:
+                if not is_lock_error(e) or transaction.get_connection(using).in_atomic_block:
+                    raise
+                labels = {'operation': func.__name__}
+                if attempt == attempts:
+                    metrics.increment('db_lock_failures_total', labels)
+                    raise
+                metrics.increment('db_lock_retries_total', labels)
+                backoff = min(settings.DB_LOCK_RETRY_MAX_BACKOFF, settings.DB_LOCK_RETRY_BACKOFF * 2 ** (attempt - 1))
+                delay = random.uniform(backoff / 2, backoff)
+                logger.warning("Database locked, retrying", extra={
+                    'operation': func.__name__, 'attempt': attempt, 'delay': round(delay, 3),
+                })
+                time.sleep(delay)
+    return wrapper
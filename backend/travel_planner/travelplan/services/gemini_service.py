@@ -1,26 +1,154 @@
-import json
+import functools
+import time
 import google.generativeai as genai
 from django.conf import settings
-from .prompt_service import get_unstructured_itinerary_prompt, get_structured_itinerary_prompt
+from .prompt_service import (
+    get_unstructured_itinerary_prompt, get_structured_itinerary_prompt, get_single_call_itinerary_prompt,
+)
+from .clients import get_gemini_model
+from ..log import payload_fields
+from . import metrics
+from .json_repair import JSONExtractionError, parse_json_object
+from .rate_limit import PROVIDER_GEMINI, acquire, acquire_async
+from .resilience import get_gemini_caller
 import logging
-import re
 
 logger = logging.getLogger(__name__)
 
+STRATEGY_TWO_STAGE = 'two_stage'
+STRATEGY_SINGLE_CALL = 'single_call'
+STRATEGIES = [STRATEGY_TWO_STAGE, STRATEGY_SINGLE_CALL]
+
+# Response schema for the single-call mode, mirroring STRUCTURED_ITINERARY_FORMAT
+ITINERARY_RESPONSE_SCHEMA = {
+    'type': 'object',
+    'properties': {
+        'tripName': {'type': 'string'},
+        'duration': {'type': 'string'},
+        'groupSize': {'type': 'integer'},
+        'travelStyle': {'type': 'string'},
+        'season': {'type': 'string'},
+        'startPoint': {'type': 'string'},
+        'endPoint': {'type': 'string'},
+        'itinerary': {
+            'type': 'array',
+            'items': {
+                'type': 'object',
+                'properties': {
+                    'day': {'type': 'integer'},
+                    'title': {'type': 'string'},
+                    'schedule': {
+                        'type': 'array',
+                        'items': {
+                            'type': 'object',
+                            'properties': {
+                                'time': {'type': 'string'},
+                                'activity': {'type': 'string'},
+                                'costPerPerson': {'type': 'string'},
+                                'placeId': {'type': 'string'},
+                            },
+                        },
+                    },
+                },
+            },
+        },
+        'hotelRecommendations': {
+            'type': 'array',
+            'items': {
+                'type': 'object',
+                'properties': {
+                    'category': {'type': 'string'},
+                    'options': {'type': 'array', 'items': {'type': 'string'}},
+                    'placeId': {'type': 'string'},
+                },
+            },
+        },
+        'hotelCostEstimate': {
+            'type': 'object',
+            'properties': {
+                'costPerRoomPerNight': {'type': 'string'},
+                'assumptions': {'type': 'string'},
+                'costPerPerson': {'type': 'string'},
+            },
+        },
+        'budgetCalculation': {
+            'type': 'object',
+            'properties': {
+                'transportation': {'type': 'object', 'properties': {'totalTransportation': {'type': 'string'}}},
+                'accommodation': {'type': 'string'},
+                'food': {'type': 'object', 'properties': {'totalFood': {'type': 'string'}}},
+                'activitiesEntryFees': {'type': 'string'},
+                'miscellaneous': {'type': 'string'},
+                'totalEstimatedBudgetPerPerson': {'type': 'string'},
+            },
+        },
+        'importantNotesAndTips': {'type': 'array', 'items': {'type': 'string'}},
+    },
+}
+
+def json_generation_config():
+    """Gemini JSON response mode, when the installed SDK supports it.
+
+    response_mime_type / response_schema arrived in later google-generativeai
+    releases; on older ones the single-call prompt alone asks for JSON.
+    """
+    fields = getattr(genai.types.GenerationConfig, '__dataclass_fields__', {})
+    if 'response_mime_type' not in fields:
+        return None
+    config = {'response_mime_type': 'application/json'}
+    if 'response_schema' in fields:
+        config['response_schema'] = ITINERARY_RESPONSE_SCHEMA
+    return genai.types.GenerationConfig(**config)
+
+def log_exchange(stage, prompt, response_text):
+    """One structured record per model exchange; bodies are summarized unless sampled."""
+    if logger.isEnabledFor(logging.INFO):
+        logger.info("Gemini exchange", extra={
+            'stage': stage, **payload_fields('prompt', prompt), **payload_fields('response', response_text),
+        })
+
 class GeminiService:
-    def __init__(self):
-        genai.configure(api_key=settings.GEMINI_API_KEY)
-        self.model = genai.GenerativeModel('gemini-2.0-flash')  # Adjust model name as needed
+    def __init__(self, strategy=None):
+        self.model = get_gemini_model()
+        self.strategy = strategy or settings.GEMINI_GENERATION_STRATEGY
+        self.exchanges = []
+
+    def _generate_content(self, prompt, stage='gemini', **kwargs):
+        """Single funnel for model calls; records each prompt/response exchange.
+
+        Every attempt (including retries and hedges) takes a rate limit token
+        before it starts. The whole call, retries included, is timed as ``stage``.
+        """
+        def attempt():
+            return self.model.generate_content(prompt, **kwargs)
+
+        throttle = functools.partial(acquire, PROVIDER_GEMINI, 'generate_content')
+        started = time.perf_counter()
+        with metrics.timer(stage):
+            response = get_gemini_caller().call(attempt, throttle)
+        if not kwargs.get('stream'):
+            self.exchanges.append({'prompt': prompt, 'text': response.text, 'seconds': time.perf_counter() - started})
+        return response
+
+    async def _generate_content_async(self, prompt, stage='gemini', **kwargs):
+        """Async counterpart of _generate_content."""
+        async def attempt():
+            return await self.model.generate_content_async(prompt, **kwargs)
+
+        throttle = functools.partial(acquire_async, PROVIDER_GEMINI, 'generate_content')
+        started = time.perf_counter()
+        with metrics.timer(stage):
+            response = await get_gemini_caller().call_async(attempt, throttle)
+        self.exchanges.append({'prompt': prompt, 'text': response.text, 'seconds': time.perf_counter() - started})
+        return response
 
     def generate_raw_itinerary(self, preferences):
         """Generate the unstructured itinerary."""
         try:
             prompt = get_unstructured_itinerary_prompt(preferences)
-            print(f"Unstructured prompt sent to Gemini: {prompt}")
-            response = self.model.generate_content(prompt)
+            response = self._generate_content(prompt, stage='gemini_raw')
             raw_itinerary = response.text.strip()
-            print(f"Raw itinerary from Gemini: {raw_itinerary}")
-            logger.debug(f"Unstructured Prompt: {prompt}\nRaw Response: '{raw_itinerary}'")
+            log_exchange('gemini_raw', prompt, raw_itinerary)
             if not raw_itinerary:
                 raise ValueError("Empty response from Gemini API")
             return raw_itinerary
@@ -28,55 +156,139 @@ class GeminiService:
             logger.error(f"Error generating raw itinerary: {str(e)}")
             raise Exception(f"Failed to generate raw itinerary: {str(e)}")
 
+    def stream_raw_itinerary(self, preferences):
+        """Yield the unstructured itinerary text chunk by chunk as Gemini streams it."""
+        try:
+            prompt = get_unstructured_itinerary_prompt(preferences)
+            response = self._generate_content(prompt, stage='gemini_raw', stream=True)
+            for chunk in response:
+                if chunk.text:
+                    yield chunk.text
+        except Exception as e:
+            logger.error(f"Error streaming raw itinerary: {str(e)}")
+            raise Exception(f"Failed to generate raw itinerary: {str(e)}")
+
     def structure_itinerary(self, raw_itinerary, preferences):
         """Restructure the raw itinerary into JSON, enforcing startPoint."""
         try:
             prompt = get_structured_itinerary_prompt(raw_itinerary)
-            print(f"Structured prompt sent to Gemini: {prompt}")
-            response = self.model.generate_content(prompt)
-            response_text = response.text.strip()
-            print(f"Structured response from Gemini: {response_text}")
-            logger.debug(f"Structured Prompt: {prompt}\nRaw Response: '{response_text}'")
-
-            if not response_text:
-                raise ValueError("Empty response from Gemini API")
-
-            try:
-                itinerary_data = json.loads(response_text)
-            except json.JSONDecodeError:
-                json_match = re.search(r'\{.*\}', response_text, re.DOTALL)
-                if json_match:
-                    json_str = json_match.group(0)
-                    logger.debug(f"Extracted JSON: '{json_str}'")
-                    itinerary_data = json.loads(json_str)
-                else:
-                    logger.error(f"Failed to parse JSON: '{response_text}'")
-                    raise ValueError("Invalid JSON response from Gemini API")
-
-            # Forcefully set startPoint to user input
-            original_start_point = itinerary_data.get('startPoint', 'Not set')
-            itinerary_data['startPoint'] = preferences['startPoint']
-            if original_start_point != preferences['startPoint']:
-                print(f"Overrode startPoint from '{original_start_point}' to '{preferences['startPoint']}'")
-
-            # Force first activity to start from user’s startPoint
-            if itinerary_data.get('itinerary') and len(itinerary_data['itinerary']) > 0:
-                first_day = itinerary_data['itinerary'][0]
-                if first_day.get('schedule') and len(first_day['schedule']) > 0:
-                    first_activity = first_day['schedule'][0]['activity']
-                    if "NSS College" in first_activity or not first_activity.startswith(f"Depart from {preferences['startPoint']}"):
-                        new_activity = f"Depart from {preferences['startPoint']} to {preferences['destination']}"
-                        print(f"Overrode first activity from '{first_activity}' to '{new_activity}'")
-                        first_day['schedule'][0]['activity'] = new_activity
-
-            return itinerary_data
-
+            response = self._generate_content(prompt, stage='gemini_structure')
+            return self._parse_structured_itinerary(prompt, response.text.strip(), preferences)
         except Exception as e:
             logger.error(f"Error structuring itinerary: {str(e)}")
             raise Exception(f"Failed to structure itinerary: {str(e)}")
 
+    def _parse_structured_itinerary(self, prompt, response_text, preferences):
+        """Parse the structured response and enforce the user's startPoint."""
+        log_exchange('gemini_structured', prompt, response_text)
+
+        if not response_text:
+            raise ValueError("Empty response from Gemini API")
+
+        try:
+            with metrics.timer('parse_json'):
+                itinerary_data = parse_json_object(response_text)
+        except JSONExtractionError as e:
+            logger.error("Failed to parse JSON from Gemini", extra={
+                'error': str(e), **payload_fields('response', response_text, full=True),
+            })
+            raise ValueError(f"Invalid JSON response from Gemini API: {e}")
+        if not isinstance(itinerary_data, dict):
+            raise ValueError("Invalid JSON response from Gemini API")
+
+        # Forcefully set startPoint to user input
+        original_start_point = itinerary_data.get('startPoint', 'Not set')
+        itinerary_data['startPoint'] = preferences['startPoint']
+        if original_start_point != preferences['startPoint']:
+            logger.info("Overrode startPoint", extra={
+                'original': original_start_point, 'start_point': preferences['startPoint'],
+            })
+
+        # Force first activity to start from user’s startPoint
+        if itinerary_data.get('itinerary') and len(itinerary_data['itinerary']) > 0:
+            first_day = itinerary_data['itinerary'][0]
+            if first_day.get('schedule') and len(first_day['schedule']) > 0:
+                first_activity = first_day['schedule'][0]['activity']
+                if "NSS College" in first_activity or not first_activity.startswith(f"Depart from {preferences['startPoint']}"):
+                    new_activity = f"Depart from {preferences['startPoint']} to {preferences['destination']}"
+                    logger.info("Overrode first activity", extra={'original': first_activity, 'activity': new_activity})
+                    first_day['schedule'][0]['activity'] = new_activity
+
+        return itinerary_data
+
     def generate_itinerary(self, preferences):
+        """Generate the structured itinerary with the configured strategy.
+
+        The single-call strategy falls back to the two-stage pipeline if its
+        response cannot be used.
+        """
+        if self.strategy == STRATEGY_SINGLE_CALL:
+            try:
+                return self.generate_single_call_itinerary(preferences)
+            except Exception as e:
+                logger.warning(f"Single-call generation failed, falling back to two-stage: {str(e)}")
+        return self.generate_two_stage_itinerary(preferences)
+
+    def generate_two_stage_itinerary(self, preferences):
         """Generate and structure the itinerary in two steps."""
         raw_itinerary = self.generate_raw_itinerary(preferences)
         structured_itinerary = self.structure_itinerary(raw_itinerary, preferences)
-        return structured_itinerary
\ No newline at end of file
+        return structured_itinerary
+
+    def generate_single_call_itinerary(self, preferences):
+        """Generate the structured itinerary in one JSON-mode call."""
+        try:
+            prompt = get_single_call_itinerary_prompt(preferences)
+            response = self._generate_content(
+                prompt, stage='gemini_single_call', generation_config=json_generation_config()
+            )
+            return self._parse_structured_itinerary(prompt, response.text.strip(), preferences)
+        except Exception as e:
+            logger.error(f"Error generating single-call itinerary: {str(e)}")
+            raise Exception(f"Failed to generate structured itinerary: {str(e)}")
+
+    async def generate_raw_itinerary_async(self, preferences):
+        """Async variant of generate_raw_itinerary using generate_content_async."""
+        try:
+            prompt = get_unstructured_itinerary_prompt(preferences)
+            response = await self._generate_content_async(prompt, stage='gemini_raw')
+            raw_itinerary = response.text.strip()
+            log_exchange('gemini_raw', prompt, raw_itinerary)
+            if not raw_itinerary:
+                raise ValueError("Empty response from Gemini API")
+            return raw_itinerary
+        except Exception as e:
+            logger.error(f"Error generating raw itinerary: {str(e)}")
+            raise Exception(f"Failed to generate raw itinerary: {str(e)}")
+
+    async def structure_itinerary_async(self, raw_itinerary, preferences):
+        """Async variant of structure_itinerary using generate_content_async."""
+        try:
+            prompt = get_structured_itinerary_prompt(raw_itinerary)
+            response = await self._generate_content_async(prompt, stage='gemini_structure')
+            return self._parse_structured_itinerary(prompt, response.text.strip(), preferences)
+        except Exception as e:
+            logger.error(f"Error structuring itinerary: {str(e)}")
+            raise Exception(f"Failed to structure itinerary: {str(e)}")
+
+    async def generate_itinerary_async(self, preferences):
+        """Generate the structured itinerary without blocking the event loop."""
+        if self.strategy == STRATEGY_SINGLE_CALL:
+            try:
+                return await self.generate_single_call_itinerary_async(preferences)
+            except Exception as e:
+                logger.warning(f"Single-call generation failed, falling back to two-stage: {str(e)}")
+        raw_itinerary = await self.generate_raw_itinerary_async(preferences)
+        return await self.structure_itinerary_async(raw_itinerary, preferences)
+
+    async def generate_single_call_itinerary_async(self, preferences):
+        """Async variant of generate_single_call_itinerary."""
+        try:
+            prompt = get_single_call_itinerary_prompt(preferences)
+            response = await self._generate_content_async(
+                prompt, stage='gemini_single_call', generation_config=json_generation_config()
+            )
+            return self._parse_structured_itinerary(prompt, response.text.strip(), preferences)
+        except Exception as e:
+            logger.error(f"Error generating single-call itinerary: {str(e)}")
+            raise Exception(f"Failed to generate structured itinerary: {str(e)}")
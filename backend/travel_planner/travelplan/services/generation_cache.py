@@ -0,0 +1,58 @@
+import logging
+from datetime import timedelta
+
+from django.conf import settings
+from django.db.models import F
+from django.utils import timezone
+
+from ..models import GeneratedItinerary
+from .database import retry_on_lock
+
+logger = logging.getLogger(__name__)
+
+CACHE_HIT = 'hit'
+CACHE_MISS = 'miss'
+CACHE_BYPASS = 'bypass'
+
+
+def cache_enabled(requested=True):
+    """The cache is used unless disabled globally or the request opted out."""
+    return settings.GENERATION_CACHE_ENABLED and requested
+
+
+def lookup_generation(fingerprint):
+    """Return a fresh cached itinerary for this fingerprint, or None."""
+    now = timezone.now()
+    entry = GeneratedItinerary.objects.filter(fingerprint=fingerprint, expires_at__gt=now).first()
+    if entry is None:
+        return None
+    GeneratedItinerary.objects.filter(pk=entry.pk).update(hits=F('hits') + 1, last_used_at=now)
+    return entry.itinerary_data
+
+
+@retry_on_lock
+def store_generation(fingerprint, itinerary_data):
+    """Cache a generated itinerary, evicting the least recently used entries beyond the size bound."""
+    now = timezone.now()
+    # A single upsert statement, so concurrent writers never upgrade a read lock mid-transaction
+    GeneratedItinerary.objects.bulk_create(
+        [GeneratedItinerary(
+            fingerprint=fingerprint,
+            itinerary_data=itinerary_data,
+            expires_at=now + timedelta(seconds=settings.GENERATION_CACHE_TTL),
+            last_used_at=now,
+        )],
+        update_conflicts=True,
+        unique_fields=['fingerprint'],
+        update_fields=['itinerary_data', 'expires_at', 'last_used_at'],
+    )
+    evict_generations()
+
+
+def evict_generations():
+    """Drop expired entries and the coldest ones beyond GENERATION_CACHE_MAX_ENTRIES."""
+    GeneratedItinerary.objects.filter(expires_at__lte=timezone.now()).delete()
+    excess = GeneratedItinerary.objects.count() - settings.GENERATION_CACHE_MAX_ENTRIES
+    if excess > 0:
+        cold_ids = list(GeneratedItinerary.objects.order_by('last_used_at').values_list('pk', flat=True)[:excess])
+        GeneratedItinerary.objects.filter(pk__in=cold_ids).delete()
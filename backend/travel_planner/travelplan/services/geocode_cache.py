@@ -0,0 +1,105 @@
+import logging
+import re
+import threading
+from datetime import timedelta
+
+from django.conf import settings
+from django.utils import timezone
+
+from ..models import GeocodeCacheEntry
+from . import metrics
+from .database import retry_on_lock
+from .local_cache import LocalTTLCache, MISSING
+
+logger = logging.getLogger(__name__)
+
+_local_cache = LocalTTLCache(max_size=settings.GEOCODE_CACHE_LOCAL_SIZE)
+# Striped locks so concurrent lookups of the same context geocode it only once
+_key_locks = [threading.Lock() for _ in range(64)]
+
+
+def normalize_location(location):
+    """Normalize a free-text location so trivially different spellings share a cache key."""
+    text = (location or '').strip().lower()
+    text = re.sub(r'\s*,\s*', ', ', text)
+    text = re.sub(r'\s+', ' ', text)
+    return text.strip(' ,.')[:255]
+
+
+def _store(key, coords):
+    """Persist a geocode result (or a negative result when coords is None)."""
+    ttl = settings.GEOCODE_CACHE_TTL if coords else settings.GEOCODE_CACHE_NEGATIVE_TTL
+    _local_cache.set(key, coords, ttl)
+    if ttl <= 0:
+        return
+    _save_entry(GeocodeCacheEntry(
+        query=key,
+        lat=coords[0] if coords else None,
+        lng=coords[1] if coords else None,
+        found=coords is not None,
+        expires_at=timezone.now() + timedelta(seconds=ttl),
+    ))
+
+
+@retry_on_lock
+def _save_entry(entry):
+    # A single upsert statement: concurrent writers of one key neither conflict nor upgrade a read lock
+    GeocodeCacheEntry.objects.bulk_create(
+        [entry], update_conflicts=True, unique_fields=['query'], update_fields=['lat', 'lng', 'found', 'expires_at'],
+    )
+
+
+def geocode_location(client, location):
+    """Return (lat, lng) for a location, or None if it cannot be geocoded.
+
+    Lookups go through an in-process LRU, then the shared GeocodeCacheEntry
+    table, and only reach the Maps API on a miss. Negative results are cached
+    for GEOCODE_CACHE_NEGATIVE_TTL seconds; API errors are never cached.
+    """
+    key = normalize_location(location)
+    if not key:
+        return None
+
+    coords = _local_cache.get(key)
+    if coords is not MISSING:
+        metrics.increment('cache_requests_total', {'cache': 'geocode', 'result': 'hit'})
+        return coords
+
+    with _key_locks[hash(key) % len(_key_locks)]:
+        return _geocode_uncached(client, key, location)
+
+
+def _geocode_uncached(client, key, location):
+    coords = _local_cache.get(key)
+    if coords is not MISSING:
+        metrics.increment('cache_requests_total', {'cache': 'geocode', 'result': 'hit'})
+        return coords
+
+    entry = GeocodeCacheEntry.objects.filter(query=key, expires_at__gt=timezone.now()).first()
+    metrics.increment('cache_requests_total', {'cache': 'geocode', 'result': 'hit' if entry else 'miss'})
+    if entry is not None:
+        coords = entry.coordinates()
+        remaining = (entry.expires_at - timezone.now()).total_seconds()
+        _local_cache.set(key, coords, remaining)
+        return coords
+
+    geocode = client.geocode(location)
+    if geocode:
+        location_data = geocode[0]['geometry']['location']
+        coords = (location_data['lat'], location_data['lng'])
+    else:
+        logger.info(f"Failed to geocode context location: {location}")
+        coords = None
+    _store(key, coords)
+    return coords
+
+
+def purge_expired():
+    """Delete expired rows from the shared geocode cache."""
+    deleted, _ = GeocodeCacheEntry.objects.filter(expires_at__lte=timezone.now()).delete()
+    return deleted
+
+
+def clear_local_cache():
+    """Forget this process's in-memory geocode entries (the shared table is untouched)."""
+    _local_cache.clear()
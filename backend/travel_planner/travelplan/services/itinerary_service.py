@@ -0,0 +1,338 @@
+import contextvars
+import logging
+import uuid
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import connections, transaction
+
+from ..log import payload_fields
+from ..models import Itinerary, ItineraryLocation, ItinerarySummary, UserPreference
+from . import metrics
+from .database import retry_on_lock
+from .gemini_service import GeminiService
+from .generation_cache import (
+    CACHE_BYPASS, CACHE_HIT, CACHE_MISS, cache_enabled, lookup_generation, store_generation,
+)
+from .location_service import build_itinerary_locations, resolve_and_save_locations, save_itinerary_locations
+from .maps_service import extract_hotels_and_restaurants, iter_resolve_places, resolve_places
+from .place_index import save_places
+from .rate_limit import rate_limit_user
+from .single_flight import (
+    ROLE_FOLLOWER, ROLE_LEADER, join_flight, publish_result, release_lock, single_flight, single_flight_async,
+)
+from .summary_service import build_summary, save_summaries
+
+
+logger = logging.getLogger(__name__)
+
+def preference_to_prompt_dict(preference):
+    """Convert a saved UserPreference into the dict expected by the prompts."""
+    preference_dict = preference.to_dict()
+    preference_dict['startPoint'] = preference_dict.pop('departure')
+    return preference_dict
+
+
+def enforce_start_point(itinerary_data, start_point):
+    """Make sure the itinerary starts where the user asked it to."""
+    if 'startPoint' not in itinerary_data or itinerary_data['startPoint'] != start_point:
+        logger.info("Forcing startPoint", extra={'start_point': start_point, 'original': itinerary_data.get('startPoint')})
+        itinerary_data['startPoint'] = start_point
+    return itinerary_data
+
+
+def cached_itinerary_data(preference, use_cache=True):
+    """Look the preference's fingerprint up in the generation cache.
+
+    Returns (itinerary_data or None, fingerprint, cache_status).
+    """
+    fingerprint = preference.fingerprint()
+    if not cache_enabled(use_cache):
+        cache_status = CACHE_BYPASS
+        itinerary_data = None
+    else:
+        itinerary_data = lookup_generation(fingerprint)
+        cache_status = CACHE_HIT if itinerary_data is not None else CACHE_MISS
+    metrics.increment('cache_requests_total', {'cache': 'generation', 'result': cache_status})
+    return itinerary_data, fingerprint, cache_status
+
+
+def remember_itinerary_data(fingerprint, cache_status, itinerary_data):
+    """Cache a freshly generated itinerary unless the request bypassed the cache."""
+    if cache_status == CACHE_MISS:
+        store_generation(fingerprint, itinerary_data)
+
+
+def _coalesce(use_cache):
+    return use_cache and settings.GENERATION_SINGLE_FLIGHT_ENABLED
+
+
+def generate_itinerary_data(preference, preference_dict, use_cache=True):
+    """Return (itinerary_data, meta) for a preference.
+
+    Serves identical recent preferences from the generation cache and, on a
+    miss, coalesces concurrent identical requests so only one of them calls
+    Gemini. ``meta`` reports the cache status and single-flight role.
+    """
+    itinerary_data, fingerprint, cache_status = cached_itinerary_data(preference, use_cache)
+    if itinerary_data is not None:
+        return itinerary_data, {'cache': cache_status}
+
+    def generate():
+        return GeminiService().generate_itinerary(preference_dict)
+
+    if _coalesce(use_cache):
+        itinerary_data, role = single_flight(fingerprint, generate)
+        if role == ROLE_LEADER:
+            remember_itinerary_data(fingerprint, cache_status, itinerary_data)
+        return itinerary_data, {'cache': cache_status, 'single_flight': role}
+    itinerary_data = generate()
+    remember_itinerary_data(fingerprint, cache_status, itinerary_data)
+    return itinerary_data, {'cache': cache_status}
+
+
+async def generate_itinerary_data_async(preference, preference_dict, use_cache=True):
+    """Async counterpart of generate_itinerary_data."""
+    itinerary_data, fingerprint, cache_status = await sync_to_async(cached_itinerary_data)(preference, use_cache)
+    if itinerary_data is not None:
+        return itinerary_data, {'cache': cache_status}
+
+    async def generate():
+        return await GeminiService().generate_itinerary_async(preference_dict)
+
+    if _coalesce(use_cache):
+        itinerary_data, role = await single_flight_async(fingerprint, generate)
+        if role == ROLE_LEADER:
+            await sync_to_async(remember_itinerary_data)(fingerprint, cache_status, itinerary_data)
+        return itinerary_data, {'cache': cache_status, 'single_flight': role}
+    itinerary_data = await generate()
+    await sync_to_async(remember_itinerary_data)(fingerprint, cache_status, itinerary_data)
+    return itinerary_data, {'cache': cache_status}
+
+
+@retry_on_lock
+def create_itinerary(preference, itinerary_data):
+    """Save a generated itinerary together with its summary row and place index entries."""
+    with metrics.timer('db_write'), transaction.atomic():
+        itinerary = Itinerary.objects.create(
+            user_id=preference.user_id,
+            preference=preference,
+            itinerary_data=itinerary_data
+        )
+        save_summaries([(itinerary, preference)])
+        save_places([(itinerary, preference)])
+    return itinerary
+
+
+def user_itineraries(user_id):
+    """The user's itineraries, newest first, in the order of the (user, -created_at, -id) index."""
+    return Itinerary.objects.filter(user_id=user_id).order_by('-created_at', '-id')
+
+
+def generation_response_data(itinerary, start_point, hotel_locations, restaurant_locations):
+    """Build the generate-itinerary response for a freshly saved itinerary."""
+    return {
+        'id': itinerary.id,
+        'user': itinerary.user_id,
+        'preference': itinerary.preference_id,
+        'itinerary_data': {
+            **itinerary.itinerary_data,  # Spread existing data
+            'startPoint': start_point  # Force again here
+        },
+        'hotels': hotel_locations,
+        'restaurants': restaurant_locations,
+        'created_at': itinerary.created_at.isoformat()
+    }
+
+
+def detail_response_data(itinerary, hotel_locations, restaurant_locations):
+    """Build the detail=true response for a stored itinerary."""
+    return {
+        'itinerary': itinerary.itinerary_data,
+        'hotels': hotel_locations,
+        'restaurants': restaurant_locations
+    }
+
+
+def run_generation(preference, on_progress=None, use_cache=True):
+    """Run the full generation pipeline for a saved UserPreference.
+
+    Generates the itinerary with Gemini (or reuses a cached one for identical
+    preferences), saves it and resolves its hotels and restaurants.
+    ``on_progress(stage, percent)`` is called between stages. Returns the
+    saved Itinerary and the generate-itinerary response payload. Upstream
+    calls are rate limited on behalf of the preference's user.
+    """
+    with rate_limit_user(preference.user_id):
+        report = on_progress or (lambda stage, percent: None)
+        preference_dict = preference_to_prompt_dict(preference)
+        logger.info("Generating itinerary", extra={'preference_id': preference.pk, 'preferences': preference_dict})
+
+        report('generating', 10)
+        itinerary_data, meta = generate_itinerary_data(preference, preference_dict, use_cache)
+        if logger.isEnabledFor(logging.INFO):
+            logger.info("Itinerary generated", extra={'meta': meta, **payload_fields('itinerary', itinerary_data)})
+        enforce_start_point(itinerary_data, preference_dict['startPoint'])
+
+        report('saving', 70)
+        itinerary = create_itinerary(preference, itinerary_data)
+
+        report('resolving_places', 80)
+        hotel_locations, restaurant_locations = resolve_and_save_locations(itinerary)
+        response_data = generation_response_data(
+            itinerary, preference_dict['startPoint'], hotel_locations, restaurant_locations
+        )
+        response_data['meta'] = meta
+        return itinerary, response_data
+
+
+def _stream_itinerary_data(preference_dict):
+    """Yield ``raw`` events while Gemini streams the itinerary, then return it structured."""
+    gemini_service = GeminiService()
+    chunks = []
+    for chunk in gemini_service.stream_raw_itinerary(preference_dict):
+        chunks.append(chunk)
+        yield 'raw', {'text': chunk}
+    raw_itinerary = ''.join(chunks).strip()
+    if not raw_itinerary:
+        raise ValueError("Empty response from Gemini API")
+    return gemini_service.structure_itinerary(raw_itinerary, preference_dict)
+
+
+def stream_generation(preference, use_cache=True):
+    """Run the generation pipeline, yielding (event, data) pairs as results appear.
+
+    Events are ``raw`` (a chunk of the streamed unstructured itinerary),
+    ``itinerary`` (the saved structured itinerary), ``hotel`` / ``restaurant``
+    (one enriched location, with its index) and finally ``done``. Concurrent
+    identical streams are coalesced like generate_itinerary_data: only the
+    leader streams ``raw`` chunks, followers start at ``itinerary``.
+    """
+    with rate_limit_user(preference.user_id):
+        preference_dict = preference_to_prompt_dict(preference)
+
+        # A cache hit skips the raw stream entirely
+        itinerary_data, fingerprint, cache_status = cached_itinerary_data(preference, use_cache)
+        meta = {'cache': cache_status}
+        if itinerary_data is None:
+            owner, leading = uuid.uuid4().hex, False
+            if _coalesce(use_cache):
+                itinerary_data, leading = join_flight(fingerprint, owner)
+                meta['single_flight'] = ROLE_LEADER if itinerary_data is None else ROLE_FOLLOWER
+            if itinerary_data is None:
+                try:
+                    itinerary_data = yield from _stream_itinerary_data(preference_dict)
+                except BaseException:
+                    # Includes the client going away mid-stream (GeneratorExit)
+                    if leading:
+                        release_lock(fingerprint, owner)
+                    raise
+                if leading:
+                    publish_result(fingerprint, owner, itinerary_data)
+                remember_itinerary_data(fingerprint, cache_status, itinerary_data)
+
+        enforce_start_point(itinerary_data, preference_dict['startPoint'])
+        itinerary = create_itinerary(preference, itinerary_data)
+        yield 'itinerary', {
+            **generation_response_data(itinerary, preference_dict['startPoint'], [], []),
+            'meta': meta,
+        }
+
+        hotels, restaurants = extract_hotels_and_restaurants(itinerary_data)
+        locations = [None] * (len(hotels) + len(restaurants))
+        for index, location in iter_resolve_places(hotels + restaurants):
+            locations[index] = location
+            if index < len(hotels):
+                yield 'hotel', {'index': index, **location}
+            else:
+                yield 'restaurant', {'index': index - len(hotels), **location}
+        save_itinerary_locations(itinerary, hotels, restaurants, locations[:len(hotels)], locations[len(hotels):])
+
+        yield 'done', {'id': itinerary.id}
+
+
+def _generate_variant(preference, use_cache):
+    """Generate one variant on a pool thread, releasing its DB connection afterwards."""
+    try:
+        preference_dict = preference_to_prompt_dict(preference)
+        itinerary_data, meta = generate_itinerary_data(preference, preference_dict, use_cache)
+        enforce_start_point(itinerary_data, preference_dict['startPoint'])
+        return itinerary_data, meta
+    finally:
+        connections.close_all()
+
+
+@retry_on_lock
+def _save_variants(user, preferences, done, generated, extracted, resolved):
+    """Write the successful variants' preferences, itineraries, summaries, places and locations in one transaction."""
+    for index in done:
+        # A retried attempt inserts the preferences afresh; the failed one was rolled back
+        preferences[index].pk = None
+    with metrics.timer('db_write'), transaction.atomic():
+        UserPreference.objects.bulk_create([preferences[index] for index in done])
+        itineraries = Itinerary.objects.bulk_create([
+            Itinerary(user=user, preference=preferences[index], itinerary_data=generated[index][0])
+            for index in done
+        ])
+        ItinerarySummary.objects.bulk_create([
+            build_summary(itinerary, preferences[index]) for index, itinerary in zip(done, itineraries)
+        ])
+        save_places([(itinerary, preferences[index]) for index, itinerary in zip(done, itineraries)])
+        rows = []
+        for index, itinerary in zip(done, itineraries):
+            rows.extend(build_itinerary_locations(itinerary, *extracted[index], *resolved[index]))
+        ItineraryLocation.objects.bulk_create(rows)
+    return itineraries
+
+
+def run_variant_generation(user, preferences, labels, use_cache=True):
+    """Generate several variants of one trip from unsaved UserPreferences.
+
+    Variants are generated concurrently, at most ITINERARY_VARIANT_CONCURRENCY
+    at a time. Their hotels and restaurants are resolved in one shared pass,
+    so places that appear in several variants are looked up once. Preferences,
+    itineraries, summaries, place index rows and locations of the successful
+    variants are then written in a single transaction with bulk_create. Returns (results, errors).
+    """
+    with rate_limit_user(user.id):
+        generated = [None] * len(preferences)
+        failures = {}
+        workers = max(1, min(settings.ITINERARY_VARIANT_CONCURRENCY, len(preferences)))
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='variants') as executor:
+            futures = {
+                executor.submit(contextvars.copy_context().run, _generate_variant, preference, use_cache): index
+                for index, preference in enumerate(preferences)
+            }
+            for future in as_completed(futures):
+                index = futures[future]
+                try:
+                    generated[index] = future.result()
+                except Exception as e:
+                    failures[index] = str(e)
+        done = [index for index, result in enumerate(generated) if result is not None]
+
+        extracted = {index: extract_hotels_and_restaurants(generated[index][0]) for index in done}
+        with metrics.timer('place_resolution'):
+            locations = iter(resolve_places([
+                entry for index in done for entries in extracted[index] for entry in entries
+            ]))
+        resolved = {}
+        for index in done:
+            hotels, restaurants = extracted[index]
+            resolved[index] = [next(locations) for _ in hotels], [next(locations) for _ in restaurants]
+
+        itineraries = _save_variants(user, preferences, done, generated, extracted, resolved)
+
+    results = []
+    for index, itinerary in zip(done, itineraries):
+        hotel_locations, restaurant_locations = resolved[index]
+        response_data = generation_response_data(
+            itinerary, preference_to_prompt_dict(preferences[index])['startPoint'],
+            hotel_locations, restaurant_locations,
+        )
+        response_data['label'] = labels[index]
+        response_data['meta'] = generated[index][1]
+        results.append(response_data)
+    errors = [{'label': labels[index], 'error': failures[index]} for index in sorted(failures)]
+    return results, errors
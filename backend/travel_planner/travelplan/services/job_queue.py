@@ -0,0 +1,182 @@
+import logging
+import threading
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import connections
+from django.db.models import F, Q
+from django.utils import timezone
+
+from ..models import ItineraryJob
+from .database import retry_on_lock
+from .itinerary_service import run_generation
+
+logger = logging.getLogger(__name__)
+
+
+class LeaseLost(Exception):
+    """Raised when a worker's lease on a job was taken over by another worker."""
+
+
+def enqueue_job(user, preference):
+    """Queue a generation job for a saved preference."""
+    return ItineraryJob.objects.create(user=user, preference=preference)
+
+
+def _claimable(now):
+    # Queued jobs, plus running jobs whose worker stopped renewing its lease
+    return Q(status=ItineraryJob.STATUS_QUEUED) | Q(status=ItineraryJob.STATUS_RUNNING, lease_expires_at__lt=now)
+
+
+def claim_next_job(worker_id, batch=5):
+    """Atomically claim the oldest available job for this worker.
+
+    Claiming is a conditional UPDATE, so any number of worker processes can
+    poll the same table; only one of them wins a given job. Jobs abandoned by
+    a crashed worker become claimable again once their lease expires.
+    """
+    now = timezone.now()
+    fail_exhausted_jobs(now)
+    candidates = list(
+        ItineraryJob.objects.filter(_claimable(now), attempts__lt=settings.ITINERARY_JOB_MAX_ATTEMPTS)
+        .order_by('created_at')
+        .values_list('pk', flat=True)[:batch]
+    )
+    for pk in candidates:
+        claimed = ItineraryJob.objects.filter(_claimable(now), pk=pk).update(
+            status=ItineraryJob.STATUS_RUNNING,
+            stage='starting',
+            worker_id=worker_id,
+            attempts=F('attempts') + 1,
+            lease_expires_at=now + timedelta(seconds=settings.ITINERARY_JOB_LEASE_SECONDS),
+            started_at=now,
+            updated_at=now,
+        )
+        if claimed:
+            return ItineraryJob.objects.select_related('preference').get(pk=pk)
+    return None
+
+
+def fail_exhausted_jobs(now=None):
+    """Mark expired jobs that have used up their attempts as failed."""
+    now = now or timezone.now()
+    return ItineraryJob.objects.filter(
+        status=ItineraryJob.STATUS_RUNNING,
+        lease_expires_at__lt=now,
+        attempts__gte=settings.ITINERARY_JOB_MAX_ATTEMPTS,
+    ).update(
+        status=ItineraryJob.STATUS_FAILED,
+        error='Worker lease expired too many times',
+        finished_at=now,
+        updated_at=now,
+    )
+
+
+def _update_owned(job, worker_id, **fields):
+    """Update a job only while this worker still holds its lease."""
+    now = timezone.now()
+    fields.setdefault('updated_at', now)
+    updated = ItineraryJob.objects.filter(
+        pk=job.pk, worker_id=worker_id, status=ItineraryJob.STATUS_RUNNING
+    ).update(**fields)
+    if not updated:
+        raise LeaseLost(f"Job {job.pk} is no longer leased to {worker_id}")
+
+
+def _lease_expiry():
+    return timezone.now() + timedelta(seconds=settings.ITINERARY_JOB_LEASE_SECONDS)
+
+
+def renew_lease(job, worker_id):
+    """Extend this worker's lease on a job without touching its progress."""
+    _update_owned(job, worker_id, lease_expires_at=_lease_expiry())
+
+
+def report_progress(job, worker_id, stage, percent):
+    """Record progress and renew the lease."""
+    _update_owned(job, worker_id, stage=stage, progress=percent, lease_expires_at=_lease_expiry())
+
+
+class LeaseHeartbeat:
+    """Renews a job's lease every ITINERARY_JOB_HEARTBEAT_SECONDS from a background thread.
+
+    A single stage (one Gemini call with its retries) can outlast the lease,
+    so renewing only between stages would let another worker reclaim a job
+    that is still running.
+    """
+
+    def __init__(self, job, worker_id):
+        self.job = job
+        self.worker_id = worker_id
+        self.lost = None
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(target=self._run, name=f"job-{job.pk}-heartbeat", daemon=True)
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self._stopped.set()
+        self._thread.join()
+
+    def check(self):
+        """Raise LeaseLost if a renewal found the job taken over."""
+        if self.lost is not None:
+            raise self.lost
+
+    def _run(self):
+        try:
+            while not self._stopped.wait(settings.ITINERARY_JOB_HEARTBEAT_SECONDS):
+                try:
+                    retry_on_lock(renew_lease)(self.job, self.worker_id)
+                except LeaseLost as e:
+                    self.lost = e
+                    return
+                except Exception:
+                    logger.exception(f"Could not renew the lease on job {self.job.pk}")
+        finally:
+            connections.close_all()
+
+
+def run_job(job, worker_id):
+    """Run a claimed job to completion, recording success or failure."""
+    def on_progress(stage, percent):
+        heartbeat.check()
+        report_progress(job, worker_id, stage, percent)
+
+    try:
+        with LeaseHeartbeat(job, worker_id) as heartbeat:
+            itinerary, _ = run_generation(job.preference, on_progress=on_progress)
+    except LeaseLost as e:
+        logger.warning(str(e))
+        return
+    except Exception as e:
+        logger.error(f"Itinerary job {job.pk} failed: {str(e)}")
+        final = job.attempts >= settings.ITINERARY_JOB_MAX_ATTEMPTS
+        try:
+            _update_owned(
+                job, worker_id,
+                status=ItineraryJob.STATUS_FAILED if final else ItineraryJob.STATUS_QUEUED,
+                stage='failed' if final else ItineraryJob.STATUS_QUEUED,
+                error=str(e),
+                lease_expires_at=None,
+                finished_at=timezone.now() if final else None,
+            )
+        except LeaseLost as lost:
+            logger.warning(str(lost))
+        return
+
+    try:
+        _update_owned(
+            job, worker_id,
+            status=ItineraryJob.STATUS_SUCCEEDED,
+            stage='done',
+            progress=100,
+            itinerary=itinerary,
+            error='',
+            lease_expires_at=None,
+            finished_at=timezone.now(),
+        )
+    except LeaseLost as e:
+        logger.warning(str(e))
@@ -0,0 +1,181 @@
+import json
+import logging
+
+logger = logging.getLogger(__name__)
+
+OPENERS = {'{': '}', '[': ']'}
+SMART_QUOTES = {'“', '”', '„'}
+
+
+class JSONExtractionError(ValueError):
+    """Raised when no usable JSON object can be recovered from model output."""
+
+
+def find_json_object(text):
+    """Return the first balanced top-level JSON object in ``text``, in one linear pass.
+
+    Markdown fences and any prose around the object are skipped because only
+    characters between the first '{' and its matching '}' are kept. If the
+    text ends before the object closes (truncated output), everything from the
+    opening brace onwards is returned so the repair stage can close it.
+    """
+    start = text.find('{')
+    if start == -1:
+        raise JSONExtractionError('No JSON object found in response')
+
+    depth = 0
+    in_string = False
+    escaped = False
+    index = start
+    while index < len(text):
+        char = text[index]
+        index += 1
+        if in_string:
+            if escaped:
+                escaped = False
+            elif char == '\\':
+                escaped = True
+            elif char == '"':
+                in_string = False
+        elif char == '/' and text.startswith('/', index):
+            newline = text.find('\n', index)
+            index = len(text) if newline == -1 else newline
+        elif char == '/' and text.startswith('*', index):
+            end = text.find('*/', index + 1)
+            index = len(text) if end == -1 else end + 2
+        elif char == '"':
+            in_string = True
+        elif char in '{[':
+            depth += 1
+        elif char in '}]':
+            depth -= 1
+            if depth == 0:
+                return text[start:index]
+    return text[start:].rstrip().rstrip('`').rstrip()
+
+
+def repair_json(candidate):
+    """Fix common LLM JSON defects in a single pass.
+
+    Handles // and /* */ comments, trailing commas, smart quotes used as
+    string delimiters, raw newlines inside strings and output truncated
+    mid-structure (unterminated strings and unclosed arrays/objects).
+    Returns the repaired text, the brackets still open at the end and the
+    output offset of every structural comma, which truncation recovery uses
+    to drop a partial final element.
+    """
+    out = []
+    stack = []
+    commas = []  # (output length before the comma, stack snapshot)
+    in_string = False
+    smart_string = False
+    escaped = False
+    index = 0
+    length = len(candidate)
+
+    while index < length:
+        char = candidate[index]
+        if in_string:
+            if escaped:
+                out.append(char)
+                escaped = False
+            elif char == '\\':
+                out.append(char)
+                escaped = True
+            elif char == '"' or (smart_string and char in SMART_QUOTES):
+                out.append('"')
+                in_string = False
+            elif char == '\n':
+                out.append('\\n')
+            elif char == '\r':
+                pass
+            elif char == '\t':
+                out.append('\\t')
+            else:
+                out.append(char)
+            index += 1
+            continue
+
+        if char == '/' and candidate.startswith('//', index):
+            newline = candidate.find('\n', index)
+            index = length if newline == -1 else newline
+            continue
+        if char == '/' and candidate.startswith('/*', index):
+            end = candidate.find('*/', index + 2)
+            index = length if end == -1 else end + 2
+            continue
+
+        if char == '"' or char in SMART_QUOTES:
+            in_string = True
+            smart_string = char != '"'
+            out.append('"')
+        elif char in OPENERS:
+            stack.append(OPENERS[char])
+            out.append(char)
+        elif char in '}]':
+            _drop_trailing_comma(out)
+            if stack and stack[-1] == char:
+                stack.pop()
+            out.append(char)
+        elif char == ',':
+            commas.append((len(out), list(stack)))
+            out.append(char)
+        else:
+            out.append(char)
+        index += 1
+
+    if in_string:
+        if escaped:
+            out.pop()
+        out.append('"')
+    return ''.join(out), stack, commas
+
+
+def _drop_trailing_comma(out):
+    """Remove a comma (and trailing whitespace) right before a closing bracket."""
+    position = len(out) - 1
+    while position >= 0 and out[position].isspace():
+        position -= 1
+    if position >= 0 and out[position] == ',':
+        del out[position:]
+
+
+def _close(text, stack):
+    """Append closers for every bracket still open after truncation."""
+    text = text.rstrip()
+    if text.endswith(','):
+        text = text[:-1]
+    return text + ''.join(reversed(stack))
+
+
+def parse_json_object(text):
+    """Extract and parse the JSON object in a model response, repairing it locally if needed."""
+    if not text or not text.strip():
+        raise JSONExtractionError('Empty response')
+
+    candidate = find_json_object(text)
+    try:
+        return json.loads(candidate)
+    except json.JSONDecodeError:
+        pass
+
+    repaired, stack, commas = repair_json(candidate)
+    try:
+        return json.loads(_close(repaired, stack))
+    except json.JSONDecodeError as e:
+        error = e
+
+    # Truncated mid-element: cut back to each earlier comma and close from there
+    for offset, snapshot in reversed(commas[-50:]):
+        try:
+            result = json.loads(_close(repaired[:offset], snapshot))
+        except json.JSONDecodeError:
+            continue
+        logger.warning('Recovered truncated JSON by dropping a partial trailing element')
+        return result
+    raise JSONExtractionError(f'Invalid JSON response: {error}')
+
+
+def extract_json_text(text):
+    """Return the (repaired) JSON object in a model response as a JSON string."""
+    return json.dumps(parse_json_object(text), ensure_ascii=False)
@@ -0,0 +1,44 @@
+import threading
+import time
+from collections import OrderedDict
+
+MISSING = object()
+
+
+class LocalTTLCache:
+    """Thread-safe in-process LRU cache whose entries expire after a per-entry TTL."""
+
+    def __init__(self, max_size=512):
+        self.max_size = max_size
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        """Return the cached value, or MISSING if absent or expired."""
+        with self._lock:
+            item = self._data.get(key, MISSING)
+            if item is MISSING:
+                return MISSING
+            value, expires = item
+            if expires <= time.monotonic():
+                del self._data[key]
+                return MISSING
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value, ttl):
+        """Store a value for ttl seconds, evicting the least recently used entry when full."""
+        if self.max_size <= 0 or ttl <= 0:
+            return
+        with self._lock:
+            self._data[key] = (value, time.monotonic() + ttl)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_size:
+                self._data.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
@@ -0,0 +1,120 @@
+from datetime import timedelta
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.utils import timezone
+
+from ..models import ItineraryLocation
+from . import metrics
+from .maps_service import extract_hotels_and_restaurants, resolve_places, resolve_places_async
+
+# Columns rewritten when a stored location is re-resolved
+_REFRESHED_FIELDS = ['place_id', 'lat', 'lng', 'address', 'status', 'resolved_at']
+
+
+def build_itinerary_locations(itinerary, hotels, restaurants, hotel_locations, restaurant_locations):
+    """Unsaved ItineraryLocation rows for an itinerary's resolved hotels and restaurants."""
+    now = timezone.now()
+    rows = []
+    for kind, entries, locations in (
+        (ItineraryLocation.KIND_HOTEL, hotels, hotel_locations),
+        (ItineraryLocation.KIND_RESTAURANT, restaurants, restaurant_locations),
+    ):
+        for position, (entry, location) in enumerate(zip(entries, locations)):
+            row = ItineraryLocation(
+                itinerary=itinerary,
+                kind=kind,
+                position=position,
+                name=entry['name'][:255],
+                context=entry['context'][:255],
+                source_place_id='' if entry.get('placeId') in (None, 'ID not available') else entry['placeId'][:255],
+            )
+            row.apply_location(location, now)
+            rows.append(row)
+    return rows
+
+
+def save_itinerary_locations(itinerary, hotels, restaurants, hotel_locations, restaurant_locations):
+    """Materialize the resolved hotels and restaurants of a freshly saved itinerary."""
+    with metrics.timer('db_write'):
+        ItineraryLocation.objects.bulk_create(
+            build_itinerary_locations(itinerary, hotels, restaurants, hotel_locations, restaurant_locations)
+        )
+
+
+def resolve_and_save_locations(itinerary):
+    """Resolve a new itinerary's hotels and restaurants and materialize them."""
+    hotels, restaurants = extract_hotels_and_restaurants(itinerary.itinerary_data)
+    with metrics.timer('place_resolution'):
+        locations = resolve_places(hotels + restaurants)
+    hotel_locations, restaurant_locations = locations[:len(hotels)], locations[len(hotels):]
+    save_itinerary_locations(itinerary, hotels, restaurants, hotel_locations, restaurant_locations)
+    return hotel_locations, restaurant_locations
+
+
+async def resolve_and_save_locations_async(itinerary):
+    """Async counterpart of resolve_and_save_locations."""
+    hotels, restaurants = extract_hotels_and_restaurants(itinerary.itinerary_data)
+    with metrics.timer('place_resolution'):
+        locations = await resolve_places_async(hotels + restaurants)
+    hotel_locations, restaurant_locations = locations[:len(hotels)], locations[len(hotels):]
+    await sync_to_async(save_itinerary_locations)(itinerary, hotels, restaurants, hotel_locations, restaurant_locations)
+    return hotel_locations, restaurant_locations
+
+
+def _needs_refresh(row, cutoff):
+    if row.status == ItineraryLocation.STATUS_NOT_APPLICABLE:
+        return False
+    return row.status == ItineraryLocation.STATUS_FAILED or row.resolved_at < cutoff
+
+
+def _split_locations(rows):
+    hotel_locations = [row.to_location() for row in rows if row.kind == ItineraryLocation.KIND_HOTEL]
+    restaurant_locations = [row.to_location() for row in rows if row.kind == ItineraryLocation.KIND_RESTAURANT]
+    return hotel_locations, restaurant_locations
+
+
+def _stale_rows(rows):
+    cutoff = timezone.now() - timedelta(seconds=settings.ITINERARY_LOCATION_MAX_AGE)
+    return [row for row in rows if _needs_refresh(row, cutoff)]
+
+
+def _apply_locations(rows, locations):
+    now = timezone.now()
+    for row, location in zip(rows, locations):
+        row.apply_location(location, now)
+
+
+def load_itinerary_locations(itinerary):
+    """Return (hotel_locations, restaurant_locations) for a stored itinerary.
+
+    Reads the materialized rows in one query and only re-resolves rows that
+    failed or are older than ITINERARY_LOCATION_MAX_AGE. Itineraries saved
+    before locations were materialized are resolved once and backfilled.
+    """
+    rows = list(ItineraryLocation.objects.filter(itinerary_id=itinerary.pk))
+    if not rows:
+        return resolve_and_save_locations(itinerary)
+
+    stale = _stale_rows(rows)
+    if stale:
+        _apply_locations(stale, resolve_places([row.to_entry() for row in stale]))
+        ItineraryLocation.objects.bulk_update(stale, _REFRESHED_FIELDS)
+    return _split_locations(rows)
+
+
+async def load_itinerary_locations_async(itinerary):
+    """Async counterpart of load_itinerary_locations.
+
+    Stale and legacy rows are resolved on the Maps executor, so a detail read
+    that has to call Maps does not hold up other requests on the sync thread.
+    """
+    rows = [row async for row in ItineraryLocation.objects.filter(itinerary_id=itinerary.pk)]
+    if not rows:
+        return await resolve_and_save_locations_async(itinerary)
+
+    stale = _stale_rows(rows)
+    if stale:
+        _apply_locations(stale, await resolve_places_async([row.to_entry() for row in stale]))
+        await ItineraryLocation.objects.abulk_update(stale, _REFRESHED_FIELDS)
+    return _split_locations(rows)
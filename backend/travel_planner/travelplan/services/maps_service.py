@@ -0,0 +1,252 @@
+import asyncio
+import contextvars
+import logging
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import connections
+from googlemaps.exceptions import ApiError, TransportError
+
+from .clients import get_maps_client
+from .geocode_cache import geocode_location
+from .place_cache import lookup_places, place_key, store_places
+from .rate_limit import PROVIDER_MAPS, RateLimitedClient
+
+logger = logging.getLogger(__name__)
+
+# Blocking Maps lookups issued from async views run here
+_maps_executor = ThreadPoolExecutor(max_workers=settings.MAPS_EXECUTOR_WORKERS, thread_name_prefix='maps')
+
+def is_resolvable_name(name):
+    """Filter out schedule fillers that are not real places."""
+    return bool(name) and name.lower() not in ["none", "relax", "drive", "journey"]
+
+def fetch_place_id(name, context_location, existing_place_id=None):
+    """Convert a name and context location to a Google Maps Place ID with lat/lng."""
+    return resolve_places([{'name': name, 'context': context_location, 'placeId': existing_place_id}])[0]
+
+def _plan_resolution(entries):
+    """Split entries into fillers, cache hits and deduped cache misses."""
+    locations = [None] * len(entries)
+    keys = {}
+    for index, entry in enumerate(entries):
+        if is_resolvable_name(entry['name']):
+            keys[index] = place_key(entry['name'], entry['context'])
+        else:
+            locations[index] = {'placeId': 'ID not available', 'lat': None, 'lng': None, 'address': 'Not applicable'}
+
+    cached = lookup_places([entries[i] for i in keys])
+
+    # Identical (name, context) pairs are looked up once
+    misses = {}
+    for index, key in keys.items():
+        if key not in cached and key not in misses:
+            entry = entries[index]
+            misses[key] = (entry['name'], entry['context'], entry.get('placeId'))
+    return locations, keys, cached, misses
+
+def _finish_resolution(locations, keys, cached, misses, resolved):
+    """Fill in resolved locations in input order and write new results back."""
+    for index, key in keys.items():
+        locations[index] = cached.get(key) or resolved[key]
+    store_places([(misses[key][:2], location) for key, location in resolved.items()])
+    return locations
+
+def resolve_places(entries):
+    """Resolve a list of {'name', 'context', 'placeId'} entries, in order.
+
+    Fresh resolutions are bulk-loaded from the ResolvedPlace cache; only the
+    misses hit Google Maps, in parallel, and their results are written back.
+    """
+    locations = [None] * len(entries)
+    for index, location in iter_resolve_places(entries):
+        locations[index] = location
+    return locations
+
+def iter_resolve_places(entries):
+    """Yield (index, location) pairs for entries as soon as each is resolved.
+
+    Fillers and cache hits come first, then Maps lookups in completion order.
+    """
+    locations, keys, cached, misses = _plan_resolution(entries)
+    for index, location in enumerate(locations):
+        if location is not None:
+            yield index, location
+
+    waiting = {}
+    for index, key in keys.items():
+        if key in cached:
+            yield index, cached[key]
+        else:
+            waiting.setdefault(key, []).append(index)
+
+    resolved = {}
+    try:
+        for key, location in _fetch_misses(misses):
+            resolved[key] = location
+            for index in waiting[key]:
+                yield index, location
+    finally:
+        store_places([(misses[key][:2], location) for key, location in resolved.items()])
+
+def _fetch_misses(misses):
+    """Yield (key, location) for each cache miss as its Maps lookup completes."""
+    if len(misses) == 1:
+        key, args = next(iter(misses.items()))
+        yield key, _fetch_place_remote(*args)
+        return
+    if not misses:
+        return
+
+    executor = ThreadPoolExecutor(max_workers=min(settings.PLACE_RESOLUTION_CONCURRENCY, len(misses)))
+    try:
+        # Each lookup runs in a copy of the caller's context so rate limits stay attributed to its user
+        futures = {
+            executor.submit(contextvars.copy_context().run, _fetch_place_in_worker, *args): key
+            for key, args in misses.items()
+        }
+        for future in as_completed(futures):
+            yield futures[future], future.result()
+    finally:
+        # If the consumer stops early, drop lookups that have not started yet
+        executor.shutdown(wait=False, cancel_futures=True)
+
+async def resolve_places_async(entries):
+    """Async counterpart of resolve_places.
+
+    This is not an async Maps client: the googlemaps client is blocking, so
+    each lookup still occupies a thread of the process-wide executor (sharing
+    the client's pooled session) while the event loop awaits it. Cancelling the
+    awaiting task (e.g. on client disconnect) drops every lookup that has not
+    started yet.
+    """
+    locations, keys, cached, misses = await sync_to_async(_plan_resolution)(entries)
+
+    loop = asyncio.get_running_loop()
+    semaphore = asyncio.Semaphore(settings.PLACE_RESOLUTION_CONCURRENCY)
+
+    async def resolve(args):
+        async with semaphore:
+            return await loop.run_in_executor(
+                _maps_executor, contextvars.copy_context().run, _fetch_place_in_worker, *args
+            )
+
+    results = await asyncio.gather(*(resolve(args) for args in misses.values()))
+    resolved = dict(zip(misses.keys(), results))
+    return await sync_to_async(_finish_resolution)(locations, keys, cached, misses, resolved)
+
+def _fetch_place_in_worker(name, context_location, existing_place_id=None):
+    """Run a remote lookup on a pool thread, releasing its DB connection afterwards."""
+    try:
+        return _fetch_place_remote(name, context_location, existing_place_id)
+    finally:
+        connections.close_all()
+
+def _fetch_place_remote(name, context_location, existing_place_id=None):
+    """Look a place up through the Google Maps API."""
+    gmaps = RateLimitedClient(get_maps_client(), PROVIDER_MAPS)
+    try:
+        if existing_place_id and existing_place_id != "ID not available":
+            try:
+                place_details = gmaps.place(place_id=existing_place_id, fields=['place_id', 'geometry', 'formatted_address'])
+                geometry = place_details['result']['geometry']['location']
+                return {
+                    'placeId': existing_place_id,
+                    'lat': geometry['lat'],
+                    'lng': geometry['lng'],
+                    'address': place_details['result'].get('formatted_address', 'Address not available')
+                }
+            except ApiError:
+                logger.info("Stored Place ID is invalid, searching anew", extra={'place_id': existing_place_id, 'place': name})
+
+        # Only geocode the context once a location bias is actually needed
+        coords = geocode_location(gmaps, context_location)
+        if not coords:
+            return {'placeId': 'ID not available', 'lat': None, 'lng': None, 'address': 'Context not geocoded'}
+
+        query = f"{name}, {context_location}"
+        place_search = gmaps.find_place(
+            input=query,
+            input_type="textquery",
+            location_bias=f"circle:15000@{coords[0]},{coords[1]}"
+        )
+        if place_search['candidates']:
+            place_id = place_search['candidates'][0]['place_id']
+            place_details = gmaps.place(place_id=place_id, fields=['place_id', 'geometry', 'formatted_address'])
+            geometry = place_details['result']['geometry']['location']
+            return {
+                'placeId': place_id,
+                'lat': geometry['lat'],
+                'lng': geometry['lng'],
+                'address': place_details['result'].get('formatted_address', 'Address not available')
+            }
+
+        places = gmaps.places_nearby(location=coords, radius=15000, keyword=name)
+        if places['results']:
+            place = places['results'][0]
+            return {
+                'placeId': place['place_id'],
+                'lat': place['geometry']['location']['lat'],
+                'lng': place['geometry']['location']['lng'],
+                'address': place.get('vicinity', 'Address not available')
+            }
+        return {'placeId': 'ID not available', 'lat': None, 'lng': None, 'address': 'Not found'}
+    except ApiError as e:
+        logger.warning("Maps API error", extra={'place': name, 'context': context_location, 'error': str(e)})
+        return {'placeId': f'Error: {str(e)}', 'lat': None, 'lng': None, 'address': 'Error'}
+    except TransportError as e:
+        logger.warning("Maps network error", extra={'place': name, 'context': context_location, 'error': str(e)})
+        return {'placeId': f'Error: {str(e)}', 'lat': None, 'lng': None, 'address': 'Error'}
+    except Exception as e:
+        logger.exception("Unexpected Maps error", extra={'place': name, 'context': context_location})
+        return {'placeId': f'Error: {str(e)}', 'lat': None, 'lng': None, 'address': 'Error'}
+
+def _dicts(value):
+    """The dict items of a list; model output of any other shape is skipped."""
+    return [item for item in value if isinstance(item, dict)] if isinstance(value, list) else []
+
+def iter_itinerary_places(itinerary_data):
+    """Walk an itinerary's hotel options and meal stops.
+
+    Yields (kind, entry, day, time): kind is 'hotel' or 'restaurant', entry a
+    {'name', 'placeId', 'context'} dict, and day / time the schedule slot of a
+    restaurant (None and '' for hotels). Parts that do not have the expected
+    shape (e.g. an ``itinerary`` dict rather than a list of days) are skipped.
+    """
+    if not isinstance(itinerary_data, dict):
+        return
+    destination = itinerary_data.get('destination', itinerary_data.get('startPoint', 'Unknown Location'))
+    start_point = str(itinerary_data.get('startPoint', '')).lower()
+
+    for hotel in _dicts(itinerary_data.get('hotelRecommendations')):
+        options = hotel.get('options')
+        for option in options if isinstance(options, list) else []:
+            if isinstance(option, str) and option.lower() != "none":
+                place_id = hotel.get('placeId', 'ID not available')
+                yield 'hotel', {'name': option, 'placeId': place_id, 'context': destination}, None, ''
+
+    for day in _dicts(itinerary_data.get('itinerary')):
+        for schedule in _dicts(day.get('schedule')):
+            activity = schedule.get('activity')
+            activity = activity.lower() if isinstance(activity, str) else ''
+            if any(keyword in activity for keyword in ['lunch at', 'dinner at', 'breakfast at']):
+                name = activity.split('at')[-1].strip()
+                place_id = schedule.get('placeId', 'ID not available')
+                context = destination
+                if 'coimbatore' in activity or 'coimbatore bypass' in activity:
+                    context = 'Coimbatore, Tamil Nadu, India'
+                elif 'palakkad' in activity or start_point in activity:
+                    context = 'Palakkad, Kerala, India'
+                names = [n.strip() for n in name.split(' or ')] if ' or ' in name else [name]
+                for n in names:
+                    entry = {'name': n, 'placeId': place_id, 'context': context}
+                    yield 'restaurant', entry, day.get('day'), schedule.get('time', '')
+
+def extract_hotels_and_restaurants(itinerary_data):
+    """Extract hotel and restaurant names with context and existing Place IDs."""
+    hotels = []
+    restaurants = []
+    for kind, entry, _, _ in iter_itinerary_places(itinerary_data):
+        (hotels if kind == 'hotel' else restaurants).append(entry)
+    return hotels, restaurants
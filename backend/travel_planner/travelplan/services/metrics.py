@@ -0,0 +1,176 @@
+import bisect
+import contextvars
+import threading
+import time
+from contextlib import contextmanager
+
+# Upper bounds (seconds) of the latency histogram buckets
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+
+# Process-wide counters, gauges and histograms keyed by (name, sorted label items)
+_lock = threading.Lock()
+_counters = {}
+_gauges = {}
+_histograms = {}
+
+# Stage timings of the request being served, reported in its Server-Timing header
+_request_timings = contextvars.ContextVar('request_timings', default=None)
+
+
+def _key(name, labels):
+    return name, tuple(sorted((labels or {}).items()))
+
+
+def increment(name, labels=None, value=1):
+    """Add ``value`` to a counter."""
+    key = _key(name, labels)
+    with _lock:
+        _counters[key] = _counters.get(key, 0) + value
+
+
+def set_gauge(name, value, labels=None):
+    """Record the current value of a gauge."""
+    with _lock:
+        _gauges[_key(name, labels)] = value
+
+
+def observe(name, value, labels=None, buckets=DEFAULT_BUCKETS):
+    """Record one observation in a histogram."""
+    key = _key(name, labels)
+    with _lock:
+        histogram = _histograms.get(key)
+        if histogram is None:
+            histogram = _histograms[key] = {'buckets': buckets, 'counts': [0] * len(buckets), 'sum': 0.0, 'count': 0}
+        index = bisect.bisect_left(histogram['buckets'], value)
+        if index < len(buckets):
+            histogram['counts'][index] += 1
+        histogram['sum'] += value
+        histogram['count'] += 1
+
+
+def get_counter(name, labels=None):
+    with _lock:
+        return _counters.get(_key(name, labels), 0)
+
+
+class RequestTimings:
+    """Per-request stage totals; shared with worker threads through the copied context."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.stages = {}
+
+    def add(self, stage, seconds):
+        with self._lock:
+            total, count = self.stages.get(stage, (0.0, 0))
+            self.stages[stage] = (total + seconds, count + 1)
+
+    def server_timing(self, total=None):
+        """Format the stages as a Server-Timing header value (durations in ms)."""
+        with self._lock:
+            parts = [f"{stage};dur={seconds * 1000:.1f}" for stage, (seconds, _) in self.stages.items()]
+        if total is not None:
+            parts.append(f"total;dur={total * 1000:.1f}")
+        return ', '.join(parts)
+
+
+def begin_request():
+    """Start collecting stage timings for the current request; returns (timings, token)."""
+    timings = RequestTimings()
+    return timings, _request_timings.set(timings)
+
+
+def end_request(token):
+    _request_timings.reset(token)
+
+
+@contextmanager
+def timer(stage):
+    """Time a hot-path stage into stage_duration_seconds and the request's Server-Timing.
+
+    Exceptions are counted in stage_errors_total and re-raised.
+    """
+    started = time.perf_counter()
+    try:
+        yield
+    except Exception:
+        increment('stage_errors_total', {'stage': stage})
+        raise
+    finally:
+        elapsed = time.perf_counter() - started
+        observe('stage_duration_seconds', elapsed, {'stage': stage})
+        timings = _request_timings.get()
+        if timings is not None:
+            timings.add(stage, elapsed)
+
+
+def snapshot():
+    """Return every metric as {'counters', 'gauges', 'histograms'} for the metrics endpoint."""
+    with _lock:
+        return {
+            'counters': [
+                {'name': name, 'labels': dict(labels), 'value': value}
+                for (name, labels), value in sorted(_counters.items())
+            ],
+            'gauges': [
+                {'name': name, 'labels': dict(labels), 'value': value}
+                for (name, labels), value in sorted(_gauges.items())
+            ],
+            'histograms': [
+                {
+                    'name': name,
+                    'labels': dict(labels),
+                    'buckets': list(zip(histogram['buckets'], histogram['counts'])),
+                    'sum': histogram['sum'],
+                    'count': histogram['count'],
+                }
+                for (name, labels), histogram in sorted(_histograms.items())
+            ],
+        }
+
+
+def _format_labels(labels):
+    if not labels:
+        return ''
+    escaped = (
+        (key, str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n'))
+        for key, value in sorted(labels.items())
+    )
+    return '{' + ','.join(f'{key}="{value}"' for key, value in escaped) + '}'
+
+
+def render_prometheus(data):
+    """Render a snapshot() in the Prometheus text exposition format."""
+    lines = []
+    typed = set()
+
+    def declare(name, kind):
+        if name not in typed:
+            typed.add(name)
+            lines.append(f"# TYPE {name} {kind}")
+
+    for metric in data['counters']:
+        declare(metric['name'], 'counter')
+        lines.append(f"{metric['name']}{_format_labels(metric['labels'])} {metric['value']}")
+    for metric in data['gauges']:
+        declare(metric['name'], 'gauge')
+        lines.append(f"{metric['name']}{_format_labels(metric['labels'])} {metric['value']}")
+    for metric in data['histograms']:
+        name = metric['name']
+        declare(name, 'histogram')
+        cumulative = 0
+        for bound, count in metric['buckets']:
+            cumulative += count
+            lines.append(f"{name}_bucket{_format_labels({**metric['labels'], 'le': bound})} {cumulative}")
+        lines.append(f"{name}_bucket{_format_labels({**metric['labels'], 'le': '+Inf'})} {metric['count']}")
+        lines.append(f"{name}_sum{_format_labels(metric['labels'])} {metric['sum']}")
+        lines.append(f"{name}_count{_format_labels(metric['labels'])} {metric['count']}")
+    return '\n'.join(lines) + '\n'
+
+
+def reset():
+    """Clear every metric (used by tests and benchmarks)."""
+    with _lock:
+        _counters.clear()
+        _gauges.clear()
+        _histograms.clear()
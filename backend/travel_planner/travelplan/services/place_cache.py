@@ -0,0 +1,124 @@
+import logging
+import operator
+from datetime import timedelta
+from functools import reduce
+
+from django.conf import settings
+from django.db.models import Q
+from django.utils import timezone
+
+from ..models import ResolvedPlace
+from . import metrics
+from .database import retry_on_lock
+from .geocode_cache import normalize_location
+
+logger = logging.getLogger(__name__)
+
+UNAVAILABLE_PLACE_ID = 'ID not available'
+
+
+def place_key(name, context):
+    """Return the normalized (name, context) key used by the ResolvedPlace table."""
+    return (normalize_location(name), normalize_location(context))
+
+
+def is_cacheable(location):
+    """Errors are transient and should be retried rather than cached.
+
+    Unresolved places ('ID not available') are cached only while
+    PLACE_CACHE_NEGATIVE_MAX_AGE is positive.
+    """
+    place_id = str(location.get('placeId', ''))
+    if place_id.startswith('Error'):
+        return False
+    return place_id != UNAVAILABLE_PLACE_ID or settings.PLACE_CACHE_NEGATIVE_MAX_AGE > 0
+
+
+def _fresh():
+    """Rows still fresh enough to use; unresolved rows (no Place ID) expire after the negative max age."""
+    now = timezone.now()
+    return Q(resolved_at__gte=now - timedelta(seconds=settings.PLACE_CACHE_MAX_AGE)) & (
+        ~Q(place_id='') | Q(resolved_at__gte=now - timedelta(seconds=settings.PLACE_CACHE_NEGATIVE_MAX_AGE))
+    )
+
+
+def lookup_places(entries):
+    """Bulk-load fresh cached resolutions for a list of place entries.
+
+    ``entries`` are dicts with ``name``, ``context`` and optional ``placeId``
+    (as produced by extract_hotels_and_restaurants). Returns a dict mapping
+    each entry's place_key to a location dict; entries without a fresh row
+    are absent. Rows are matched by normalized (name, context) first and by
+    the entry's Place ID otherwise.
+    """
+    keys = {place_key(e['name'], e['context']) for e in entries}
+    place_ids = {
+        e.get('placeId') for e in entries
+        if e.get('placeId') and e.get('placeId') != UNAVAILABLE_PLACE_ID
+    }
+    if not keys and not place_ids:
+        return {}
+
+    filters = [Q(name_key=name_key, context_key=context_key) for name_key, context_key in keys]
+    if place_ids:
+        filters.append(Q(place_id__in=place_ids))
+    rows = list(ResolvedPlace.objects.filter(reduce(operator.or_, filters), _fresh()))
+
+    by_key = {(row.name_key, row.context_key): row for row in rows}
+    by_place_id = {row.place_id: row for row in rows if row.place_id}
+
+    found = {}
+    for entry in entries:
+        key = place_key(entry['name'], entry['context'])
+        row = by_key.get(key) or by_place_id.get(entry.get('placeId'))
+        if row is not None:
+            found[key] = row.to_location()
+
+    metrics.increment('cache_requests_total', {'cache': 'place', 'result': 'hit'}, len(found))
+    metrics.increment('cache_requests_total', {'cache': 'place', 'result': 'miss'}, len(keys - found.keys()))
+    if rows:
+        ResolvedPlace.objects.filter(pk__in=[row.pk for row in rows]).update(last_used_at=timezone.now())
+    return found
+
+
+@retry_on_lock
+def store_places(resolved):
+    """Persist resolutions given as a list of ((name, context), location) pairs."""
+    now = timezone.now()
+    rows = {}
+    for (name, context), location in resolved:
+        if not is_cacheable(location):
+            continue
+        name_key, context_key = place_key(name, context)
+        place_id = location.get('placeId')
+        rows[(name_key, context_key)] = ResolvedPlace(
+            name_key=name_key,
+            context_key=context_key,
+            place_id='' if place_id == UNAVAILABLE_PLACE_ID else (place_id or ''),
+            lat=location.get('lat'),
+            lng=location.get('lng'),
+            address=location.get('address') or '',
+            resolved_at=now,
+            last_used_at=now,
+        )
+    if not rows:
+        return
+    ResolvedPlace.objects.bulk_create(
+        rows.values(),
+        update_conflicts=True,
+        unique_fields=['name_key', 'context_key'],
+        update_fields=['place_id', 'lat', 'lng', 'address', 'resolved_at', 'last_used_at'],
+    )
+    evict_cold_places()
+
+
+def evict_cold_places(max_rows=None):
+    """Delete the least recently used rows beyond PLACE_CACHE_MAX_ROWS."""
+    max_rows = settings.PLACE_CACHE_MAX_ROWS if max_rows is None else max_rows
+    excess = ResolvedPlace.objects.count() - max_rows
+    if excess <= 0:
+        return 0
+    cold_ids = list(ResolvedPlace.objects.order_by('last_used_at').values_list('pk', flat=True)[:excess])
+    deleted, _ = ResolvedPlace.objects.filter(pk__in=cold_ids).delete()
+    logger.info(f"Evicted {deleted} cold resolved places")
+    return deleted
@@ -0,0 +1,80 @@
+from collections import defaultdict
+
+from django.db.models import Count, Min
+
+from ..models import ItineraryLocation, ItineraryPlace
+from .geocode_cache import normalize_location
+from .maps_service import iter_itinerary_places
+from .place_cache import UNAVAILABLE_PLACE_ID
+from .summary_service import normalize_destination
+
+KINDS = [kind for kind, _ in ItineraryLocation.KIND_CHOICES]
+
+
+def _day_number(value):
+    try:
+        day = int(value)
+    except (TypeError, ValueError):
+        return None
+    return day if 0 <= day < 2 ** 15 else None
+
+
+def build_places(itinerary, preference):
+    """Unsaved ItineraryPlace rows for an itinerary, in extract_hotels_and_restaurants order."""
+    data = itinerary.itinerary_data if isinstance(itinerary.itinerary_data, dict) else {}
+    destination_key = normalize_destination(preference.destination)
+    positions = defaultdict(int)
+    rows = []
+    for kind, entry, day, time_slot in iter_itinerary_places(data):
+        place_id = str(entry.get('placeId') or '')
+        rows.append(ItineraryPlace(
+            itinerary=itinerary,
+            user_id=itinerary.user_id,
+            kind=kind,
+            position=positions[kind],
+            name=str(entry['name'])[:255],
+            name_key=normalize_location(entry['name']),
+            place_id='' if place_id == UNAVAILABLE_PLACE_ID else place_id[:255],
+            destination_key=destination_key,
+            day=_day_number(day),
+            time_slot=str(time_slot or '')[:100],
+        ))
+        positions[kind] += 1
+    return rows
+
+
+def save_places(pairs, replace=False):
+    """Index the places of (itinerary, preference) pairs; ``replace`` drops their existing rows first.
+
+    Callers run it in the transaction that saves the itineraries.
+    """
+    rows = [row for itinerary, preference in pairs for row in build_places(itinerary, preference)]
+    if replace:
+        ItineraryPlace.objects.filter(itinerary__in=[itinerary for itinerary, _ in pairs]).delete()
+    ItineraryPlace.objects.bulk_create(rows)
+    return rows
+
+
+def find_places(user_id=None, name=None, kind=None, place_id=None):
+    """Index rows matching a place name and/or Place ID, newest first; every user's when user_id is None."""
+    places = ItineraryPlace.objects.all()
+    if user_id is not None:
+        places = places.filter(user_id=user_id)
+    if kind:
+        places = places.filter(kind=kind)
+    if name:
+        places = places.filter(name_key=normalize_location(name))
+    if place_id:
+        places = places.filter(place_id=place_id)
+    return places.order_by('-id')
+
+
+def top_places(destination, kind, limit=10):
+    """The places recommended by the most itineraries for a destination."""
+    rows = (
+        ItineraryPlace.objects.filter(destination_key=normalize_destination(destination), kind=kind)
+        .values('name_key')
+        .annotate(itineraries=Count('itinerary', distinct=True), name=Min('name'))
+        .order_by('-itineraries', 'name_key')[:limit]
+    )
+    return [{'name': row['name'], 'itineraries': row['itineraries']} for row in rows]
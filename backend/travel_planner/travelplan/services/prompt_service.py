@@ -3,7 +3,50 @@ from datetime import datetime
 
 logger = logging.getLogger(__name__)
 
-def get_unstructured_itinerary_prompt(preferences):
+# JSON layout shared by the structuring and single-call prompts
+STRUCTURED_ITINERARY_FORMAT = '''    {
+      "tripName": "<Travel Style> <Destination> Trip from <Departure>",
+      "duration": "<Days> Day(s)",
+      "groupSize": 1,
+      "travelStyle": "<Travel Style>",
+      "season": "Adaptable, avoid peak monsoon",
+      "startPoint": "<Departure>",
+      "endPoint": "<Departure>",
+      "itinerary": [
+        {
+          "day": 1,
+          "title": "Journey to <Destination> and Initial Exploration",
+          "schedule": [
+            {"time": "<Time Range>", "activity": "<Activity Description>", "costPerPerson": "<Cost>", "placeId": "<Google Maps Place ID>"}
+          ]
+        },
+        // Additional days if applicable
+      ],
+      "hotelRecommendations": [
+        {"category": "Budget-Friendly", "options": ["<Hotel Name>"], "placeId": "<Google Maps Place ID>"}
+      ],
+      "hotelCostEstimate": {
+        "costPerRoomPerNight": "<Cost Range>",
+        "assumptions": "Budget-friendly option for 1 traveler",
+        "costPerPerson": "<Cost Range>"
+      },
+      "budgetCalculation": {
+        "transportation": {"totalTransportation": "<Cost Range>"},
+        "accommodation": "<Cost Range>",
+        "food": {"totalFood": "<Cost Range>"},
+        "activitiesEntryFees": "<Cost Range>",
+        "miscellaneous": "<Cost Range>",
+        "totalEstimatedBudgetPerPerson": "<Total Cost Range>"
+      },
+      "importantNotesAndTips": [
+        "<Note 1>",
+        "<Note 2>"
+      ]
+    }
+'''
+
+def get_trip_parameters(preferences):
+    """Pull the prompt parameters out of the preference dict, with defaults."""
     departure = preferences.get('startPoint', 'NSS College of Engineering, Palakkad')  # Changed to 'startPoint'
     destination = preferences.get('destination', 'Ooty')
     budget = preferences.get('budget', '6000 Rupees')
@@ -17,6 +60,10 @@ def get_unstructured_itinerary_prompt(preferences):
         days = max(days, 1)
     except (ValueError, TypeError):
         days = 2
+    return departure, destination, budget_value, travel_style, transportation, health_issues, days
+
+def get_unstructured_itinerary_prompt(preferences):
+    departure, destination, budget_value, travel_style, transportation, health_issues, days = get_trip_parameters(preferences)
 
     prompt = f"""
     generate an itinerary for a {travel_style} {days}-day trip from {departure} to {destination}, 
@@ -33,46 +80,7 @@ def get_structured_itinerary_prompt(raw_itinerary):
     prompt = f"""
     You are a travel planner. Take the following unstructured itinerary and convert it into a structured JSON object matching this exact format:
     
-    {{
-      "tripName": "<Travel Style> <Destination> Trip from <Departure>",
-      "duration": "<Days> Day(s)",
-      "groupSize": 1,
-      "travelStyle": "<Travel Style>",
-      "season": "Adaptable, avoid peak monsoon",
-      "startPoint": "<Departure>",
-      "endPoint": "<Departure>",
-      "itinerary": [
-        {{
-          "day": 1,
-          "title": "Journey to <Destination> and Initial Exploration",
-          "schedule": [
-            {{"time": "<Time Range>", "activity": "<Activity Description>", "costPerPerson": "<Cost>", "placeId": "<Google Maps Place ID>"}}
-          ]
-        }},
-        // Additional days if applicable
-      ],
-      "hotelRecommendations": [
-        {{"category": "Budget-Friendly", "options": ["<Hotel Name>"], "placeId": "<Google Maps Place ID>"}}
-      ],
-      "hotelCostEstimate": {{
-        "costPerRoomPerNight": "<Cost Range>",
-        "assumptions": "Budget-friendly option for 1 traveler",
-        "costPerPerson": "<Cost Range>"
-      }},
-      "budgetCalculation": {{
-        "transportation": {{"totalTransportation": "<Cost Range>"}},
-        "accommodation": "<Cost Range>",
-        "food": {{"totalFood": "<Cost Range>"}},
-        "activitiesEntryFees": "<Cost Range>",
-        "miscellaneous": "<Cost Range>",
-        "totalEstimatedBudgetPerPerson": "<Total Cost Range>"
-      }},
-      "importantNotesAndTips": [
-        "<Note 1>",
-        "<Note 2>"
-      ]
-    }}
-
+{STRUCTURED_ITINERARY_FORMAT}
     Here’s the unstructured itinerary to convert:
     {raw_itinerary}
 
@@ -84,4 +92,27 @@ def get_structured_itinerary_prompt(raw_itinerary):
     - Use realistic cost ranges in INR (e.g., '₹200-₹300').
     - Provide the response as a valid JSON object only.
     """
-    return prompt
\ No newline at end of file
+    return prompt
+
+def get_single_call_itinerary_prompt(preferences):
+    """Ask for the structured JSON itinerary directly, skipping the free-text stage."""
+    departure, destination, budget_value, travel_style, transportation, health_issues, days = get_trip_parameters(preferences)
+
+    prompt = f"""
+    You are a travel planner. Generate an itinerary for a {travel_style} {days}-day trip from {departure} to {destination},
+    with mode of transportation as {transportation}, activities, restaurant names (for breakfast, lunch, and dinner),
+    and accommodation (with name of hotel). The traveller has {health_issues}.
+    Include a realistic budget breaking down the cost within {budget_value} Rupees.
+    The prime focus of activities should be the destination; avoid including travel activities in the starting point.
+
+    Return a single JSON object matching this exact format:
+
+{STRUCTURED_ITINERARY_FORMAT}
+    Ensure:
+    - Every day has a detailed schedule with timings, activities, named restaurants for breakfast, lunch and dinner, and costs.
+    - Include Google Maps Place IDs (e.g., 'ChIJ...') for hotels, restaurants, and activity locations as 'placeId' fields.
+    - If no Place ID is known, use 'ID not available'.
+    - Use realistic cost ranges in INR (e.g., '₹200-₹300').
+    - Provide the response as a valid JSON object only.
+    """
+    return prompt
@@ -0,0 +1,212 @@
+import asyncio
+import contextvars
+import logging
+import math
+import threading
+import time
+from contextlib import contextmanager
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import transaction
+
+from ..models import RateLimitBucket
+from . import metrics
+from .database import retry_on_lock
+
+logger = logging.getLogger(__name__)
+
+PROVIDER_GEMINI = 'gemini'
+PROVIDER_MAPS = 'maps'
+
+# User on whose behalf upstream calls are made; gives each user their own sub-bucket
+_current_user = contextvars.ContextVar('rate_limit_user', default=None)
+
+
+class RateLimitExceeded(Exception):
+    """Raised when a call could not get a token within its maximum wait (RATE_LIMIT_MAX_WAIT by default)."""
+
+    def __init__(self, key, retry_after):
+        super().__init__(f"Rate limit for {key} exceeded; retry in {retry_after:.1f}s")
+        self.key = key
+        self.retry_after = retry_after
+
+
+@contextmanager
+def rate_limit_user(user_id):
+    """Attribute upstream calls made inside the block to a user.
+
+    Restores the previous value rather than resetting a token, because
+    streaming generators may be resumed from a copied context.
+    """
+    previous = _current_user.get()
+    _current_user.set(user_id)
+    try:
+        yield
+    finally:
+        _current_user.set(previous)
+
+
+def get_limit(provider, endpoint):
+    """(requests per second, burst) for an endpoint; RATE_LIMIT_OVERRIDES wins over provider defaults."""
+    override = settings.RATE_LIMIT_OVERRIDES.get(f"{provider}:{endpoint}")
+    if override:
+        return float(override[0]), float(override[1])
+    if provider == PROVIDER_GEMINI:
+        return settings.GEMINI_RATE_LIMIT, settings.GEMINI_RATE_BURST
+    return settings.MAPS_RATE_LIMIT, settings.MAPS_RATE_BURST
+
+
+@retry_on_lock
+def _take(buckets):
+    """Take tokens from every (key, rate, burst) bucket in one transaction, or from none.
+
+    Returns (tokens taken, seconds to wait). Up to RATE_LIMIT_PREFETCH_SECONDS
+    worth of tokens are taken at once for the in-process fast path; (0, None)
+    means another process spent a bucket first.
+    """
+    now = time.time()
+    keys = [key for key, _, _ in buckets]
+    with transaction.atomic():
+        rows = {row.key: row for row in RateLimitBucket.objects.filter(key__in=keys)}
+        if len(rows) < len(keys):
+            missing = [RateLimitBucket(key=key, tokens=burst, refilled_at=now)
+                       for key, _, burst in buckets if key not in rows]
+            RateLimitBucket.objects.bulk_create(missing, ignore_conflicts=True)
+            rows = {row.key: row for row in RateLimitBucket.objects.filter(key__in=keys)}
+
+        available = {
+            key: min(burst, rows[key].tokens + max(0.0, now - rows[key].refilled_at) * rate)
+            for key, rate, burst in buckets
+        }
+        waits = [(1 - available[key]) / rate for key, rate, _ in buckets if available[key] < 1]
+        if waits:
+            return 0, max(waits)
+
+        prefetch = max(1, math.floor(min(rate for _, rate, _ in buckets) * settings.RATE_LIMIT_PREFETCH_SECONDS))
+        count = min(prefetch, math.floor(min(available.values())))
+        for key in keys:
+            row = rows[key]
+            # Conditional update: only one process can spend a given bucket version
+            updated = RateLimitBucket.objects.filter(pk=row.pk, version=row.version).update(
+                tokens=available[key] - count, refilled_at=now, version=row.version + 1,
+            )
+            if not updated:
+                transaction.set_rollback(True)
+                return 0, None
+    return count, 0.0
+
+
+_prefetched = {}  # Bucket keys -> (tokens taken from the shared buckets but not yet used, usable until)
+_prefetched_lock = threading.Lock()
+
+
+def _take_prefetched(keys):
+    with _prefetched_lock:
+        tokens, expires = _prefetched.get(keys, (0, 0.0))
+        if tokens and time.monotonic() < expires:
+            _prefetched[keys] = (tokens - 1, expires)
+            return True
+        _prefetched.pop(keys, None)
+    return False
+
+
+def _keep_prefetched(keys, tokens):
+    if tokens <= 0:
+        return
+    with _prefetched_lock:
+        held, expires = _prefetched.get(keys, (0, 0.0))
+        now = time.monotonic()
+        held = held if now < expires else 0
+        _prefetched[keys] = (held + tokens, now + settings.RATE_LIMIT_PREFETCH_SECONDS)
+
+
+def clear_prefetched():
+    """Drop this process's unused prefetched tokens."""
+    with _prefetched_lock:
+        _prefetched.clear()
+
+
+def _bucket_keys(provider, endpoint):
+    """Per-user bucket (capped at RATE_LIMIT_USER_SHARE of the endpoint), then the shared one."""
+    rate, burst = get_limit(provider, endpoint)
+    key = f"{provider}:{endpoint}"
+    keys = []
+    user_id = _current_user.get()
+    if user_id is not None and settings.RATE_LIMIT_USER_SHARE < 1:
+        share = settings.RATE_LIMIT_USER_SHARE
+        keys.append((f"{key}:user:{user_id}", rate * share, max(1.0, burst * share)))
+    keys.append((key, rate, burst))
+    return keys
+
+
+def _wait_or_raise(provider, endpoint, wait, deadline):
+    """Seconds to sleep before trying again, or RateLimitExceeded past the deadline."""
+    wait = wait or 0.01
+    if time.monotonic() + wait > deadline:
+        raise RateLimitExceeded(f"{provider}:{endpoint}", wait)
+    metrics.increment('rate_limit_waits_total', {'bucket': f"{provider}:{endpoint}"})
+    return wait
+
+
+def acquire(provider, endpoint, max_wait=None):
+    """Block until the caller may make one request to provider/endpoint.
+
+    A token is taken from the per-user and shared buckets together, so a
+    call that gives up never spends one. Waits up to ``max_wait`` seconds
+    (RATE_LIMIT_MAX_WAIT by default).
+    """
+    if not settings.RATE_LIMIT_ENABLED:
+        return
+    buckets = _bucket_keys(provider, endpoint)
+    keys = tuple(key for key, _, _ in buckets)
+    if _take_prefetched(keys):
+        return
+    deadline = time.monotonic() + (settings.RATE_LIMIT_MAX_WAIT if max_wait is None else max_wait)
+    while True:
+        with metrics.timer('rate_limit'):
+            count, wait = _take(buckets)
+        if count:
+            _keep_prefetched(keys, count - 1)
+            return
+        time.sleep(_wait_or_raise(provider, endpoint, wait, deadline))
+
+
+async def acquire_async(provider, endpoint, max_wait=None):
+    """Async counterpart of acquire."""
+    if not settings.RATE_LIMIT_ENABLED:
+        return
+    buckets = _bucket_keys(provider, endpoint)
+    keys = tuple(key for key, _, _ in buckets)
+    if _take_prefetched(keys):
+        return
+    deadline = time.monotonic() + (settings.RATE_LIMIT_MAX_WAIT if max_wait is None else max_wait)
+    while True:
+        count, wait = await sync_to_async(_take)(buckets)
+        if count:
+            _keep_prefetched(keys, count - 1)
+            return
+        await asyncio.sleep(_wait_or_raise(provider, endpoint, wait, deadline))
+
+
+class RateLimitedClient:
+    """Proxy that takes a token before every API method call on the wrapped client.
+
+    Calls are timed as ``<provider>_<method>`` stages, excluding the token wait.
+    """
+
+    def __init__(self, client, provider):
+        self._client = client
+        self._provider = provider
+
+    def __getattr__(self, name):
+        attr = getattr(self._client, name)
+        if not callable(attr) or name.startswith('_'):
+            return attr
+
+        def call(*args, **kwargs):
+            acquire(self._provider, name)
+            metrics.increment('upstream_calls_total', {'upstream': self._provider, 'endpoint': name})
+            with metrics.timer(f"{self._provider}_{name}"):
+                return attr(*args, **kwargs)
+        return call
@@ -0,0 +1,342 @@
+import asyncio
+import contextvars
+import logging
+import random
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from django.conf import settings
+from google.api_core import exceptions as api_exceptions
+
+from . import metrics
+
+logger = logging.getLogger(__name__)
+
+STATE_CLOSED = 'closed'
+STATE_OPEN = 'open'
+STATE_HALF_OPEN = 'half_open'
+STATE_VALUES = {STATE_CLOSED: 0, STATE_HALF_OPEN: 1, STATE_OPEN: 2}
+
+
+class AttemptTimeout(Exception):
+    """Raised when a single upstream attempt exceeds its deadline."""
+
+
+class CircuitOpenError(Exception):
+    """Raised without calling upstream while its circuit breaker is open."""
+
+
+# Errors worth another attempt: throttling, transient server errors and our own deadline
+RETRYABLE_ERRORS = (
+    api_exceptions.TooManyRequests,
+    api_exceptions.InternalServerError,
+    api_exceptions.BadGateway,
+    api_exceptions.ServiceUnavailable,
+    api_exceptions.GatewayTimeout,
+    api_exceptions.DeadlineExceeded,
+    ConnectionError,
+    AttemptTimeout,
+)
+
+
+class CircuitBreaker:
+    """Per-process breaker: opens after consecutive failures, probes once after a cool-down."""
+
+    def __init__(self, name, failure_threshold, reset_timeout):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = STATE_CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self._probing = False
+        self._lock = threading.Lock()
+        self._publish()
+
+    def _publish(self):
+        metrics.set_gauge('upstream_circuit_state', STATE_VALUES[self.state], {'upstream': self.name})
+
+    def _transition(self, state):
+        if state != self.state:
+            logger.warning(f"Circuit for {self.name} {self.state} -> {state}")
+            self.state = state
+            self._publish()
+
+    def allow(self):
+        """Whether a call may go upstream now; half-open lets a single probe through."""
+        with self._lock:
+            if self.state == STATE_OPEN and time.monotonic() - self.opened_at >= self.reset_timeout:
+                self._transition(STATE_HALF_OPEN)
+                self._probing = False
+            if self.state == STATE_CLOSED:
+                return True
+            if self.state == STATE_HALF_OPEN and not self._probing:
+                self._probing = True
+                return True
+            return False
+
+    def release_probe(self):
+        """Give back a half-open probe slot that was never sent upstream."""
+        with self._lock:
+            self._probing = False
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self._probing = False
+            self._transition(STATE_CLOSED)
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            self._probing = False
+            if self.state == STATE_HALF_OPEN or self.failures >= self.failure_threshold:
+                if self.state != STATE_OPEN:
+                    metrics.increment('upstream_circuit_opened_total', {'upstream': self.name})
+                self.opened_at = time.monotonic()
+                self._transition(STATE_OPEN)
+
+
+class LatencyTracker:
+    """Rolling window of successful call latencies used to pick the hedge delay."""
+
+    def __init__(self, size=200):
+        self._samples = deque(maxlen=size)
+        self._lock = threading.Lock()
+
+    def record(self, seconds):
+        with self._lock:
+            self._samples.append(seconds)
+
+    def percentile(self, percent, min_samples):
+        with self._lock:
+            if len(self._samples) < min_samples:
+                return None
+            ordered = sorted(self._samples)
+        return ordered[min(len(ordered) - 1, int(len(ordered) * percent / 100))]
+
+
+class ResilientCaller:
+    """Runs upstream calls with per-attempt deadlines, jittered retries, hedging and a circuit breaker.
+
+    A hedge is a duplicate request sent when the first one is slower than the
+    configured latency percentile; whichever finishes first wins.
+
+    ``throttle(max_wait=None)`` takes a client-side rate limit token. It runs
+    before each attempt, outside its deadline and latency sample, and a
+    throttle error is raised as is without touching the breaker. Hedges only
+    go out if a token is available at once.
+    """
+
+    def __init__(self, name, timeout, max_retries, base_delay, max_delay,
+                 hedge_enabled, hedge_percentile, hedge_min_samples, breaker, executor_workers):
+        self.name = name
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.hedge_enabled = hedge_enabled
+        self.hedge_percentile = hedge_percentile
+        self.hedge_min_samples = hedge_min_samples
+        self.breaker = breaker
+        self.latency = LatencyTracker()
+        self._executor = ThreadPoolExecutor(max_workers=executor_workers, thread_name_prefix=name)
+
+    def _labels(self, **extra):
+        return {'upstream': self.name, **extra}
+
+    def _hedge_delay(self):
+        if not self.hedge_enabled:
+            return None
+        return self.latency.percentile(self.hedge_percentile, self.hedge_min_samples)
+
+    def _backoff(self, attempt):
+        """Full-jitter exponential backoff."""
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+
+    def _before_attempt(self):
+        if not self.breaker.allow():
+            metrics.increment('upstream_calls_total', self._labels(outcome='rejected'))
+            raise CircuitOpenError(f"{self.name} circuit is open; failing fast")
+
+    def _throttled(self):
+        """Our own rate limiter refused a token: nothing reached upstream."""
+        self.breaker.release_probe()
+        metrics.increment('upstream_calls_total', self._labels(outcome='throttled'))
+
+    def _after_failure(self, error, attempt):
+        """Record a failed attempt; returns the delay before retrying or re-raises."""
+        if not isinstance(error, RETRYABLE_ERRORS):
+            # The upstream answered; a bad request says nothing about its health
+            self.breaker.record_success()
+            metrics.increment('upstream_calls_total', self._labels(outcome='error'))
+            raise error
+        self.breaker.record_failure()
+        if attempt >= self.max_retries:
+            metrics.increment('upstream_calls_total', self._labels(outcome='failed'))
+            raise error
+        metrics.increment('upstream_retries_total', self._labels(reason=type(error).__name__))
+        delay = self._backoff(attempt)
+        logger.warning(f"{self.name} attempt {attempt + 1} failed ({error!r}); retrying in {delay:.2f}s")
+        return delay
+
+    def _on_success(self, hedged, role):
+        self.breaker.record_success()
+        metrics.increment('upstream_calls_total', self._labels(outcome='success'))
+        if hedged:
+            metrics.increment('upstream_hedge_wins_total', self._labels(winner=role))
+
+    def call(self, fn, throttle=None):
+        """Call ``fn()`` (a blocking upstream request) with the full resilience policy."""
+        for attempt in range(self.max_retries + 1):
+            self._before_attempt()
+            if throttle is not None:
+                try:
+                    throttle()
+                except Exception:
+                    self._throttled()
+                    raise
+            try:
+                return self._attempt(fn, throttle)
+            except Exception as e:
+                time.sleep(self._after_failure(e, attempt))
+
+    def _hedge_allowed(self, throttle):
+        if throttle is None:
+            return True
+        try:
+            throttle(max_wait=0)
+        except Exception:
+            metrics.increment('upstream_hedges_skipped_total', self._labels())
+            return False
+        return True
+
+    async def _hedge_allowed_async(self, throttle):
+        if throttle is None:
+            return True
+        try:
+            await throttle(max_wait=0)
+        except Exception:
+            metrics.increment('upstream_hedges_skipped_total', self._labels())
+            return False
+        return True
+
+    def _attempt(self, fn, throttle=None):
+        # A blocking SDK call cannot be interrupted: on timeout it finishes in
+        # the background and its result is discarded
+        started = time.monotonic()
+        deadline = started + self.timeout
+        hedge_after = self._hedge_delay()
+        pending = {self._executor.submit(contextvars.copy_context().run, fn): ('primary', started)}
+        hedged = False
+        error = None
+        while pending:
+            now = time.monotonic()
+            if now >= deadline:
+                raise AttemptTimeout(f"{self.name} attempt exceeded {self.timeout}s")
+            timeout = deadline - now
+            if hedge_after is not None and not hedged:
+                timeout = min(timeout, max(0.0, started + hedge_after - now))
+            done, _ = wait(pending, timeout=timeout, return_when=FIRST_COMPLETED)
+            for future in done:
+                role, launched = pending.pop(future)
+                if future.exception() is None:
+                    self.latency.record(time.monotonic() - launched)
+                    self._on_success(hedged, role)
+                    for other in pending:
+                        other.cancel()
+                    return future.result()
+                error = future.exception()
+            if hedge_after is not None and not hedged and pending and time.monotonic() - started >= hedge_after:
+                hedged = True
+                if self._hedge_allowed(throttle):
+                    metrics.increment('upstream_hedges_total', self._labels())
+                    pending[self._executor.submit(contextvars.copy_context().run, fn)] = ('hedge', time.monotonic())
+        raise error
+
+    async def call_async(self, fn, throttle=None):
+        """Async counterpart of call; ``fn()`` returns an awaitable upstream request, ``throttle`` is async."""
+        for attempt in range(self.max_retries + 1):
+            self._before_attempt()
+            if throttle is not None:
+                try:
+                    await throttle()
+                except Exception:
+                    self._throttled()
+                    raise
+            try:
+                return await self._attempt_async(fn, throttle)
+            except Exception as e:
+                await asyncio.sleep(self._after_failure(e, attempt))
+
+    async def _attempt_async(self, fn, throttle=None):
+        started = time.monotonic()
+        deadline = started + self.timeout
+        hedge_after = self._hedge_delay()
+        pending = {asyncio.ensure_future(fn()): ('primary', started)}
+        hedged = False
+        error = None
+        try:
+            while pending:
+                now = time.monotonic()
+                if now >= deadline:
+                    raise AttemptTimeout(f"{self.name} attempt exceeded {self.timeout}s")
+                timeout = deadline - now
+                if hedge_after is not None and not hedged:
+                    timeout = min(timeout, max(0.0, started + hedge_after - now))
+                done, _ = await asyncio.wait(pending, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    role, launched = pending.pop(task)
+                    if task.exception() is None:
+                        self.latency.record(time.monotonic() - launched)
+                        self._on_success(hedged, role)
+                        return task.result()
+                    error = task.exception()
+                if hedge_after is not None and not hedged and pending and time.monotonic() - started >= hedge_after:
+                    hedged = True
+                    if await self._hedge_allowed_async(throttle):
+                        metrics.increment('upstream_hedges_total', self._labels())
+                        pending[asyncio.ensure_future(fn())] = ('hedge', time.monotonic())
+            raise error
+        finally:
+            # Losing hedges and timed-out attempts are cancelled, not left running
+            for task in pending:
+                task.cancel()
+
+
+_callers = {}
+_callers_lock = threading.Lock()
+
+
+def get_gemini_caller():
+    """Process-wide ResilientCaller for Gemini, so breaker state and latencies are shared."""
+    caller = _callers.get('gemini')
+    if caller is None:
+        with _callers_lock:
+            caller = _callers.get('gemini')
+            if caller is None:
+                caller = _callers['gemini'] = ResilientCaller(
+                    'gemini',
+                    timeout=settings.GEMINI_ATTEMPT_TIMEOUT,
+                    max_retries=settings.GEMINI_MAX_RETRIES,
+                    base_delay=settings.GEMINI_RETRY_BASE_DELAY,
+                    max_delay=settings.GEMINI_RETRY_MAX_DELAY,
+                    hedge_enabled=settings.GEMINI_HEDGE_ENABLED,
+                    hedge_percentile=settings.GEMINI_HEDGE_PERCENTILE,
+                    hedge_min_samples=settings.GEMINI_HEDGE_MIN_SAMPLES,
+                    breaker=CircuitBreaker(
+                        'gemini',
+                        failure_threshold=settings.GEMINI_BREAKER_FAILURE_THRESHOLD,
+                        reset_timeout=settings.GEMINI_BREAKER_RESET_TIMEOUT,
+                    ),
+                    executor_workers=settings.GEMINI_EXECUTOR_WORKERS,
+                )
+    return caller
+
+
+def reset_callers():
+    """Forget the shared callers so the next call picks up new settings."""
+    with _callers_lock:
+        _callers.clear()
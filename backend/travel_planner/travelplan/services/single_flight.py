@@ -0,0 +1,153 @@
+import asyncio
+import logging
+import time
+import uuid
+from datetime import timedelta
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+
+from ..models import GenerationLock
+from .database import retry_on_lock
+
+logger = logging.getLogger(__name__)
+
+ROLE_LEADER = 'leader'
+ROLE_FOLLOWER = 'follower'
+
+
+@retry_on_lock
+def acquire_lock(fingerprint, owner):
+    """Try to become the leader for a fingerprint; expired leases are taken over."""
+    now = timezone.now()
+    GenerationLock.objects.filter(fingerprint=fingerprint, expires_at__lte=now).delete()
+    try:
+        with transaction.atomic():
+            GenerationLock.objects.create(
+                fingerprint=fingerprint,
+                owner=owner,
+                expires_at=now + timedelta(seconds=settings.GENERATION_LOCK_TTL),
+            )
+        return True
+    except IntegrityError:
+        return False
+
+
+def release_lock(fingerprint, owner):
+    GenerationLock.objects.filter(fingerprint=fingerprint, owner=owner).delete()
+
+
+@retry_on_lock
+def publish_result(fingerprint, owner, itinerary_data):
+    """Leave the leader's result on its lock for GENERATION_SINGLE_FLIGHT_RESULT_TTL seconds.
+
+    Followers that were already waiting read it from there, so the hand-off
+    works whether or not the generation cache is enabled. Requests arriving
+    after it was published do not get it (see join_flight).
+    """
+    GenerationLock.objects.filter(fingerprint=fingerprint, owner=owner).update(
+        itinerary_data=itinerary_data,
+        expires_at=timezone.now() + timedelta(seconds=settings.GENERATION_SINGLE_FLIGHT_RESULT_TTL),
+    )
+
+
+def _finished(fingerprint):
+    """Whether the live lock for a fingerprint already holds its leader's result."""
+    return GenerationLock.objects.filter(
+        fingerprint=fingerprint, expires_at__gt=timezone.now(), itinerary_data__isnull=False,
+    ).exists()
+
+
+def _poll_once(fingerprint, owner):
+    """One follower poll: returns (itinerary_data, became_leader)."""
+    lock = GenerationLock.objects.filter(fingerprint=fingerprint, expires_at__gt=timezone.now()).first()
+    if lock is not None:
+        return lock.itinerary_data, False
+    if acquire_lock(fingerprint, owner):
+        # The leader gave up without a result; take over
+        return None, True
+    return None, False
+
+
+def join_flight(fingerprint, owner):
+    """Take the lead for a fingerprint, or wait for the current leader's result.
+
+    Returns (itinerary_data, leading): the leader's result once it is
+    published, or None and whether ``owner`` now holds the lock. None and
+    False means the caller should generate on its own: waiting timed out, or
+    the generation had already finished when it arrived. A published result
+    only goes to requests that joined while it was being generated, so the
+    lock never acts as a second cache for later ones.
+    """
+    if acquire_lock(fingerprint, owner):
+        return None, True
+    if _finished(fingerprint):
+        return None, False
+    deadline = time.monotonic() + settings.GENERATION_SINGLE_FLIGHT_WAIT
+    while time.monotonic() < deadline:
+        time.sleep(settings.GENERATION_SINGLE_FLIGHT_POLL)
+        itinerary_data, leader = _poll_once(fingerprint, owner)
+        if itinerary_data is not None or leader:
+            return itinerary_data, leader
+    logger.warning(f"Timed out waiting for generation {fingerprint[:12]}; generating independently")
+    return None, False
+
+
+async def join_flight_async(fingerprint, owner):
+    """Async counterpart of join_flight."""
+    if await sync_to_async(acquire_lock)(fingerprint, owner):
+        return None, True
+    if await sync_to_async(_finished)(fingerprint):
+        return None, False
+    deadline = time.monotonic() + settings.GENERATION_SINGLE_FLIGHT_WAIT
+    while time.monotonic() < deadline:
+        await asyncio.sleep(settings.GENERATION_SINGLE_FLIGHT_POLL)
+        itinerary_data, leader = await sync_to_async(_poll_once)(fingerprint, owner)
+        if itinerary_data is not None or leader:
+            return itinerary_data, leader
+    logger.warning(f"Timed out waiting for generation {fingerprint[:12]}; generating independently")
+    return None, False
+
+
+def single_flight(fingerprint, generate):
+    """Run ``generate()`` once across all processes for concurrent identical requests.
+
+    The first caller takes a GenerationLock lease and generates; the result
+    is handed to everyone else through the lock row. Callers that find the
+    lock taken poll for that result instead of calling Gemini. Caching the
+    result is left to the caller. Returns (itinerary_data, role).
+    """
+    owner = uuid.uuid4().hex
+    itinerary_data, leading = join_flight(fingerprint, owner)
+    if itinerary_data is not None:
+        return itinerary_data, ROLE_FOLLOWER
+    if not leading:
+        return generate(), ROLE_LEADER
+
+    try:
+        itinerary_data = generate()
+    except BaseException:
+        release_lock(fingerprint, owner)
+        raise
+    publish_result(fingerprint, owner, itinerary_data)
+    return itinerary_data, ROLE_LEADER
+
+
+async def single_flight_async(fingerprint, generate):
+    """Async counterpart of single_flight; ``generate`` is a coroutine function."""
+    owner = uuid.uuid4().hex
+    itinerary_data, leading = await join_flight_async(fingerprint, owner)
+    if itinerary_data is not None:
+        return itinerary_data, ROLE_FOLLOWER
+    if not leading:
+        return await generate(), ROLE_LEADER
+
+    try:
+        itinerary_data = await generate()
+    except BaseException:
+        await sync_to_async(release_lock)(fingerprint, owner)
+        raise
+    await sync_to_async(publish_result)(fingerprint, owner, itinerary_data)
+    return itinerary_data, ROLE_LEADER
@@ -0,0 +1,159 @@
+import asyncio
+import hashlib
+import json
+import random
+import re
+import threading
+import time
+from collections import Counter
+
+from google.api_core import exceptions as api_exceptions
+from googlemaps.exceptions import ApiError, TransportError
+
+# Matches "... trip from <start> to <destination>," in the generation prompts
+_TRIP_PATTERN = re.compile(r'trip from (.+?) to (.+?),')
+
+
+class LatencyProfile:
+    """Simulated upstream behaviour: base latency plus jitter, and a random error rate."""
+
+    def __init__(self, latency=0.0, jitter=0.0, error_rate=0.0, seed=None):
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def draw(self):
+        """Return (delay seconds, whether this call fails)."""
+        with self._lock:
+            delay = max(0.0, self.latency + self._random.uniform(-self.jitter, self.jitter))
+            return delay, self._random.random() < self.error_rate
+
+
+class CountingTransport:
+    """Base for upstream transports that count their calls per endpoint."""
+
+    def __init__(self):
+        self.calls = Counter()
+        self._lock = threading.Lock()
+
+    def _record(self, endpoint):
+        with self._lock:
+            self.calls[endpoint] += 1
+
+    def call_counts(self):
+        with self._lock:
+            return dict(self.calls)
+
+    def reset_counts(self):
+        with self._lock:
+            self.calls.clear()
+
+
+class _StandIn(CountingTransport):
+    def __init__(self, profile=None):
+        super().__init__()
+        self.profile = profile or LatencyProfile()
+
+
+class _Response:
+    def __init__(self, text):
+        self.text = text
+
+    def __iter__(self):
+        # Streaming callers iterate chunks; the stand-in sends the whole text as one chunk
+        return iter([self])
+
+
+def stand_in_itinerary(start_point, destination, days=2):
+    """A small structured itinerary whose hotel and restaurant names depend on the trip."""
+    tag = hashlib.sha256(f"{start_point}|{destination}".encode()).hexdigest()[:6]
+    schedule = lambda day: [
+        {'time': '08:00 AM - 09:00 AM', 'activity': f"Breakfast at Cafe {tag}-{day}", 'costPerPerson': '200'},
+        {'time': '10:00 AM - 01:00 PM', 'activity': f"Sightseeing around {destination}", 'costPerPerson': '0'},
+        {'time': '01:00 PM - 02:00 PM', 'activity': f"Lunch at Kitchen {tag}-{day}", 'costPerPerson': '300'},
+        {'time': '08:00 PM - 09:00 PM', 'activity': f"Dinner at Grill {tag}-{day}", 'costPerPerson': '400'},
+    ]
+    return {
+        'tripName': f"Solo {destination} Trip from {start_point}",
+        # Echoed in the structuring prompt so the second stage recovers the same trip
+        'summary': f"A {days}-day trip from {start_point} to {destination}, generated offline.",
+        'duration': f"{days} Day(s)",
+        'groupSize': 1,
+        'travelStyle': 'Solo',
+        'startPoint': start_point,
+        'endPoint': start_point,
+        'itinerary': [
+            {'day': day, 'title': f"Day {day} in {destination}", 'schedule': schedule(day)}
+            for day in range(1, days + 1)
+        ],
+        'hotelRecommendations': [
+            {'category': 'Budget-Friendly', 'options': [f"Hotel {tag}"], 'placeId': 'ID not available'},
+        ],
+        'budgetCalculation': {'totalEstimatedBudgetPerPerson': '4000'},
+        'importantNotesAndTips': ['Carry cash for small vendors.'],
+    }
+
+
+class StandInGeminiModel(_StandIn):
+    """Offline GenerativeModel stand-in answering every prompt with a plausible itinerary."""
+
+    def _respond(self, prompt, fail):
+        self._record('generate_content')
+        if fail:
+            self._record('errors')
+            raise api_exceptions.ServiceUnavailable('Stand-in Gemini error')
+        match = _TRIP_PATTERN.search(prompt)
+        start_point, destination = match.groups() if match else ('Start', 'Destination')
+        return _Response(json.dumps(stand_in_itinerary(start_point.strip(), destination.strip())))
+
+    def generate_content(self, prompt, **kwargs):
+        delay, fail = self.profile.draw()
+        time.sleep(delay)
+        return self._respond(prompt, fail)
+
+    async def generate_content_async(self, prompt, **kwargs):
+        delay, fail = self.profile.draw()
+        await asyncio.sleep(delay)
+        return self._respond(prompt, fail)
+
+
+class StandInMapsClient(_StandIn):
+    """Offline googlemaps.Client stand-in with deterministic coordinates per query."""
+
+    def _call(self, endpoint):
+        delay, fail = self.profile.draw()
+        time.sleep(delay)
+        self._record(endpoint)
+        if fail:
+            self._record('errors')
+            # Alternate between the two failure kinds maps_service handles
+            if self.calls['errors'] % 2:
+                raise TransportError('Stand-in Maps network error')
+            raise ApiError('UNKNOWN_ERROR', 'Stand-in Maps error')
+
+    @staticmethod
+    def _coords(text):
+        digest = hashlib.sha256(text.encode()).digest()
+        return {'lat': 8 + digest[0] / 32, 'lng': 74 + digest[1] / 32}
+
+    def geocode(self, address, **kwargs):
+        self._call('geocode')
+        return [{'geometry': {'location': self._coords(address)}, 'formatted_address': address}]
+
+    def find_place(self, input, input_type, **kwargs):
+        self._call('find_place')
+        return {'candidates': [{'place_id': 'stand-in-' + hashlib.sha256(input.encode()).hexdigest()[:16]}]}
+
+    def place(self, place_id, **kwargs):
+        self._call('place')
+        return {'result': {
+            'place_id': place_id,
+            'geometry': {'location': self._coords(place_id)},
+            'formatted_address': f"Stand-in address for {place_id}",
+        }}
+
+    def places_nearby(self, location=None, **kwargs):
+        self._call('places_nearby')
+        return {'results': []}
@@ -0,0 +1,114 @@
+import re
+from decimal import Decimal, InvalidOperation
+
+from django.db.models import Avg, Count, Max, Min, Sum
+
+from ..models import ItinerarySummary
+
+# Amounts such as "4,500", "₹ 6000.50", "5k" or "1.2 lakh", but not counts like "2 days" or "3 people"
+_AMOUNT_PATTERN = re.compile(
+    r'(\d[\d,]*(?:\.\d+)?)\s*(k|lakhs?|lacs?)?(?![a-z])(?!\s*(?:days?|nights?|people|persons?|pax|adults?|travell?ers?)\b)',
+    re.IGNORECASE,
+)
+_MULTIPLIERS = {'k': 1000, 'lakh': 100000, 'lakhs': 100000, 'lac': 100000, 'lacs': 100000}
+
+SUMMARY_UPDATE_FIELDS = [
+    'user', 'trip_name', 'duration', 'departure', 'destination', 'destination_key', 'start_date', 'end_date',
+    'num_days', 'budget_text', 'budget_min', 'budget_max', 'first_hotel', 'created_at',
+]
+
+
+def parse_budget_range(text):
+    """Parse a budget like "₹4,500 - ₹6,000 per person" into (min, max) Decimals.
+
+    A single amount gives min == max; text without amounts gives (None, None).
+    """
+    amounts = []
+    for number, unit in _AMOUNT_PATTERN.findall(str(text or '')):
+        try:
+            amount = Decimal(number.replace(',', ''))
+        except InvalidOperation:
+            continue
+        amounts.append(amount * _MULTIPLIERS.get(unit.lower(), 1))
+    if not amounts:
+        return None, None
+    return min(amounts).quantize(Decimal('0.01')), max(amounts).quantize(Decimal('0.01'))
+
+
+def normalize_destination(destination):
+    """Lookup key for destination filters: lowercased with whitespace collapsed"""
+    return re.sub(r'\s+', ' ', destination or '').strip().lower()[:255]
+
+
+def _first_hotel(itinerary_data):
+    recommendations = itinerary_data.get('hotelRecommendations')
+    for recommendation in recommendations if isinstance(recommendations, list) else []:
+        options = recommendation.get('options') if isinstance(recommendation, dict) else None
+        for option in options if isinstance(options, list) else []:
+            if str(option).strip().lower() not in ('', 'none'):
+                return str(option)[:255]
+    return ''
+
+
+def build_summary(itinerary, preference):
+    """Unsaved ItinerarySummary for an itinerary and the preference it was generated from."""
+    data = itinerary.itinerary_data if isinstance(itinerary.itinerary_data, dict) else {}
+    budget = data.get('budgetCalculation')
+    budget_text = budget.get('totalEstimatedBudgetPerPerson') if isinstance(budget, dict) else None
+    budget_min, budget_max = parse_budget_range(budget_text)
+    destination = preference.destination or ''
+    return ItinerarySummary(
+        itinerary=itinerary,
+        user_id=itinerary.user_id,
+        trip_name=str(data.get('tripName') or '')[:255],
+        duration=str(data.get('duration') or '')[:100],
+        departure=str(data.get('startPoint') or preference.departure or '')[:255],
+        destination=destination[:255],
+        destination_key=normalize_destination(destination),
+        start_date=preference.start_date,
+        end_date=preference.end_date,
+        num_days=len(data['itinerary']) if isinstance(data.get('itinerary'), list) else 0,
+        budget_text=str(budget_text or '')[:255],
+        budget_min=budget_min,
+        budget_max=budget_max,
+        first_hotel=_first_hotel(data),
+        created_at=itinerary.created_at,
+    )
+
+
+def save_summaries(pairs):
+    """Insert or refresh the summaries of (itinerary, preference) pairs in one statement."""
+    summaries = [build_summary(itinerary, preference) for itinerary, preference in pairs]
+    ItinerarySummary.objects.bulk_create(
+        summaries, update_conflicts=True, unique_fields=['itinerary'], update_fields=SUMMARY_UPDATE_FIELDS,
+    )
+    return summaries
+
+
+def summary_dashboard(user_id, today, limit=5):
+    """Trip totals, upcoming trips and top destinations, read from the summary table only."""
+    summaries = ItinerarySummary.objects.filter(user_id=user_id)
+    totals = summaries.aggregate(
+        trips=Count('pk'),
+        total_days=Sum('num_days'),
+        average_budget_min=Avg('budget_min'),
+        average_budget_max=Avg('budget_max'),
+        first_trip=Min('start_date'),
+        last_trip=Max('start_date'),
+    )
+    upcoming = list(
+        summaries.filter(start_date__gte=today).order_by('start_date', 'itinerary_id').values(
+            'itinerary_id', 'trip_name', 'destination', 'start_date', 'end_date', 'num_days', 'first_hotel',
+        )[:limit]
+    )
+    destinations = list(
+        summaries.exclude(destination_key='').values('destination_key')
+        .annotate(destination=Min('destination'), trips=Count('pk'))
+        .order_by('-trips', 'destination_key')[:limit]
+    )
+    return {
+        **totals,
+        'total_days': totals['total_days'] or 0,
+        'upcoming': [{'id': row.pop('itinerary_id'), **row} for row in upcoming],
+        'top_destinations': [{'destination': row['destination'], 'trips': row['trips']} for row in destinations],
+    }
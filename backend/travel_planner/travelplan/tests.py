@@ -1,3 +1,1235 @@
-from django.test import TestCase
+import json
+import tempfile
+import threading
+import time
+from datetime import timedelta
+from decimal import Decimal
+from io import StringIO
+from unittest import mock, skipUnless
 
-# Create your tests here.
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.db import OperationalError, connection, transaction
+from django.db.models import F
+from django.test import SimpleTestCase
+from django.urls import reverse
+from django.utils import timezone
+from googlemaps.exceptions import ApiError
+from rest_framework.test import APITestCase, APITransactionTestCase
+
+from .fields import EncodedJSON, decoded
+from .models import (
+    CompressionDictionary, GeneratedItinerary, GenerationLock, GeocodeCacheEntry, Itinerary, ItineraryJob,
+    ItineraryLocation, ItineraryPlace, ItinerarySummary, RateLimitBucket, ResolvedPlace, UserPreference,
+)
+from .services import (
+    cassette, compression, gemini_service, generation_cache, geocode_cache, itinerary_service, job_queue,
+    location_service, maps_service, metrics, place_cache, place_index,
+)
+from .services.database import retry_on_lock
+from .services.itinerary_service import create_itinerary, user_itineraries
+from .services.json_repair import JSONExtractionError, parse_json_object
+from .services.place_index import find_places
+from .services.rate_limit import RateLimitExceeded, acquire, clear_prefetched, rate_limit_user
+from .services.resilience import STATE_CLOSED, STATE_HALF_OPEN, CircuitBreaker, ResilientCaller
+from .services.single_flight import single_flight
+from .services.stand_ins import stand_in_itinerary
+from .services.summary_service import parse_budget_range
+
+
+class UserItinerariesQueryCountTests(APITestCase):
+    """Each read path of user-itineraries runs a fixed number of queries."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('reader', password='pw')
+        other = User.objects.create_user('other', password='pw')
+        cls.itineraries = []
+        for owner in [cls.user] * 3 + [other]:
+            preference = UserPreference.objects.create(user=owner, departure='Palakkad', destination='Ooty')
+            itinerary = Itinerary.objects.create(
+                user=owner, preference=preference, itinerary_data={'tripName': f'Trip {preference.pk}'},
+            )
+            ItineraryLocation.objects.bulk_create([
+                ItineraryLocation(
+                    itinerary=itinerary, kind=kind, position=0, name=f'{kind} {itinerary.pk}', context='Ooty',
+                    place_id=f'place-{kind}-{itinerary.pk}', lat=11.4, lng=76.7, address='Ooty',
+                    status=ItineraryLocation.STATUS_RESOLVED, resolved_at=timezone.now(),
+                )
+                for kind in (ItineraryLocation.KIND_HOTEL, ItineraryLocation.KIND_RESTAURANT)
+            ])
+            if owner == cls.user:
+                cls.itineraries.append(itinerary)
+        cls.url = reverse('user_itineraries')
+
+    def setUp(self):
+        self.client.force_authenticate(self.user)
+
+    def test_list(self):
+        with self.assertNumQueries(1):
+            response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([row['id'] for row in response.json()['results']],
+                         [itinerary.pk for itinerary in reversed(self.itineraries)])
+
+    def test_latest_detail(self):
+        with self.assertNumQueries(2):
+            response = self.client.get(self.url, {'latest': 'true', 'detail': 'true'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['itinerary'], self.itineraries[-1].itinerary_data)
+        self.assertEqual(len(response.json()['hotels']), 1)
+
+    def test_by_id(self):
+        itinerary = self.itineraries[0]
+        with self.assertNumQueries(1):
+            response = self.client.get(self.url, {'id': itinerary.pk})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['user'], self.user.pk)
+        self.assertEqual(response.json()['preference'], itinerary.preference_id)
+
+    def test_by_id_detail(self):
+        itinerary = self.itineraries[0]
+        with self.assertNumQueries(2):
+            response = self.client.get(self.url, {'id': itinerary.pk, 'detail': 'true'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['restaurants'][0]['placeId'], f'place-restaurant-{itinerary.pk}')
+
+    def test_other_users_itinerary_is_not_found(self):
+        other_itinerary = Itinerary.objects.exclude(user=self.user).get()
+        response = self.client.get(self.url, {'id': other_itinerary.pk})
+        self.assertEqual(response.status_code, 404)
+        self.assertEqual(response.json(), {'error': 'Itinerary not found'})
+
+    def test_no_itineraries(self):
+        self.client.force_authenticate(User.objects.create_user('new', password='pw'))
+        for params in ({}, {'latest': 'true', 'detail': 'true'}, {'id': self.itineraries[0].pk}):
+            response = self.client.get(self.url, params)
+            self.assertEqual(response.status_code, 404)
+            self.assertEqual(response.json(), {'error': 'No itineraries found'})
+
+    @skipUnless(connection.vendor == 'sqlite', 'Reads the SQLite query plan')
+    def test_reads_use_user_created_index(self):
+        sql, params = user_itineraries(self.user.pk).values('id')[:20].query.sql_with_params()
+        with connection.cursor() as cursor:
+            cursor.execute(f'EXPLAIN QUERY PLAN {sql}', params)
+            plan = ' '.join(str(row[-1]) for row in cursor.fetchall())
+        self.assertIn('itinerary_user_created_idx', plan)
+        self.assertNotIn('TEMP B-TREE', plan)
+
+
+class ItineraryListPaginationTests(APITestCase):
+    """The itinerary listing pages on (created_at, id) and projects the requested fields."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('pager', password='pw')
+        preference = UserPreference.objects.create(user=cls.user, departure='Kochi', destination='Ooty')
+        cls.ids = [
+            Itinerary.objects.create(user=cls.user, preference=preference, itinerary_data={'tripName': str(i)}).pk
+            for i in range(5)
+        ]
+        # Three itineraries share a created_at; ties are broken by id
+        Itinerary.objects.filter(pk__in=cls.ids[1:4]).update(created_at=timezone.now() - timedelta(hours=1))
+        cls.url = reverse('user_itineraries')
+
+    def setUp(self):
+        self.client.force_authenticate(self.user)
+
+    def test_cursor_round_trip_across_equal_created_at(self):
+        pages, cursor = [], None
+        while True:
+            params = {'page_size': 2, **({'cursor': cursor} if cursor else {})}
+            page = self.client.get(self.url, params).json()
+            pages.append([row['id'] for row in page['results']])
+            cursor = page['next_cursor']
+            if not cursor:
+                break
+        first, second, third, fourth, fifth = self.ids
+        self.assertEqual(pages, [[fifth, first], [fourth, third], [second]])
+
+    def test_fields_projection(self):
+        row = self.client.get(self.url, {'fields': 'id, itinerary_data'}).json()['results'][0]
+        self.assertEqual(row, {'id': self.ids[-1], 'itinerary_data': {'tripName': '4'}})
+        self.assertNotIn('itinerary_data', self.client.get(self.url).json()['results'][0])
+
+    def test_invalid_requests(self):
+        for params, error in [
+            ({'cursor': 'not-a-cursor'}, 'Invalid cursor'),
+            ({'fields': 'id,secret'}, 'Unknown fields: secret'),
+            ({'page_size': '0'}, 'Invalid page_size'),
+            ({'page_size': 'ten'}, 'Invalid page_size'),
+        ]:
+            response = self.client.get(self.url, params)
+            self.assertEqual((response.status_code, response.json()), (400, {'error': error}), params)
+
+    def test_page_size_is_clamped(self):
+        with self.settings(ITINERARY_MAX_PAGE_SIZE=3):
+            page = self.client.get(self.url, {'page_size': 100}).json()
+        self.assertEqual(len(page['results']), 3)
+        self.assertIsNotNone(page['next_cursor'])
+
+
+class ItinerarySummaryTests(APITestCase):
+    """Summaries are written with the itinerary and serve the trip-card listing."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('planner', password='pw')
+        trips = [
+            ('Ooty', '2030-01-10', '₹4,500 - ₹6,000'),
+            ('Munnar', '2030-02-01', '3000 Rupees'),
+            (' ooty ', '2030-03-01', 'unspecified'),
+        ]
+        for destination, start, budget in trips:
+            preference = UserPreference.objects.create(
+                user=cls.user, departure='Kochi', destination=destination, start_date=start, end_date=start,
+            )
+            create_itinerary(preference, {
+                'tripName': f'{destination.strip()} trip',
+                'itinerary': [{'day': 1, 'schedule': []}],
+                'hotelRecommendations': [{'options': ['None', f'{destination.strip()} Inn']}],
+                'budgetCalculation': {'totalEstimatedBudgetPerPerson': budget},
+            })
+        cls.url = reverse('itinerary_summaries')
+
+    def setUp(self):
+        self.client.force_authenticate(self.user)
+
+    def test_parse_budget_range(self):
+        self.assertEqual(parse_budget_range('₹4,500 - ₹6,000 per person'), (Decimal('4500.00'), Decimal('6000.00')))
+        self.assertEqual(parse_budget_range('INR 5k for 2 people'), (Decimal('5000.00'), Decimal('5000.00')))
+        self.assertEqual(parse_budget_range('unspecified'), (None, None))
+
+    def test_summary_written_with_itinerary(self):
+        summary = ItinerarySummary.objects.get(destination='Ooty')
+        self.assertEqual(summary.trip_name, 'Ooty trip')
+        self.assertEqual(summary.num_days, 1)
+        self.assertEqual(summary.first_hotel, 'Ooty Inn')
+        self.assertEqual((summary.budget_min, summary.budget_max), (Decimal('4500.00'), Decimal('6000.00')))
+
+    def test_filter_and_order_in_one_query(self):
+        with self.assertNumQueries(1):
+            response = self.client.get(self.url, {'destination': 'OOTY', 'ordering': 'start_date'})
+        self.assertEqual([row['trip_name'] for row in response.json()['results']], ['Ooty trip', 'ooty trip'])
+
+        response = self.client.get(self.url, {'ordering': '-budget', 'page_size': 1})
+        self.assertEqual(response.json()['results'][0]['trip_name'], 'Ooty trip')
+        response = self.client.get(self.url, {'ordering': '-budget', 'cursor': response.json()['next_cursor']})
+        # The summary without a parsed budget is left out of the budget ordering
+        self.assertEqual([row['trip_name'] for row in response.json()['results']], ['Munnar trip'])
+
+
+class CompressedItineraryDataTests(APITestCase):
+    """itinerary_data is stored compressed and decoded on first access."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('compressed', password='pw')
+        cls.preference = UserPreference.objects.create(user=cls.user, departure='Kochi', destination='Munnar')
+        cls.data = stand_in_itinerary('Kochi', 'Munnar', days=4)
+
+    def setUp(self):
+        compression.clear_dictionary_cache()
+        self.addCleanup(compression.clear_dictionary_cache)
+
+    def _stored_bytes(self, itinerary_id):
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT itinerary_data FROM travelplan_itinerary WHERE id = %s', [itinerary_id])
+            return bytes(cursor.fetchone()[0])
+
+    def test_round_trip_is_compressed_and_lazy(self):
+        itinerary = Itinerary.objects.create(user=self.user, preference=self.preference, itinerary_data=self.data)
+        stored = self._stored_bytes(itinerary.pk)
+        self.assertLess(len(stored), len(compression.dumps(self.data)) / 2)
+
+        loaded = Itinerary.objects.get(pk=itinerary.pk)
+        self.assertIsInstance(loaded.__dict__['itinerary_data'], EncodedJSON)
+        self.assertEqual(loaded.itinerary_data, self.data)
+        self.assertEqual(decoded(Itinerary.objects.values_list('itinerary_data', flat=True).get(pk=itinerary.pk)),
+                         self.data)
+
+        # Saving without touching the field writes the stored bytes back as they were
+        untouched = Itinerary.objects.get(pk=itinerary.pk)
+        untouched.save()
+        self.assertIsInstance(untouched.__dict__['itinerary_data'], EncodedJSON)
+        self.assertEqual(self._stored_bytes(itinerary.pk), stored)
+
+    def test_trained_dictionary(self):
+        samples = [compression.dumps(stand_in_itinerary(f'Start {i}', 'Munnar', days=3)) for i in range(20)]
+        dictionary = CompressionDictionary.objects.create(
+            codec=compression.CODEC_ZLIB,
+            data=compression.train_dictionary(samples, compression.CODEC_ZLIB, 4096),
+            sample_count=len(samples),
+        )
+        itinerary = Itinerary.objects.create(user=self.user, preference=self.preference, itinerary_data=self.data)
+        stored = self._stored_bytes(itinerary.pk)
+        self.assertEqual(compression.HEADER.unpack_from(stored)[1], dictionary.pk)
+
+        compression.clear_dictionary_cache()
+        self.assertEqual(Itinerary.objects.get(pk=itinerary.pk).itinerary_data, self.data)
+        with self.settings(ITINERARY_DATA_DICTIONARY=False):
+            self.assertLess(len(stored), len(compression.encode(self.data)))
+
+
+class DatabaseProfileTests(APITestCase):
+    """SQLite production pragmas and retries of writes that hit a locked database."""
+
+    @skipUnless(connection.vendor == 'sqlite', 'SQLite pragmas')
+    def test_production_pragmas(self):
+        with self.settings(SQLITE_PRODUCTION=True, SQLITE_BUSY_TIMEOUT_MS=1234, SQLITE_CACHE_SIZE_KB=2048):
+            # A new connection, configured by the connection_created receiver
+            fresh = connection.copy()
+            self.addCleanup(fresh.close)
+            with fresh.cursor() as cursor:
+                self.assertEqual(cursor.execute('PRAGMA busy_timeout').fetchone()[0], 1234)
+                self.assertEqual(cursor.execute('PRAGMA cache_size').fetchone()[0], -2048)
+                self.assertEqual(cursor.execute('PRAGMA synchronous').fetchone()[0], 1)  # NORMAL
+
+    def test_retry_on_lock(self):
+        metrics.reset()
+        calls = mock.Mock(side_effect=[OperationalError('database is locked'), 'saved'], __name__='save')
+        # Test cases run inside a transaction; pretend this call is the outermost one
+        with self.settings(DB_LOCK_RETRY_BACKOFF=0.001), \
+                mock.patch.object(transaction.get_connection(), 'in_atomic_block', False):
+            self.assertEqual(retry_on_lock(calls)(), 'saved')
+        self.assertEqual(calls.call_count, 2)
+        self.assertEqual(metrics.get_counter('db_lock_retries_total', {'operation': 'save'}), 1)
+
+        # Inside an atomic block only the outermost transaction can be retried
+        inner = mock.Mock(side_effect=OperationalError('database is locked'), __name__='save')
+        with self.assertRaises(OperationalError):
+            retry_on_lock(inner)()
+        self.assertEqual(inner.call_count, 1)
+
+
+class PlaceIndexTests(APITestCase):
+    """Hotels and restaurants are indexed when an itinerary is saved and looked up without decoding it."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('traveller', password='pw')
+        cls.other = User.objects.create_user('someone', password='pw', is_staff=True)
+        for owner, hotel in [(cls.user, 'Lake View'), (cls.user, 'Hill Top'), (cls.other, 'Lake View')]:
+            preference = UserPreference.objects.create(user=owner, departure='Palakkad', destination='Ooty')
+            create_itinerary(preference, {
+                'startPoint': 'Palakkad',
+                'hotelRecommendations': [{'options': [hotel, 'None'], 'placeId': f'pid-{hotel}'}],
+                'itinerary': [{'day': 2, 'schedule': [
+                    {'time': '01:00 PM - 02:00 PM', 'activity': 'Lunch at Nilgiri Kitchen or Earl\'s Cafe'},
+                    {'time': '03:00 PM', 'activity': 'Boating'},
+                ]}],
+            })
+        cls.itineraries = list(Itinerary.objects.order_by('id'))
+
+    def setUp(self):
+        self.client.force_authenticate(self.user)
+
+    def test_places_written_with_itinerary(self):
+        places = ItineraryPlace.objects.filter(itinerary=self.itineraries[0])
+        self.assertEqual(
+            [(p.kind, p.name_key, p.place_id, p.day, p.time_slot) for p in places.order_by('kind', 'position')],
+            [
+                ('hotel', 'lake view', 'pid-Lake View', None, ''),
+                ('restaurant', 'nilgiri kitchen', '', 2, '01:00 PM - 02:00 PM'),
+                ("restaurant", "earl's cafe", '', 2, '01:00 PM - 02:00 PM'),
+            ],
+        )
+
+    def test_itineraries_with_place(self):
+        url = reverse('place_itineraries')
+        with self.assertNumQueries(1):
+            response = self.client.get(url, {'name': '  Lake   VIEW ', 'kind': 'hotel'})
+        self.assertEqual([row['itinerary'] for row in response.json()['results']], [self.itineraries[0].pk])
+
+        response = self.client.get(url, {'name': 'nilgiri kitchen', 'page_size': 1})
+        self.assertEqual(response.json()['results'][0]['itinerary'], self.itineraries[1].pk)
+        response = self.client.get(url, {'name': 'nilgiri kitchen', 'cursor': response.json()['next_cursor']})
+        self.assertEqual([row['itinerary'] for row in response.json()['results']], [self.itineraries[0].pk])
+
+        self.client.force_authenticate(self.other)
+        response = self.client.get(url, {'place_id': 'pid-Lake View', 'all': 'true'})
+        self.assertEqual(len(response.json()['results']), 2)
+        self.assertEqual(self.client.get(url, {'kind': 'hotel'}).status_code, 400)
+
+    def test_itinerary_listed_once_per_page_and_across_pages(self):
+        user = User.objects.create_user('repeat', password='pw')
+        itineraries = []
+        for mentions in (3, 1, 3):
+            preference = UserPreference.objects.create(user=user, departure='Kochi', destination='Munnar')
+            schedule = [{'time': f'0{hour}:00 PM', 'activity': 'Dinner at Tea Valley'} for hour in range(mentions - 1)]
+            itineraries.append(create_itinerary(preference, {
+                'hotelRecommendations': [{'options': ['Tea Valley']}],
+                'itinerary': [{'day': 1, 'schedule': schedule}],
+            }))
+        self.client.force_authenticate(user)
+        url = reverse('place_itineraries')
+        newest_first = [itinerary.pk for itinerary in reversed(itineraries)]
+
+        response = self.client.get(url, {'name': 'tea valley'})
+        self.assertEqual([row['itinerary'] for row in response.json()['results']], newest_first)
+
+        # One itinerary per page, with the index rows fetched one itinerary's worth at a time
+        pages, cursor = [], None
+        with mock.patch('travelplan.pagination.PLACE_ROWS_PER_ITINERARY', 1):
+            while True:
+                params = {'name': 'tea valley', 'page_size': 1, **({'cursor': cursor} if cursor else {})}
+                page = self.client.get(url, params).json()
+                pages.append([row['itinerary'] for row in page['results']])
+                cursor = page['next_cursor']
+                if not cursor:
+                    break
+        self.assertEqual(pages, [[pk] for pk in newest_first])
+
+    def test_top_places(self):
+        response = self.client.get(reverse('top_places'), {'destination': 'ooty', 'kind': 'hotel'})
+        self.assertEqual(response.json()['results'], [
+            {'name': 'Lake View', 'itineraries': 2}, {'name': 'Hill Top', 'itineraries': 1},
+        ])
+
+    def test_rebuild(self):
+        ItineraryPlace.objects.filter(itinerary=self.itineraries[1]).delete()
+        before = ItineraryPlace.objects.count()
+        call_command('rebuild_place_index', missing=True, stdout=StringIO())
+        self.assertEqual(ItineraryPlace.objects.count(), before + 3)
+        call_command('rebuild_place_index', batch_size=2, stdout=StringIO())
+        self.assertEqual(ItineraryPlace.objects.count(), before + 3)
+
+    def test_malformed_itinerary_data_is_skipped(self):
+        preference = UserPreference.objects.create(user=self.user, departure='Palakkad', destination='Ooty')
+        # Older rows store itinerary as a dict of days; model output can put anything anywhere
+        itinerary = create_itinerary(preference, {
+            'tripName': 'Old format',
+            'itinerary': {'day1': 'Lunch at Lake View', 'day2': ['Boating']},
+            'hotelRecommendations': ['Hill Top', {'options': 'Lake View'}, {'options': [None, 'Tea Valley']}],
+        })
+        self.assertEqual([(p.kind, p.name) for p in ItineraryPlace.objects.filter(itinerary=itinerary)],
+                         [('hotel', 'Tea Valley')])
+        self.assertEqual(ItinerarySummary.objects.get(itinerary=itinerary).first_hotel, 'Tea Valley')
+
+        itinerary = create_itinerary(preference, {'itinerary': [
+            'Day 1', {'day': 1, 'schedule': 'Relax'},
+            {'day': 2, 'schedule': ['Lunch at Nowhere', {'activity': None}, {'activity': 'Dinner at Spice Route'}]},
+        ]})
+        self.assertEqual([(p.kind, p.name, p.day) for p in ItineraryPlace.objects.filter(itinerary=itinerary)],
+                         [('restaurant', 'spice route', 2)])
+
+    def test_rebuild_skips_rows_it_cannot_index(self):
+        preference = UserPreference.objects.create(user=self.user, departure='Palakkad', destination='Ooty')
+        legacy = Itinerary.objects.create(user=self.user, preference=preference, itinerary_data={
+            'itinerary': {'day1': {'schedule': 'Lunch at Lake View'}}, 'hotelRecommendations': [{'options': 'None'}],
+        })
+        broken = self.itineraries[1]
+        build_places = place_index.build_places
+
+        def fail_on_broken(itinerary, preference):
+            if itinerary.pk == broken.pk:
+                raise ValueError('Corrupt itinerary_data')
+            return build_places(itinerary, preference)
+
+        before = ItineraryPlace.objects.filter(itinerary=broken).count()
+        stdout, stderr = StringIO(), StringIO()
+        with mock.patch('travelplan.management.commands.rebuild_place_index.build_places', fail_on_broken):
+            call_command('rebuild_place_index', batch_size=2, stdout=stdout, stderr=stderr)
+        self.assertIn(f"Skipped itinerary {broken.pk}: ValueError('Corrupt itinerary_data')", stderr.getvalue())
+        self.assertIn('Done: 6 places from 3 itineraries, 1 skipped', stdout.getvalue())
+        # The skipped itinerary keeps its existing rows; the legacy one simply has none
+        self.assertEqual(ItineraryPlace.objects.filter(itinerary=broken).count(), before)
+        self.assertFalse(ItineraryPlace.objects.filter(itinerary=legacy).exists())
+
+    @skipUnless(connection.vendor == 'sqlite', 'Reads the SQLite query plan')
+    def test_name_lookup_uses_index(self):
+        sql, params = find_places(self.user.pk, name='Lake View').values('id')[:20].query.sql_with_params()
+        with connection.cursor() as cursor:
+            cursor.execute(f'EXPLAIN QUERY PLAN {sql}', params)
+            plan = ' '.join(str(row[-1]) for row in cursor.fetchall())
+        self.assertIn('place_user_name_idx', plan)
+        self.assertNotIn('TEMP B-TREE', plan)
+
+
+class GeocodeCacheTests(APITestCase):
+    """Context geocodes go through the in-process LRU, then the shared table, then the Maps API."""
+
+    def setUp(self):
+        geocode_cache.clear_local_cache()
+        self.addCleanup(geocode_cache.clear_local_cache)
+        self.maps = mock.Mock()
+        self.maps.geocode.return_value = [{'geometry': {'location': {'lat': 11.41, 'lng': 76.69}}}]
+
+    def test_normalize_location(self):
+        self.assertEqual(geocode_cache.normalize_location('  Ooty ,Tamil   Nadu. '), 'ooty, tamil nadu')
+        self.assertEqual(geocode_cache.normalize_location('OOTY,  tamil nadu'), 'ooty, tamil nadu')
+        self.assertEqual(geocode_cache.normalize_location(None), '')
+
+    def test_lru_then_table_then_api(self):
+        self.assertEqual(geocode_cache.geocode_location(self.maps, 'Ooty, Tamil Nadu'), (11.41, 76.69))
+        self.assertEqual(self.maps.geocode.call_count, 1)
+        entry = GeocodeCacheEntry.objects.get()
+        self.assertEqual((entry.query, entry.found), ('ooty, tamil nadu', True))
+
+        # A differently spelled lookup of the same place is served from the LRU without a query
+        with self.assertNumQueries(0):
+            self.assertEqual(geocode_cache.geocode_location(self.maps, ' OOTY ,tamil nadu '), (11.41, 76.69))
+
+        # Another process (an empty LRU) reads the shared table
+        geocode_cache.clear_local_cache()
+        with self.assertNumQueries(1):
+            self.assertEqual(geocode_cache.geocode_location(self.maps, 'Ooty, Tamil Nadu'), (11.41, 76.69))
+        self.assertEqual(self.maps.geocode.call_count, 1)
+
+        # Expired rows fall through to the API again
+        geocode_cache.clear_local_cache()
+        GeocodeCacheEntry.objects.update(expires_at=timezone.now() - timedelta(seconds=1))
+        geocode_cache.geocode_location(self.maps, 'Ooty, Tamil Nadu')
+        self.assertEqual(self.maps.geocode.call_count, 2)
+
+    def test_negative_results_use_the_negative_ttl(self):
+        self.maps.geocode.return_value = []
+        with self.settings(GEOCODE_CACHE_NEGATIVE_TTL=60):
+            self.assertIsNone(geocode_cache.geocode_location(self.maps, 'Nowhere'))
+        entry = GeocodeCacheEntry.objects.get()
+        self.assertFalse(entry.found)
+        self.assertAlmostEqual((entry.expires_at - timezone.now()).total_seconds(), 60, delta=5)
+
+        geocode_cache.clear_local_cache()
+        self.assertIsNone(geocode_cache.geocode_location(self.maps, 'nowhere'))
+        self.assertEqual(self.maps.geocode.call_count, 1)
+
+    def test_api_errors_are_not_cached(self):
+        self.maps.geocode.side_effect = ConnectionError('Maps is down')
+        with self.assertRaises(ConnectionError):
+            geocode_cache.geocode_location(self.maps, 'Ooty')
+        self.assertFalse(GeocodeCacheEntry.objects.exists())
+
+        self.maps.geocode.side_effect = None
+        self.assertEqual(geocode_cache.geocode_location(self.maps, 'Ooty'), (11.41, 76.69))
+
+
+class PlaceCacheTests(APITestCase):
+    """Resolved places are reused for PLACE_CACHE_MAX_AGE, unresolved ones only for the negative max age."""
+
+    found = {'placeId': 'pid-1', 'lat': 11.4, 'lng': 76.7, 'address': 'Ooty'}
+    not_found = {'placeId': 'ID not available', 'lat': None, 'lng': None, 'address': 'Not found'}
+
+    def _lookup(self):
+        return place_cache.lookup_places([
+            {'name': 'Lake View', 'context': 'Ooty'}, {'name': 'Nowhere Cafe', 'context': 'Ooty'},
+        ])
+
+    def test_negative_results_expire_early(self):
+        with self.settings(PLACE_CACHE_NEGATIVE_MAX_AGE=3600):
+            place_cache.store_places([(('Lake View', 'Ooty'), self.found), (('Nowhere Cafe', 'Ooty'), self.not_found)])
+            self.assertEqual(self._lookup(), {
+                ('lake view', 'ooty'): self.found, ('nowhere cafe', 'ooty'): self.not_found,
+            })
+
+            ResolvedPlace.objects.update(resolved_at=timezone.now() - timedelta(hours=2))
+            self.assertEqual(self._lookup(), {('lake view', 'ooty'): self.found})
+
+    def test_errors_and_disabled_negatives_are_not_stored(self):
+        error = {'placeId': 'Error: timeout', 'lat': None, 'lng': None, 'address': 'Error'}
+        with self.settings(PLACE_CACHE_NEGATIVE_MAX_AGE=0):
+            place_cache.store_places([(('Lake View', 'Ooty'), error), (('Nowhere Cafe', 'Ooty'), self.not_found)])
+        self.assertFalse(ResolvedPlace.objects.exists())
+
+
+class PlaceResolutionTests(APITestCase):
+    """Cache misses are looked up concurrently and come back in input order."""
+
+    # Earlier entries take longer, so lookups finish in reverse order
+    delays = {'Lake View': 0.15, 'Hill Top': 0.1, 'Tea Valley': 0.05}
+    entries = [
+        {'name': 'Lake View', 'context': 'Ooty'}, {'name': 'Relax', 'context': 'Ooty'},
+        {'name': 'Hill Top', 'context': 'Ooty'}, {'name': 'Tea Valley', 'context': 'Ooty'},
+        {'name': 'lake view', 'context': 'Ooty'},
+    ]
+
+    def setUp(self):
+        self.calls = []
+        self.active = self.overlap = 0
+        self.lock = threading.Lock()
+        patcher = mock.patch.object(maps_service, '_fetch_place_remote', side_effect=self._lookup)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def _lookup(self, name, context_location, existing_place_id=None):
+        with self.lock:
+            self.calls.append(name)
+            self.active += 1
+            self.overlap = max(self.overlap, self.active)
+        time.sleep(self.delays[name])
+        with self.lock:
+            self.active -= 1
+        return {'placeId': f'pid-{name}', 'lat': 11.4, 'lng': 76.7, 'address': context_location}
+
+    def _assert_resolved(self, locations):
+        self.assertEqual([location['placeId'] for location in locations], [
+            'pid-Lake View', 'ID not available', 'pid-Hill Top', 'pid-Tea Valley', 'pid-Lake View',
+        ])
+        # Fillers are skipped, repeated places looked up once, and the lookups overlap
+        self.assertEqual(sorted(self.calls), ['Hill Top', 'Lake View', 'Tea Valley'])
+        self.assertEqual(self.overlap, 3)
+
+    def test_lookups_overlap_and_keep_input_order(self):
+        self._assert_resolved(maps_service.resolve_places(self.entries))
+        self.assertEqual(ResolvedPlace.objects.count(), 3)
+
+        # The streaming variant yields in completion order, each with its input index
+        ResolvedPlace.objects.all().delete()
+        self.calls.clear()
+        indexes = [index for index, _ in maps_service.iter_resolve_places(self.entries)]
+        self.assertEqual(indexes, [1, 3, 2, 0, 4])
+
+    async def test_async_lookups_overlap_and_keep_input_order(self):
+        self._assert_resolved(await maps_service.resolve_places_async(self.entries))
+
+
+class AsyncLocationLoadTests(APITestCase):
+    """Async detail reads re-resolve stale locations without the blocking resolver."""
+
+    @classmethod
+    def setUpTestData(cls):
+        user = User.objects.create_user('async', password='pw')
+        preference = UserPreference.objects.create(user=user, departure='Kochi', destination='Ooty')
+        cls.itinerary = Itinerary.objects.create(user=user, preference=preference, itinerary_data={})
+        ItineraryLocation.objects.create(
+            itinerary=cls.itinerary, kind=ItineraryLocation.KIND_HOTEL, position=0, name='Lake View', context='Ooty',
+            status=ItineraryLocation.STATUS_FAILED, resolved_at=timezone.now(),
+        )
+
+    async def test_stale_rows_resolved_async(self):
+        itinerary = self.itinerary
+        resolved = {'placeId': 'pid-1', 'lat': 11.4, 'lng': 76.7, 'address': 'Ooty'}
+        with mock.patch.object(location_service, 'resolve_places', side_effect=AssertionError('blocking')), \
+                mock.patch.object(location_service, 'resolve_places_async', return_value=[resolved]) as resolve:
+            hotels, restaurants = await location_service.load_itinerary_locations_async(itinerary)
+        resolve.assert_awaited_once()
+        self.assertEqual((hotels, restaurants), ([resolved], []))
+        row = await ItineraryLocation.objects.aget(itinerary=itinerary)
+        self.assertEqual((row.place_id, row.status), ('pid-1', ItineraryLocation.STATUS_RESOLVED))
+
+
+class JobLeaseTests(APITransactionTestCase):
+    """A running job keeps its lease while a single stage outlasts it."""
+
+    def test_heartbeat_renews_lease_during_long_stage(self):
+        user = User.objects.create_user('worker', password='pw')
+        preference = UserPreference.objects.create(user=user, departure='Kochi', destination='Ooty')
+        job_queue.enqueue_job(user, preference)
+        claimed_by_other = []
+
+        def slow_generation(preference, on_progress):
+            on_progress('generating', 10)
+            time.sleep(1.5)  # Longer than the lease
+            claimed_by_other.append(job_queue.claim_next_job('worker-2'))
+            return Itinerary.objects.create(user=user, preference=preference, itinerary_data={}), {}
+
+        with self.settings(ITINERARY_JOB_LEASE_SECONDS=1, ITINERARY_JOB_HEARTBEAT_SECONDS=0.2), \
+                mock.patch.object(job_queue, 'run_generation', side_effect=slow_generation):
+            job = job_queue.claim_next_job('worker-1')
+            job_queue.run_job(job, 'worker-1')
+
+        self.assertEqual(claimed_by_other, [None])
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.worker_id, job.attempts), (ItineraryJob.STATUS_SUCCEEDED, 'worker-1', 1))
+
+
+class ItineraryVariantsTests(APITransactionTestCase):
+    """Variants are generated on worker threads and saved together; a failed variant does not sink the others."""
+
+    def setUp(self):
+        self.user = User.objects.create_user('variants', password='pw')
+        self.client.force_authenticate(self.user)
+        self.url = reverse('generate_itinerary_variants')
+        self.lookups = []
+        maps = mock.patch.object(maps_service, '_fetch_place_remote', side_effect=self._lookup)
+        maps.start()
+        self.addCleanup(maps.stop)
+        gemini = mock.patch.object(itinerary_service, 'GeminiService')
+        gemini.start().return_value.generate_itinerary.side_effect = self._generate
+        self.addCleanup(gemini.stop)
+
+    def _lookup(self, name, context_location, existing_place_id=None):
+        self.lookups.append(name)
+        return {'placeId': f'pid-{name}', 'lat': 11.4, 'lng': 76.7, 'address': context_location}
+
+    def _generate(self, preference_dict):
+        if preference_dict['budget'] == 'fail':
+            raise ValueError('Gemini failed')
+        return {
+            'tripName': f"Ooty on {preference_dict['budget']}", 'startPoint': 'Kochi', 'destination': 'Ooty',
+            'hotelRecommendations': [{'options': ['Lake View', f"Inn {preference_dict['budget']}"]}],
+            'itinerary': [{'day': 1, 'schedule': [{'time': '01:00 PM', 'activity': 'Lunch at Tea Valley'}]}],
+        }
+
+    def _post(self, *budgets):
+        return self.client.post(self.url, {
+            'base': {'departure': 'Kochi', 'destination': 'Ooty', 'start_date': '2030-01-10', 'end_date': '2030-01-11'},
+            'variants': [{'label': f'variant {budget}', 'budget': budget} for budget in budgets],
+        }, format='json')
+
+    def _row_counts(self):
+        return [model.objects.count() for model in (
+            UserPreference, Itinerary, ItinerarySummary, ItineraryPlace, ItineraryLocation,
+        )]
+
+    def test_failed_variant_is_reported_and_others_saved(self):
+        response = self._post('3000', 'fail', '20000')
+        self.assertEqual(response.status_code, 201)
+        body = response.json()
+        self.assertEqual([result['label'] for result in body['results']], ['variant 3000', 'variant 20000'])
+        self.assertEqual(body['errors'], [{'label': 'variant fail', 'error': 'Gemini failed'}])
+        # Two itineraries, each with two hotels and one restaurant in its index and locations
+        self.assertEqual(self._row_counts(), [2, 2, 2, 6, 6])
+        self.assertEqual([hotel['placeId'] for hotel in body['results'][1]['hotels']],
+                         ['pid-Lake View', 'pid-Inn 20000'])
+
+    def test_shared_places_are_resolved_once(self):
+        self._post('3000', '20000')
+        self.assertEqual(sorted(self.lookups), ['Inn 20000', 'Inn 3000', 'Lake View', 'tea valley'])
+
+    def test_rows_are_written_together_or_not_at_all(self):
+        write_fails = OperationalError('disk I/O error')
+        with mock.patch.object(ItineraryLocation.objects, 'bulk_create', side_effect=write_fails), \
+                self.assertLogs('django.request', 'ERROR'):
+            response = self._post('3000', '20000')
+        self.assertEqual(response.status_code, 500)
+        self.assertEqual(self._row_counts(), [0, 0, 0, 0, 0])
+
+    def test_all_variants_failing_is_a_bad_gateway(self):
+        with self.assertLogs('django.request', 'ERROR'):
+            response = self._post('fail', 'fail')
+        self.assertEqual(response.status_code, 502)
+        self.assertEqual(response.json(), {'results': [], 'errors': [
+            {'label': 'variant fail', 'error': 'Gemini failed'}, {'label': 'variant fail', 'error': 'Gemini failed'},
+        ]})
+        self.assertEqual(self._row_counts(), [0, 0, 0, 0, 0])
+
+
+class MetricsTests(APITestCase):
+    """Process metrics render as Prometheus text, requests get a Server-Timing header, and scrapes are restricted."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.staff = User.objects.create_user('ops', password='pw', is_staff=True)
+        cls.user = User.objects.create_user('member', password='pw')
+
+    def setUp(self):
+        metrics.reset()
+        self.addCleanup(metrics.reset)
+
+    def test_histogram_buckets_are_cumulative(self):
+        values = [0.05, 0.1, 0.5, 5]
+        for value in values:
+            metrics.observe('latency_seconds', value, {'stage': 'x'}, buckets=(0.1, 1))
+        histogram = metrics.snapshot()['histograms'][0]
+        # Bounds are inclusive; 5 only lands in +Inf
+        self.assertEqual(histogram['buckets'], [(0.1, 2), (1, 1)])
+        self.assertEqual(metrics.render_prometheus(metrics.snapshot()).splitlines(), [
+            '# TYPE latency_seconds histogram',
+            'latency_seconds_bucket{le="0.1",stage="x"} 2',
+            'latency_seconds_bucket{le="1",stage="x"} 3',
+            'latency_seconds_bucket{le="+Inf",stage="x"} 4',
+            f'latency_seconds_sum{{stage="x"}} {sum(values)}',
+            'latency_seconds_count{stage="x"} 4',
+        ])
+
+    def test_label_values_are_escaped(self):
+        metrics.increment('errors_total', {'error': 'say "hi"\nC:\\temp'})
+        self.assertIn('errors_total{error="say \\"hi\\"\\nC:\\\\temp"} 1',
+                      metrics.render_prometheus(metrics.snapshot()))
+
+    def test_server_timing_reports_generation_stages(self):
+        self.client.force_authenticate(self.user)
+        model = mock.Mock()
+        model.generate_content.side_effect = [mock.Mock(text='Day 1 in Ooty'), mock.Mock(text='{"tripName": "Ooty"}')]
+        with self.settings(RATE_LIMIT_ENABLED=False, GEMINI_GENERATION_STRATEGY='two_stage'), \
+                mock.patch.object(gemini_service, 'get_gemini_model', return_value=model), \
+                self.assertLogs('travelplan', 'INFO'):
+            response = self.client.post(reverse('generate_itinerary'), {
+                'departure': 'Kochi', 'destination': 'Ooty', 'start_date': '2030-01-10', 'end_date': '2030-01-10',
+            }, format='json')
+        self.assertEqual(response.status_code, 201)
+        stages = dict(part.split(';dur=') for part in response['Server-Timing'].split(', '))
+        self.assertLessEqual({'gemini_raw', 'gemini_structure', 'parse_json', 'db_write', 'total'}, set(stages))
+        self.assertGreaterEqual(float(stages['total']), float(stages['gemini_raw']))
+        self.assertEqual(metrics.get_counter('http_requests_total', {
+            'route': 'generate_itinerary', 'method': 'POST', 'status': '201',
+        }), 1)
+
+    def test_metrics_permissions(self):
+        url = reverse('metrics')
+        with self.settings(METRICS_TOKEN='scrape-me'), self.assertLogs('django.request', 'WARNING'):
+            self.client.force_authenticate(self.staff)
+            self.assertEqual(self.client.get(url).status_code, 200)
+            self.client.force_authenticate(self.user)
+            self.assertEqual(self.client.get(url).status_code, 403)
+
+            self.client.force_authenticate(None)
+            response = self.client.get(url, HTTP_AUTHORIZATION='Bearer scrape-me')
+            self.assertEqual(response.status_code, 200)
+            self.assertIn('# TYPE http_requests_total counter', response.content.decode())
+            self.assertEqual(self.client.get(url, HTTP_AUTHORIZATION='Bearer wrong').status_code, 401)
+            self.assertEqual(self.client.get(url).status_code, 401)
+
+
+class GenerationCacheTests(APITestCase):
+    """Identical preferences share a fingerprint and reuse a recent itinerary."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('cached', password='pw')
+        cls.preference = UserPreference.objects.create(
+            user=cls.user, departure='Kochi', destination='Ooty', start_date='2030-01-10', end_date='2030-01-12',
+            activities='Hiking, Boating', health_issues='',
+        )
+
+    def _preference(self, **fields):
+        values = {
+            'departure': 'Kochi', 'destination': 'Ooty', 'start_date': '2030-01-10', 'end_date': '2030-01-12',
+            'activities': 'Hiking, Boating', 'health_issues': '', **fields,
+        }
+        return UserPreference(user=self.user, **values)
+
+    def test_fingerprint_ignores_case_whitespace_and_order(self):
+        fingerprint = self.preference.fingerprint()
+        for fields in ({'destination': '  OOTY '}, {'activities': 'boating ,  hiking'},
+                       {'activities': ['Boating', 'hiking', 'HIKING']}, {'departure': 'kochi', 'health_issues': ' '}):
+            self.assertEqual(self._preference(**fields).fingerprint(), fingerprint, fields)
+        for fields in ({'destination': 'Munnar'}, {'end_date': '2030-01-13'}, {'activities': 'Hiking'},
+                       {'budget': '5000'}):
+            self.assertNotEqual(self._preference(**fields).fingerprint(), fingerprint, fields)
+
+    def test_entries_expire(self):
+        generation_cache.store_generation('a' * 64, {'tripName': 'Cached'})
+        self.assertEqual(generation_cache.lookup_generation('a' * 64), {'tripName': 'Cached'})
+        GeneratedItinerary.objects.update(expires_at=timezone.now() - timedelta(seconds=1))
+        self.assertIsNone(generation_cache.lookup_generation('a' * 64))
+
+    def test_least_recently_used_entries_are_evicted(self):
+        with self.settings(GENERATION_CACHE_MAX_ENTRIES=2):
+            generation_cache.store_generation('a' * 64, {'tripName': 'A'})
+            generation_cache.store_generation('b' * 64, {'tripName': 'B'})
+            generation_cache.lookup_generation('a' * 64)
+            generation_cache.store_generation('c' * 64, {'tripName': 'C'})
+        self.assertEqual(sorted(GeneratedItinerary.objects.values_list('fingerprint', flat=True)), ['a' * 64, 'c' * 64])
+        self.assertEqual(GeneratedItinerary.objects.get(fingerprint='a' * 64).hits, 1)
+
+    def test_hit_and_bypass(self):
+        generation_cache.store_generation(self.preference.fingerprint(), {'tripName': 'Cached'})
+        preference_dict = itinerary_service.preference_to_prompt_dict(self.preference)
+        with mock.patch.object(itinerary_service, 'GeminiService') as gemini:
+            gemini.return_value.generate_itinerary.return_value = {'tripName': 'Fresh'}
+            self.assertEqual(itinerary_service.generate_itinerary_data(self.preference, preference_dict),
+                             ({'tripName': 'Cached'}, {'cache': 'hit'}))
+            gemini.assert_not_called()
+
+            # ?cache=false generates anew and leaves the cached entry alone
+            self.assertEqual(itinerary_service.generate_itinerary_data(self.preference, preference_dict, False),
+                             ({'tripName': 'Fresh'}, {'cache': 'bypass'}))
+        self.assertEqual(generation_cache.lookup_generation(self.preference.fingerprint()), {'tripName': 'Cached'})
+
+
+class SingleFlightTests(APITestCase):
+    """Concurrent identical generations run once; followers read the leader's result from its lock."""
+
+    fingerprint = 'f' * 64
+
+    def setUp(self):
+        self.generate = mock.Mock(return_value={'tripName': 'Generated'})
+
+    def _hold_lock(self, **fields):
+        return GenerationLock.objects.create(
+            fingerprint=self.fingerprint, owner='other', expires_at=timezone.now() + timedelta(minutes=1), **fields,
+        )
+
+    def test_leader_publishes_result_without_caching_it(self):
+        self.assertEqual(single_flight(self.fingerprint, self.generate), ({'tripName': 'Generated'}, 'leader'))
+        self.assertEqual(GenerationLock.objects.get().itinerary_data, {'tripName': 'Generated'})
+        self.assertFalse(GeneratedItinerary.objects.exists())
+
+    def test_follower_reads_result_from_lock(self):
+        self._hold_lock()
+        def leader_finishes(seconds):
+            GenerationLock.objects.update(itinerary_data={'tripName': 'From leader'})
+
+        with self.settings(GENERATION_SINGLE_FLIGHT_POLL=0), \
+                mock.patch('travelplan.services.single_flight.time.sleep', leader_finishes):
+            self.assertEqual(single_flight(self.fingerprint, self.generate), ({'tripName': 'From leader'}, 'follower'))
+        self.generate.assert_not_called()
+
+    def test_result_is_not_served_to_later_requests(self):
+        self._hold_lock(itinerary_data={'tripName': 'From leader'})
+        self.assertEqual(single_flight(self.fingerprint, self.generate), ({'tripName': 'Generated'}, 'leader'))
+        self.generate.assert_called_once()
+        self.assertEqual(GenerationLock.objects.get().itinerary_data, {'tripName': 'From leader'})
+
+    def test_follower_takes_over_from_failed_leader(self):
+        self._hold_lock()
+        def leader_gives_up(seconds):
+            GenerationLock.objects.all().delete()
+
+        with self.settings(GENERATION_SINGLE_FLIGHT_POLL=0), \
+                mock.patch('travelplan.services.single_flight.time.sleep', leader_gives_up):
+            self.assertEqual(single_flight(self.fingerprint, self.generate), ({'tripName': 'Generated'}, 'leader'))
+        self.generate.assert_called_once()
+        self.assertNotEqual(GenerationLock.objects.get().owner, 'other')
+
+    def test_follower_stops_waiting(self):
+        self._hold_lock()
+        with self.settings(GENERATION_SINGLE_FLIGHT_POLL=0.01, GENERATION_SINGLE_FLIGHT_WAIT=0.05):
+            self.assertEqual(single_flight(self.fingerprint, self.generate), ({'tripName': 'Generated'}, 'leader'))
+        self.assertEqual(GenerationLock.objects.get().owner, 'other')
+
+    def test_failed_leader_releases_lock(self):
+        self.generate.side_effect = ValueError('Gemini failed')
+        with self.assertRaises(ValueError):
+            single_flight(self.fingerprint, self.generate)
+        self.assertFalse(GenerationLock.objects.exists())
+
+    def test_disabled_cache_is_not_written(self):
+        preference = UserPreference.objects.create(
+            user=User.objects.create_user('flight', password='pw'), departure='Kochi', destination='Ooty',
+        )
+        preference_dict = itinerary_service.preference_to_prompt_dict(preference)
+        with self.settings(GENERATION_CACHE_ENABLED=False), \
+                mock.patch.object(itinerary_service, 'GeminiService') as gemini:
+            gemini.return_value.generate_itinerary.return_value = {'tripName': 'Fresh'}
+            _, meta = itinerary_service.generate_itinerary_data(preference, preference_dict)
+        self.assertEqual(meta, {'cache': 'bypass', 'single_flight': 'leader'})
+        self.assertFalse(GeneratedItinerary.objects.exists())
+
+        with mock.patch.object(itinerary_service, 'GeminiService') as gemini:
+            gemini.return_value.generate_itinerary.return_value = {'tripName': 'Fresh'}
+            GenerationLock.objects.all().delete()
+            itinerary_service.generate_itinerary_data(preference, preference_dict)
+        self.assertTrue(GeneratedItinerary.objects.filter(fingerprint=preference.fingerprint()).exists())
+
+
+class StreamItineraryTests(APITestCase):
+    """The SSE endpoint streams raw chunks, the saved itinerary and each place, and coalesces identical streams."""
+
+    data = {
+        'tripName': 'Streamed', 'startPoint': 'Kochi', 'destination': 'Ooty',
+        'hotelRecommendations': [{'options': ['Lake View']}],
+        'itinerary': [{'day': 1, 'schedule': [{'time': '01:00 PM', 'activity': 'Lunch at Tea Valley'}]}],
+    }
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('streamer', password='pw')
+        cls.url = reverse('stream_itinerary')
+
+    def setUp(self):
+        self.client.force_authenticate(self.user)
+        maps = mock.patch.object(maps_service, '_fetch_place_remote', side_effect=lambda name, context, place_id: {
+            'placeId': f'pid-{name}', 'lat': 11.4, 'lng': 76.7, 'address': context,
+        })
+        maps.start()
+        self.addCleanup(maps.stop)
+        gemini = mock.patch.object(itinerary_service, 'GeminiService')
+        self.gemini = gemini.start().return_value
+        self.addCleanup(gemini.stop)
+        self.gemini.stream_raw_itinerary.return_value = ['Day 1: ', 'lunch in Ooty']
+        self.gemini.structure_itinerary.return_value = dict(self.data)
+
+    def _events(self):
+        response = self.client.post(self.url, {
+            'departure': 'Kochi', 'destination': 'Ooty', 'start_date': '2030-01-10', 'end_date': '2030-01-10',
+        }, format='json')
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        body = b''.join(response.streaming_content).decode()
+        events = []
+        for message in body.strip().split('\n\n'):
+            event, data = message.split('\n')
+            events.append((event.removeprefix('event: '), json.loads(data.removeprefix('data: '))))
+        return events
+
+    def test_event_sequence(self):
+        events = self._events()
+        self.assertEqual([event for event, _ in events], ['raw', 'raw', 'itinerary', 'hotel', 'restaurant', 'done'])
+        self.assertEqual(''.join(data['text'] for _, data in events[:2]), 'Day 1: lunch in Ooty')
+        itinerary = events[2][1]
+        self.assertEqual(itinerary['itinerary_data']['tripName'], 'Streamed')
+        self.assertEqual(itinerary['meta'], {'cache': 'miss', 'single_flight': 'leader'})
+        self.assertEqual(events[3][1], {'index': 0, 'placeId': 'pid-Lake View', 'lat': 11.4, 'lng': 76.7,
+                                        'address': 'Ooty'})
+        self.assertEqual(events[4][1]['placeId'], 'pid-tea valley')
+        self.assertEqual(events[5][1], {'id': itinerary['id']})
+        self.assertEqual(ItineraryLocation.objects.filter(itinerary_id=itinerary['id']).count(), 2)
+        self.assertEqual(GenerationLock.objects.get().itinerary_data['tripName'], 'Streamed')
+
+    def test_follower_streams_the_leaders_result(self):
+        fingerprint = UserPreference(
+            user=self.user, departure='Kochi', destination='Ooty', start_date='2030-01-10', end_date='2030-01-10',
+        ).fingerprint()
+        GenerationLock.objects.create(
+            fingerprint=fingerprint, owner='other', expires_at=timezone.now() + timedelta(minutes=1),
+        )
+
+        def leader_finishes(seconds):
+            GenerationLock.objects.update(itinerary_data={**self.data, 'tripName': 'From leader'})
+
+        with self.settings(GENERATION_SINGLE_FLIGHT_POLL=0), \
+                mock.patch('travelplan.services.single_flight.time.sleep', leader_finishes):
+            events = self._events()
+        self.assertEqual([event for event, _ in events], ['itinerary', 'hotel', 'restaurant', 'done'])
+        self.assertEqual(events[0][1]['itinerary_data']['tripName'], 'From leader')
+        self.assertEqual(events[0][1]['meta'], {'cache': 'miss', 'single_flight': 'follower'})
+        self.gemini.stream_raw_itinerary.assert_not_called()
+
+    def test_errors(self):
+        with self.assertLogs('django.request', 'WARNING'):
+            response = self.client.post(self.url, {'start_date': 'not a date'}, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('start_date', response.json())
+
+        # A failure after the stream started becomes an error event, and the lock is released
+        self.gemini.stream_raw_itinerary.return_value = ['  ']
+        self.assertEqual(self._events(), [
+            ('raw', {'text': '  '}), ('error', {'error': 'Empty response from Gemini API'}),
+        ])
+        self.assertFalse(GenerationLock.objects.exists())
+
+
+class GenerationStrategyTests(APITestCase):
+    """Each strategy makes its expected number of model calls and parses the result."""
+
+    preferences = {'startPoint': 'Kochi', 'destination': 'Ooty', 'start_date': '2030-01-10', 'end_date': '2030-01-11'}
+
+    def setUp(self):
+        patcher = mock.patch.object(gemini_service, 'get_gemini_model')
+        self.model = patcher.start().return_value
+        self.addCleanup(patcher.stop)
+
+    def _respond(self, *texts):
+        self.model.generate_content.side_effect = [mock.Mock(text=text) for text in texts]
+
+    def test_single_call(self):
+        self._respond('```json\n{"tripName": "Ooty trip", "startPoint": "Elsewhere", "itinerary": [],}\n```')
+        with self.settings(RATE_LIMIT_ENABLED=False), self.assertLogs(gemini_service.logger, 'INFO'):
+            service = gemini_service.GeminiService(gemini_service.STRATEGY_SINGLE_CALL)
+            data = service.generate_itinerary(self.preferences)
+        self.assertEqual(data, {'tripName': 'Ooty trip', 'startPoint': 'Kochi', 'itinerary': []})
+        self.model.generate_content.assert_called_once()
+        self.assertEqual(self.model.generate_content.call_args.kwargs['generation_config'],
+                         gemini_service.json_generation_config())
+
+    def test_two_stage(self):
+        self._respond('Day 1: lunch in Ooty', '{"tripName": "Ooty trip"}')
+        with self.settings(RATE_LIMIT_ENABLED=False), self.assertLogs(gemini_service.logger, 'INFO'):
+            service = gemini_service.GeminiService(gemini_service.STRATEGY_TWO_STAGE)
+            data = service.generate_itinerary(self.preferences)
+        self.assertEqual(data, {'tripName': 'Ooty trip', 'startPoint': 'Kochi'})
+        self.assertEqual(self.model.generate_content.call_count, 2)
+        self.assertIn('Day 1: lunch in Ooty', self.model.generate_content.call_args.args[0])
+
+
+class JSONRepairTests(SimpleTestCase):
+    """Model output is extracted and repaired locally before giving up."""
+
+    def test_fenced_output(self):
+        self.assertEqual(parse_json_object('```json\n{"a": 1}\n```'), {'a': 1})
+        self.assertEqual(parse_json_object('Here you go:\n```\n{"a": {"b": [1, 2]}}\n```\nEnjoy!'),
+                         {'a': {'b': [1, 2]}})
+
+    def test_trailing_commas(self):
+        self.assertEqual(parse_json_object('{"a": [1, 2,], "b": {"c": 3,},}'), {'a': [1, 2], 'b': {'c': 3}})
+
+    def test_comments_smart_quotes_and_raw_newlines(self):
+        self.assertEqual(parse_json_object('{\n  // note\n  "a": “x”, "b": "line\nbreak" /* end */}'),
+                         {'a': 'x', 'b': 'line\nbreak'})
+
+    def test_brackets_inside_comments(self):
+        self.assertEqual(parse_json_object('{"a": 1, /* not a } brace */ "b": {"c": 2} // nor { this\n}'),
+                         {'a': 1, 'b': {'c': 2}})
+        self.assertEqual(parse_json_object('{"a": /* {{ */ [1, 2]} trailing prose }'), {'a': [1, 2]})
+
+    def test_truncated_arrays_and_objects(self):
+        self.assertEqual(parse_json_object('{"days": [{"day": 1}, {"day": 2'), {'days': [{'day': 1}, {'day': 2}]})
+        self.assertEqual(parse_json_object('{"a": 1, "c": {"d": "cut off'), {'a': 1, 'c': {'d': 'cut off'}})
+        # A partial trailing element is dropped
+        with self.assertLogs('travelplan.services.json_repair', 'WARNING'):
+            self.assertEqual(parse_json_object('{"a": [1, 2], "b": {"x": 1, "y":'), {'a': [1, 2], 'b': {'x': 1}})
+
+    def test_unrepairable_input_raises(self):
+        for text in ('', '   ', 'No JSON here', '{"a": tru e}'):
+            with self.assertRaises(JSONExtractionError, msg=text):
+                parse_json_object(text)
+
+
+class RateLimitTests(APITestCase):
+    """Shared token buckets, with a per-user share and an in-process prefetch."""
+
+    def setUp(self):
+        clear_prefetched()
+        self.addCleanup(clear_prefetched)
+
+    def _limits(self, rate, burst, **overrides):
+        return self.settings(**{
+            'RATE_LIMIT_ENABLED': True, 'RATE_LIMIT_OVERRIDES': {'maps:find_place': [rate, burst]},
+            'RATE_LIMIT_PREFETCH_SECONDS': 0, 'RATE_LIMIT_USER_SHARE': 1, **overrides,
+        })
+
+    def _tokens(self, key):
+        return RateLimitBucket.objects.get(key=key).tokens
+
+    def test_bucket_refills(self):
+        with self._limits(1, 2):
+            acquire('maps', 'find_place')
+            acquire('maps', 'find_place')
+            with self.assertRaises(RateLimitExceeded):
+                acquire('maps', 'find_place', max_wait=0)
+            RateLimitBucket.objects.update(refilled_at=F('refilled_at') - 1)
+            acquire('maps', 'find_place', max_wait=0)
+        self.assertLess(self._tokens('maps:find_place'), 0.1)
+
+    def test_user_share_and_shared_bucket_are_taken_together(self):
+        with self._limits(0.01, 4, RATE_LIMIT_USER_SHARE=0.5):
+            with rate_limit_user(1):
+                acquire('maps', 'find_place')
+                acquire('maps', 'find_place')
+                # The user's half of the burst is spent; the shared bucket keeps the rest for others
+                with self.assertRaises(RateLimitExceeded):
+                    acquire('maps', 'find_place', max_wait=0)
+            self.assertAlmostEqual(self._tokens('maps:find_place'), 2, delta=0.01)
+
+            with rate_limit_user(2):
+                acquire('maps', 'find_place')
+                acquire('maps', 'find_place')
+            with rate_limit_user(3), self.assertRaises(RateLimitExceeded):
+                acquire('maps', 'find_place', max_wait=0)
+        # Giving up on the empty shared bucket costs the user nothing
+        self.assertEqual(self._tokens('maps:find_place:user:3'), 2)
+
+    def test_waits_up_to_the_maximum(self):
+        with self._limits(20, 1, RATE_LIMIT_MAX_WAIT=1):
+            acquire('maps', 'find_place')
+            started = time.monotonic()
+            acquire('maps', 'find_place')
+            self.assertGreaterEqual(time.monotonic() - started, 0.02)
+
+        RateLimitBucket.objects.all().delete()
+        with self._limits(0.1, 1, RATE_LIMIT_MAX_WAIT=0.5):
+            acquire('maps', 'find_place')
+            started = time.monotonic()
+            with self.assertRaises(RateLimitExceeded) as raised:
+                acquire('maps', 'find_place')
+            # A wait that cannot fit the deadline fails at once
+            self.assertLess(time.monotonic() - started, 0.5)
+            self.assertGreater(raised.exception.retry_after, 9)
+
+    def test_prefetched_tokens_skip_the_database(self):
+        with self._limits(50, 50, RATE_LIMIT_PREFETCH_SECONDS=0.1):
+            acquire('maps', 'find_place')
+            with self.assertNumQueries(0):
+                for _ in range(4):
+                    acquire('maps', 'find_place')
+            self.assertAlmostEqual(self._tokens('maps:find_place'), 45, delta=0.1)
+            acquire('maps', 'find_place')
+        self.assertAlmostEqual(self._tokens('maps:find_place'), 40, delta=0.5)
+
+
+class ResilientCallerThrottleTests(SimpleTestCase):
+    """Our own rate limiter runs before each attempt and is invisible to the circuit breaker."""
+
+    def _caller(self, breaker, timeout=5):
+        return ResilientCaller(
+            'test', timeout=timeout, max_retries=2, base_delay=0, max_delay=0, hedge_enabled=False,
+            hedge_percentile=95, hedge_min_samples=20, breaker=breaker, executor_workers=2,
+        )
+
+    def test_local_throttle_leaves_breaker_alone(self):
+        throttled = mock.Mock(side_effect=RateLimitExceeded('gemini:generate_content', 1.0))
+        upstream = mock.Mock(return_value='response')
+
+        breaker = CircuitBreaker('test', failure_threshold=3, reset_timeout=60)
+        breaker.record_failure()
+        with self.assertRaises(RateLimitExceeded):
+            self._caller(breaker).call(upstream, throttled)
+        upstream.assert_not_called()
+        self.assertEqual((breaker.state, breaker.failures), (STATE_CLOSED, 1))
+
+        # A half-open breaker stays half-open and keeps its probe for a real call
+        breaker = CircuitBreaker('test', failure_threshold=1, reset_timeout=0)
+        breaker.record_failure()
+        with self.assertRaises(RateLimitExceeded):
+            self._caller(breaker).call(upstream, throttled)
+        self.assertEqual(breaker.state, STATE_HALF_OPEN)
+        self.assertEqual(self._caller(breaker).call(upstream, mock.Mock()), 'response')
+        self.assertEqual(breaker.state, STATE_CLOSED)
+
+    def test_token_wait_is_outside_the_attempt_deadline(self):
+        breaker = CircuitBreaker('test', failure_threshold=3, reset_timeout=60)
+        caller = self._caller(breaker, timeout=0.05)
+        self.assertEqual(caller.call(lambda: 'response', lambda: time.sleep(0.1)), 'response')
+        self.assertLess(caller.latency.percentile(50, 1), 0.05)
+
+
+class CassetteTests(SimpleTestCase):
+    """Recorded Gemini and Maps exchanges replay without a network client; unrecorded requests fail loudly."""
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = directory.name
+        self.store = cassette.CassetteStore(self.directory)
+
+    def test_gemini_round_trip(self):
+        model = mock.Mock()
+        model.generate_content.side_effect = [
+            mock.Mock(text='Day 1 in Ooty'), [mock.Mock(text='Day 1 '), mock.Mock(text='in Ooty')],
+        ]
+        recorder = cassette.CassetteGeminiModel(model, 'gemini-test', self.store, cassette.MODE_RECORD)
+        self.assertEqual(recorder.generate_content('Plan  a trip\n to Ooty').text, 'Day 1 in Ooty')
+        self.assertEqual([chunk.text for chunk in recorder.generate_content('Stream it', stream=True)],
+                         ['Day 1 ', 'in Ooty'])
+
+        with self.settings(CASSETTE_MODE=cassette.MODE_REPLAY, CASSETTE_DIR=self.directory):
+            build = mock.Mock()
+            player = cassette.gemini_transport('gemini-test', build)
+        build.assert_not_called()
+        player.time_scale = 0
+        # Prompts match after whitespace is collapsed
+        self.assertEqual(player.generate_content('Plan a trip to Ooty').text, 'Day 1 in Ooty')
+        self.assertEqual([chunk.text for chunk in player.generate_content('Stream it', stream=True)],
+                         ['Day 1 ', 'in Ooty'])
+        with self.assertRaises(cassette.CassetteMiss), self.assertLogs(cassette.logger, 'WARNING'):
+            player.generate_content('Plan a trip to Munnar')
+        self.assertEqual(model.generate_content.call_count, 2)
+
+    def test_maps_round_trip(self):
+        client = mock.Mock()
+        client.find_place.return_value = {'candidates': [{'place_id': 'pid-1'}]}
+        client.place.side_effect = ApiError('INVALID_REQUEST', 'Bad place ID')
+        recorder = cassette.CassetteMapsClient(client, self.store, cassette.MODE_RECORD)
+        recorder.find_place(input='Lake View, Ooty', input_type='textquery')
+        with self.assertRaises(ApiError):
+            recorder.place(place_id='bogus')
+
+        player = cassette.CassetteMapsClient(None, self.store, cassette.MODE_REPLAY, time_scale=0)
+        self.assertEqual(player.find_place(input='Lake  View, Ooty', input_type='textquery'),
+                         {'candidates': [{'place_id': 'pid-1'}]})
+        with self.assertRaises(ApiError) as raised:
+            player.place(place_id='bogus')
+        self.assertEqual(raised.exception.status, 'INVALID_REQUEST')
+        with self.assertRaises(cassette.CassetteMiss), self.assertLogs(cassette.logger, 'WARNING'):
+            player.geocode('Ooty')
+        self.assertEqual(player.call_counts(), {'find_place': 1, 'place': 1, 'geocode': 1})
+
+
+class GenerationLoggingTests(APITestCase):
+    """Payload summaries are only computed when they will be logged."""
+
+    @classmethod
+    def setUpTestData(cls):
+        user = User.objects.create_user('logged', password='pw')
+        cls.preference = UserPreference.objects.create(user=user, departure='Kochi', destination='Ooty')
+
+    def test_payload_fields_skipped_when_info_disabled(self):
+        data = {'tripName': 'Logged', 'startPoint': 'Kochi'}
+        with mock.patch.object(itinerary_service, 'generate_itinerary_data', return_value=(data, {})), \
+                mock.patch.object(itinerary_service, 'resolve_and_save_locations', return_value=([], [])), \
+                mock.patch.object(itinerary_service, 'payload_fields', return_value={}) as payload_fields, \
+                mock.patch.object(itinerary_service.logger, 'isEnabledFor', return_value=False):
+            itinerary_service.run_generation(self.preference)
+        payload_fields.assert_not_called()
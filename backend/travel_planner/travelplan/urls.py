@@ -1,8 +1,21 @@
 from django.urls import path
-from .views import GenerateItineraryView, UserItinerariesView
+from .views import (
+    GenerateItineraryView, GenerateItineraryVariantsView, StreamItineraryView, UserItinerariesView,
+    ItinerarySummariesView, ItineraryDashboardView, PlaceItinerariesView, TopPlacesView, ItineraryJobView, MetricsView,
+)
+from .async_views import AsyncGenerateItineraryView, AsyncUserItinerariesView
 
 urlpatterns = [
     path('generate-itinerary/', GenerateItineraryView.as_view(), name='generate_itinerary'),
+    path('generate-itinerary/variants/', GenerateItineraryVariantsView.as_view(), name='generate_itinerary_variants'),
+    path('generate-itinerary/stream/', StreamItineraryView.as_view(), name='stream_itinerary'),
     path('user-itineraries/', UserItinerariesView.as_view(), name='user_itineraries'),
+    path('itinerary-summaries/', ItinerarySummariesView.as_view(), name='itinerary_summaries'),
+    path('itinerary-summaries/dashboard/', ItineraryDashboardView.as_view(), name='itinerary_dashboard'),
+    path('places/itineraries/', PlaceItinerariesView.as_view(), name='place_itineraries'),
+    path('places/top/', TopPlacesView.as_view(), name='top_places'),
+    path('jobs/<int:job_id>/', ItineraryJobView.as_view(), name='itinerary_job'),
+    path('metrics/', MetricsView.as_view(), name='metrics'),
+    path('async/generate-itinerary/', AsyncGenerateItineraryView.as_view(), name='async_generate_itinerary'),
+    path('async/user-itineraries/', AsyncUserItinerariesView.as_view(), name='async_user_itineraries'),
 ]
-
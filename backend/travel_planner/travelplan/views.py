@@ -1,113 +1,37 @@
 # views.py
+import hmac
+import json
+import logging
+from django.http import StreamingHttpResponse
 from rest_framework.views import APIView
 from rest_framework.response import Response
+from rest_framework.renderers import BaseRenderer, JSONRenderer
 from rest_framework import status
-from rest_framework.permissions import IsAuthenticated
-from .models import UserPreference, Itinerary
-from .serializers import UserPreferenceSerializer, ItinerarySerializer
-from .services.gemini_service import GeminiService
-import googlemaps
-from googlemaps.exceptions import ApiError, TransportError
+from rest_framework.permissions import BasePermission, IsAuthenticated
+from .models import UserPreference, ItineraryJob, ItineraryLocation, ItinerarySummary
+from .serializers import UserPreferenceSerializer, ItinerarySerializer, ItineraryVariantsSerializer
+from .pagination import (
+    InvalidPageRequest, paginate_itineraries, paginate_places, paginate_summaries, parse_fields, parse_page_size,
+    parse_summary_filters,
+)
 from django.conf import settings
+from django.urls import reverse
+from django.utils import timezone
+from .services.itinerary_service import (
+    run_generation, run_variant_generation, stream_generation, detail_response_data, user_itineraries,
+)
+from .services.database import retry_on_lock
+from .services.job_queue import enqueue_job
+from .services.location_service import load_itinerary_locations
+from .services.place_index import KINDS, find_places, top_places
+from .services.summary_service import summary_dashboard
+from .services import metrics
 
-# Initialize Google Maps client
-gmaps = googlemaps.Client(key=settings.GOOGLE_MAPS_API_KEY)
-
-def fetch_place_id(name, context_location, existing_place_id=None):
-    """Convert a name and context location to a Google Maps Place ID with lat/lng."""
-    if not name or name.lower() in ["none", "relax", "drive", "journey"]:
-        return {'placeId': 'ID not available', 'lat': None, 'lng': None, 'address': 'Not applicable'}
-
-    try:
-        geocode = gmaps.geocode(context_location)
-        if not geocode:
-            print(f"Failed to geocode context location: {context_location}")
-            return {'placeId': 'ID not available', 'lat': None, 'lng': None, 'address': 'Context not geocoded'}
-        coords = (geocode[0]['geometry']['location']['lat'], geocode[0]['geometry']['location']['lng'])
-
-        if existing_place_id and existing_place_id != "ID not available":
-            try:
-                place_details = gmaps.place(place_id=existing_place_id, fields=['place_id', 'geometry', 'formatted_address'])
-                geometry = place_details['result']['geometry']['location']
-                return {
-                    'placeId': existing_place_id,
-                    'lat': geometry['lat'],
-                    'lng': geometry['lng'],
-                    'address': place_details['result'].get('formatted_address', 'Address not available')
-                }
-            except ApiError:
-                print(f"Existing Place ID {existing_place_id} for {name} is invalid, searching anew")
-
-        query = f"{name}, {context_location}"
-        place_search = gmaps.find_place(
-            input=query,
-            input_type="textquery",
-            location_bias=f"circle:15000@{coords[0]},{coords[1]}"
-        )
-        if place_search['candidates']:
-            place_id = place_search['candidates'][0]['place_id']
-            place_details = gmaps.place(place_id=place_id, fields=['place_id', 'geometry', 'formatted_address'])
-            geometry = place_details['result']['geometry']['location']
-            return {
-                'placeId': place_id,
-                'lat': geometry['lat'],
-                'lng': geometry['lng'],
-                'address': place_details['result'].get('formatted_address', 'Address not available')
-            }
-
-        places = gmaps.places_nearby(location=coords, radius=15000, keyword=name)
-        if places['results']:
-            place = places['results'][0]
-            return {
-                'placeId': place['place_id'],
-                'lat': place['geometry']['location']['lat'],
-                'lng': place['geometry']['location']['lng'],
-                'address': place.get('vicinity', 'Address not available')
-            }
-        return {'placeId': 'ID not available', 'lat': None, 'lng': None, 'address': 'Not found'}
-    except ApiError as e:
-        print(f"API Error for {name} in {context_location}: {e}")
-        return {'placeId': f'Error: {str(e)}', 'lat': None, 'lng': None, 'address': 'Error'}
-    except TransportError as e:
-        print(f"Network Error for {name} in {context_location}: {e}")
-        return {'placeId': f'Error: {str(e)}', 'lat': None, 'lng': None, 'address': 'Error'}
-    except Exception as e:
-        print(f"Unexpected Error for {name} in {context_location}: {e}")
-        return {'placeId': f'Error: {str(e)}', 'lat': None, 'lng': None, 'address': 'Error'}
-
-def extract_hotels_and_restaurants(itinerary_data):
-    """Extract hotel and restaurant names with context and existing Place IDs."""
-    hotels = []
-    restaurants = []
-
-    destination = itinerary_data.get('destination', itinerary_data.get('startPoint', 'Unknown Location'))
-    start_point = itinerary_data.get('startPoint', '').lower()
-
-    for hotel in itinerary_data.get('hotelRecommendations', []):
-        for option in hotel.get('options', []):
-            if option.lower() != "none":
-                place_id = hotel.get('placeId', 'ID not available')
-                hotels.append({'name': option, 'placeId': place_id, 'context': destination})
-
-    for day in itinerary_data.get('itinerary', []):
-        for schedule in day.get('schedule', []):
-            activity = schedule.get('activity', '').lower()
-            if any(keyword in activity for keyword in ['lunch at', 'dinner at', 'breakfast at']):
-                name = activity.split('at')[-1].strip()
-                place_id = schedule.get('placeId', 'ID not available')
-                context = destination
-                if 'coimbatore' in activity or 'coimbatore bypass' in activity:
-                    context = 'Coimbatore, Tamil Nadu, India'
-                elif 'palakkad' in activity or start_point in activity:
-                    context = 'Palakkad, Kerala, India'
-                if ' or ' in name:
-                    names = [n.strip() for n in name.split(' or ')]
-                    restaurants.extend({'name': n, 'placeId': place_id, 'context': context} for n in names)
-                else:
-                    restaurants.append({'name': name, 'placeId': place_id, 'context': context})
-
-    return hotels, restaurants
+logger = logging.getLogger(__name__)
 
+def use_generation_cache(request):
+    """Clients can pass ?cache=false to force a fresh generation."""
+    return request.query_params.get('cache', 'true').lower() != 'false'
 
 class GenerateItineraryView(APIView):
     permission_classes = [IsAuthenticated]
@@ -115,50 +39,91 @@ class GenerateItineraryView(APIView):
     def post(self, request):
         serializer = UserPreferenceSerializer(data=request.data)
         if serializer.is_valid():
-            preference = serializer.save(user=request.user)
+            preference = retry_on_lock(serializer.save)(user=request.user)
+            if request.query_params.get('background', 'false').lower() == 'true':
+                job = enqueue_job(request.user, preference)
+                return Response({
+                    'job_id': job.id,
+                    'status': job.status,
+                    'status_url': reverse('itinerary_job', args=[job.id]),
+                }, status=status.HTTP_202_ACCEPTED)
             try:
-                gemini_service = GeminiService()
-                preference_dict = preference.to_dict()
-                preference_dict['startPoint'] = preference_dict.pop('departure')
-                print(f"Input preference_dict: {preference_dict}")
-
-                itinerary_data = gemini_service.generate_itinerary(preference_dict)
-                print(f"Raw itinerary_data from Gemini: {itinerary_data}")
-                
-                # Force startPoint
-                if 'startPoint' not in itinerary_data or itinerary_data['startPoint'] != preference_dict['startPoint']:
-                    print(f"Forcing startPoint to {preference_dict['startPoint']} (was {itinerary_data.get('startPoint', 'not set')})")
-                    itinerary_data['startPoint'] = preference_dict['startPoint']
-
-                itinerary = Itinerary.objects.create(
-                    user=request.user,
-                    preference=preference,
-                    itinerary_data=itinerary_data
-                )
-                hotels, restaurants = extract_hotels_and_restaurants(itinerary_data)
-                hotel_locations = [fetch_place_id(h['name'], h['context'], h['placeId']) for h in hotels]
-                restaurant_locations = [fetch_place_id(r['name'], r['context'], r['placeId']) for r in restaurants]
-                
-                # Construct response with enforced startPoint
-                response_data = {
-                    'id': itinerary.id,
-                    'user': itinerary.user.id,
-                    'preference': itinerary.preference.id,
-                    'itinerary_data': {
-                        **itinerary_data,  # Spread existing data
-                        'startPoint': preference_dict['startPoint']  # Force again here
-                    },
-                    'hotels': hotel_locations,
-                    'restaurants': restaurant_locations,
-                    'created_at': itinerary.created_at.isoformat()
-                }
-                print(f"Final response_data: {response_data}")
+                itinerary, response_data = run_generation(preference, use_cache=use_generation_cache(request))
+                logger.info("Itinerary created", extra={
+                    'itinerary_id': itinerary.id, 'user_id': request.user.id, 'meta': response_data['meta'],
+                })
                 return Response(response_data, status=status.HTTP_201_CREATED)
             except Exception as e:
                 return Response({"error": str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
+class GenerateItineraryVariantsView(APIView):
+    """Generate several variants (e.g. budget / balanced / luxury) of one trip at once
+
+    Returns 201 with the saved variants and a per-variant ``errors`` list for those that failed.
+    Input is validated up front, so when every variant fails the failures are upstream (Gemini)
+    errors and the response is 502 with the same ``errors`` list.
+    """
+    permission_classes = [IsAuthenticated]
+
+    def post(self, request):
+        serializer = ItineraryVariantsSerializer(data=request.data)
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+        labels = [label for label, _ in serializer.validated_data['variants']]
+        preferences = [UserPreference(user=request.user, **data) for _, data in serializer.validated_data['variants']]
+        try:
+            results, errors = run_variant_generation(
+                request.user, preferences, labels, use_cache=use_generation_cache(request)
+            )
+        except Exception as e:
+            return Response({"error": str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+        if not results:
+            return Response({'results': [], 'errors': errors}, status=status.HTTP_502_BAD_GATEWAY)
+        return Response({'results': results, 'errors': errors}, status=status.HTTP_201_CREATED)
+
+def format_sse(event, data):
+    """Encode one Server-Sent Events message."""
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+class EventStreamRenderer(BaseRenderer):
+    """Lets clients send Accept: text/event-stream; plain responses become an error event."""
+    media_type = 'text/event-stream'
+    format = 'sse'
+    charset = 'utf-8'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        return format_sse('error', data).encode(self.charset)
+
+class StreamItineraryView(APIView):
+    permission_classes = [IsAuthenticated]
+    renderer_classes = [JSONRenderer, EventStreamRenderer]
+
+    def post(self, request):
+        serializer = UserPreferenceSerializer(data=request.data)
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+        preference = retry_on_lock(serializer.save)(user=request.user)
+
+        def event_stream():
+            try:
+                for event, data in stream_generation(preference, use_cache=use_generation_cache(request)):
+                    yield format_sse(event, data)
+            except Exception as e:
+                yield format_sse('error', {'error': str(e)})
+
+        response = StreamingHttpResponse(event_stream(), content_type='text/event-stream')
+        response['Cache-Control'] = 'no-cache'
+        response['X-Accel-Buffering'] = 'no'  # Stop nginx from buffering the stream
+        return response
+
 class UserItinerariesView(APIView):
+    """List, latest and by-id reads of the user's itineraries.
+
+    Each path is a single indexed query on (user, -created_at, -id), plus one
+    for the materialized locations with detail=true; the "no itineraries"
+    check only costs a query when the lookup already came back empty.
+    """
     permission_classes = [IsAuthenticated]
     
     def get(self, request):
@@ -166,39 +131,166 @@ class UserItinerariesView(APIView):
         latest = request.query_params.get('latest', 'false').lower() == 'true'
         detail = request.query_params.get('detail', 'false').lower() == 'true'
 
-        itineraries = Itinerary.objects.filter(user=request.user).order_by('-created_at')
-
-        if not itineraries.exists():
-            return Response({'error': 'No itineraries found'}, status=status.HTTP_404_NOT_FOUND)
+        itineraries = user_itineraries(request.user.id)
 
         if itinerary_id:
             try:
-                itinerary = itineraries.get(id=itinerary_id)
-                if detail:
-                    hotels, restaurants = extract_hotels_and_restaurants(itinerary.itinerary_data)
-                    hotel_locations = [fetch_place_id(h['name'], h['context'], h['placeId']) for h in hotels]
-                    restaurant_locations = [fetch_place_id(r['name'], r['context'], r['placeId']) for r in restaurants]
-                    response_data = {
-                        'itinerary': itinerary.itinerary_data,
-                        'hotels': hotel_locations,
-                        'restaurants': restaurant_locations
-                    }
-                else:
-                    response_data = ItinerarySerializer(itinerary).data
-                return Response(response_data)
-            except Itinerary.DoesNotExist:
-                return Response({'error': 'Itinerary not found'}, status=status.HTTP_404_NOT_FOUND)
+                itinerary = itineraries.filter(id=itinerary_id).first()
+            except ValueError:
+                itinerary = None
+            if itinerary is None:
+                message = 'Itinerary not found' if itineraries.exists() else 'No itineraries found'
+                return Response({'error': message}, status=status.HTTP_404_NOT_FOUND)
+            if detail:
+                hotel_locations, restaurant_locations = load_itinerary_locations(itinerary)
+                response_data = detail_response_data(itinerary, hotel_locations, restaurant_locations)
+            else:
+                response_data = ItinerarySerializer(itinerary).data
+            return Response(response_data)
         elif latest and detail:
             itinerary = itineraries.first()
-            hotels, restaurants = extract_hotels_and_restaurants(itinerary.itinerary_data)
-            hotel_locations = [fetch_place_id(h['name'], h['context'], h['placeId']) for h in hotels]
-            restaurant_locations = [fetch_place_id(r['name'], r['context'], r['placeId']) for r in restaurants]
-            response_data = {
-                'itinerary': itinerary.itinerary_data,
-                'hotels': hotel_locations,
-                'restaurants': restaurant_locations
-            }
+            if itinerary is None:
+                return Response({'error': 'No itineraries found'}, status=status.HTTP_404_NOT_FOUND)
+            hotel_locations, restaurant_locations = load_itinerary_locations(itinerary)
+            response_data = detail_response_data(itinerary, hotel_locations, restaurant_locations)
             return Response(response_data)
         else:
-            serializer = ItinerarySerializer(itineraries, many=True)
-            return Response(serializer.data)
\ No newline at end of file
+            cursor = request.query_params.get('cursor')
+            try:
+                page = paginate_itineraries(
+                    itineraries,
+                    cursor=cursor,
+                    page_size=parse_page_size(request.query_params.get('page_size')),
+                    fields=parse_fields(request.query_params.get('fields')),
+                )
+            except InvalidPageRequest as e:
+                return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+            if not page['results'] and not cursor:
+                return Response({'error': 'No itineraries found'}, status=status.HTTP_404_NOT_FOUND)
+            return Response(page)
+
+class ItinerarySummariesView(APIView):
+    """Trip cards from the ItinerarySummary table, filterable and sortable without decoding itinerary JSON
+
+    Query params: destination, start_from / start_to (YYYY-MM-DD), budget_min / budget_max,
+    ordering (created_at, start_date or budget, '-' for descending), cursor and page_size.
+    """
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request):
+        params = request.query_params
+        try:
+            summaries = ItinerarySummary.objects.filter(user_id=request.user.id, **parse_summary_filters(params))
+            page = paginate_summaries(
+                summaries,
+                ordering=params.get('ordering'),
+                cursor=params.get('cursor'),
+                page_size=parse_page_size(params.get('page_size')),
+            )
+        except InvalidPageRequest as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        return Response(page)
+
+class ItineraryDashboardView(APIView):
+    """Trip totals, upcoming trips and top destinations for the user's dashboard"""
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request):
+        return Response(summary_dashboard(request.user.id, timezone.localdate()))
+
+class PlaceItinerariesView(APIView):
+    """Itineraries that include a hotel or restaurant, read from the ItineraryPlace index
+
+    Query params: name and/or place_id, kind (hotel or restaurant), cursor and page_size.
+    Staff can pass all=true to search every user's itineraries.
+    """
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request):
+        params = request.query_params
+        if not params.get('name') and not params.get('place_id'):
+            return Response({'error': 'name or place_id is required'}, status=status.HTTP_400_BAD_REQUEST)
+        if params.get('kind') and params['kind'] not in KINDS:
+            return Response({'error': f"Unknown kind: {params['kind']}"}, status=status.HTTP_400_BAD_REQUEST)
+        everyone = request.user.is_staff and params.get('all', 'false').lower() == 'true'
+        places = find_places(
+            user_id=None if everyone else request.user.id,
+            name=params.get('name'),
+            kind=params.get('kind'),
+            place_id=params.get('place_id'),
+        )
+        try:
+            page = paginate_places(places, cursor=params.get('cursor'), page_size=parse_page_size(params.get('page_size')))
+        except InvalidPageRequest as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        return Response(page)
+
+class TopPlacesView(APIView):
+    """Hotels or restaurants recommended by the most itineraries (of every user) for a destination
+
+    Query params: destination, kind (hotel by default) and limit.
+    """
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request):
+        params = request.query_params
+        destination = params.get('destination', '').strip()
+        kind = params.get('kind') or ItineraryLocation.KIND_HOTEL
+        if not destination:
+            return Response({'error': 'destination is required'}, status=status.HTTP_400_BAD_REQUEST)
+        if kind not in KINDS:
+            return Response({'error': f"Unknown kind: {kind}"}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            limit = parse_page_size(params.get('limit'))
+        except InvalidPageRequest:
+            return Response({'error': 'Invalid limit'}, status=status.HTTP_400_BAD_REQUEST)
+        return Response({'destination': destination, 'kind': kind, 'results': top_places(destination, kind, limit)})
+
+class ItineraryJobView(APIView):
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request, job_id):
+        try:
+            job = ItineraryJob.objects.get(id=job_id, user=request.user)
+        except ItineraryJob.DoesNotExist:
+            return Response({'error': 'Job not found'}, status=status.HTTP_404_NOT_FOUND)
+        return Response(job.to_dict())
+
+class PrometheusRenderer(BaseRenderer):
+    """Render a metrics snapshot in the Prometheus text exposition format"""
+    media_type = 'text/plain'
+    format = 'prometheus'
+    charset = 'utf-8'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if 'counters' not in data:
+            return json.dumps(data).encode(self.charset)  # Authentication/permission errors
+        return metrics.render_prometheus(data).encode(self.charset)
+
+def has_metrics_token(request):
+    """Whether the request presents settings.METRICS_TOKEN as a bearer token."""
+    token = settings.METRICS_TOKEN
+    return bool(token) and hmac.compare_digest(request.META.get('HTTP_AUTHORIZATION', ''), f"Bearer {token}")
+
+class CanReadMetrics(BasePermission):
+    """Admins, or scrapers presenting the metrics token"""
+
+    def has_permission(self, request, view):
+        return bool(request.user and request.user.is_staff) or has_metrics_token(request)
+
+class MetricsView(APIView):
+    """Process metrics: stage latency histograms, upstream calls, cache hit ratios and errors.
+
+    Prometheus text by default; ?format=json returns the same snapshot as JSON.
+    """
+    permission_classes = [CanReadMetrics]
+    renderer_classes = [PrometheusRenderer, JSONRenderer]
+
+    def get_authenticators(self):
+        # A metrics token is not a JWT; let it through to the permission check
+        if has_metrics_token(self.request):
+            return []
+        return super().get_authenticators()
+
+    def get(self, request):
+        return Response(metrics.snapshot())